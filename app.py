@@ -1,26 +1,192 @@
 # app.py
-from flask import Flask, request, jsonify, render_template_string
+from flask import Flask, Response, g, request, jsonify, render_template_string, stream_with_context
 from workflow import process_message_node
-import asyncio
-from concurrent.futures import ThreadPoolExecutor
+import itertools
+import json
 import os
+import threading
+import time
 from dotenv import load_dotenv
 import sys
 sys.path.append(os.path.dirname(os.path.abspath(__file__)))
-from marketing_helper import create_marketing_message, create_ab_test_variations, generate_marketing_text_groq  # Already imported
+import marketing_helper
+import w_crew
+from marketing_helper import (  # Already imported
+    acreate_marketing_bundle, agenerate_marketing_text_groq, aiter_marketing_bundle, astream_marketing_text_groq
+)
+from llm_cache import get_response_cache
+from runtime import runtime
+from campaigns import CampaignError, get_campaign_runner, parse_rows
+from conversations import build_prompt, get_conversation_store
+from variation_pool import get_variation_pool
+import voice
+import whatsapp
+import youtube
+import rate_limit
+import router
+import scheduler
+import singleflight
+import tracing
 
 # Load environment variables
 load_dotenv()
 
 app = Flask(__name__)
-executor = ThreadPoolExecutor(max_workers=5)
+# All LLM calls run on one long-lived event loop (see runtime.py); concurrency
+# is bounded by the per-provider limiters in rate_limit.py, not by thread count.
+
+# Seconds /generate_marketing waits for LLM results before using fallback templates
+MARKETING_DEADLINE_SECONDS = float(os.getenv("MARKETING_DEADLINE_SECONDS", "10"))
+
+# Heavy resources load lazily on first use; WARMUP_ON_START=1 loads them in
+# the background right after start-up and /readyz reports when that is done.
+WARMUP_ON_START = os.getenv("WARMUP_ON_START", "0") == "1"
+warmup_state = {"done": not WARMUP_ON_START, "loaded": [], "errors": {}, "seconds": None}
+
+WARMUP_STEPS = [
+    ("whatsapp_crew", w_crew.get_whatsapp_crew),
+    ("hf_client", w_crew.get_client),
+    ("local_generator", lambda: marketing_helper.get_local_batcher().start()),
+]
+if marketing_helper.GROQ_API_KEY:
+    WARMUP_STEPS.insert(0, ("groq_client", marketing_helper.get_groq_client))
+
+def warm_up():
+    """Load the lazily created models and clients ahead of the first request"""
+    start = time.perf_counter()
+    for name, load in WARMUP_STEPS:
+        try:
+            load()
+            warmup_state["loaded"].append(name)
+        except Exception as e:
+            print(f"Warm-up of {name} failed: {e}")
+            warmup_state["errors"][name] = str(e)
+    warmup_state["seconds"] = round(time.perf_counter() - start, 3)
+    warmup_state["done"] = True
+
+def start_warm_up():
+    threading.Thread(target=warm_up, name="warm-up", daemon=True).start()
+
+# Under gunicorn the app is imported in the master before it forks; a thread
+# started there would not survive the fork, so gunicorn.conf.py starts the
+# warm-up in each worker instead
+if WARMUP_ON_START and "gunicorn" not in sys.modules:
+    start_warm_up()
+
+# Every request runs in a trace (see tracing.py); the id is returned in
+# X-Trace-Id and the spans can be fetched from /debug/traces/<trace_id>.
+@app.before_request
+def start_request_trace():
+    g.trace, g.trace_token = tracing.start_trace(f"{request.method} {request.path}")
+
+@app.after_request
+def finish_request_trace(response):
+    trace = g.get('trace')
+    if trace is not None:
+        trace.root.finish()
+        duration = trace.root.duration
+        route = request.url_rule.rule if request.url_rule else 'unmatched'
+        trace.root.set(route=route, status=response.status_code)
+        tracing.HTTP_SECONDS.observe(duration, route, request.method, str(response.status_code))
+        response.headers['X-Trace-Id'] = trace.trace_id
+        response.headers['Server-Timing'] = f"app;dur={duration * 1000:.1f}"
+    return response
+
+@app.teardown_request
+def reset_request_trace(exc):
+    # Streaming responses tear down after the body is sent, so late spans still attach
+    tracing.end_trace(g.pop('trace_token', None))
+
+# Scheduling class of the LLM calls each endpoint makes (see scheduler.py);
+# endpoints not listed make none and are never shed
+ROUTE_PRIORITIES = {
+    'process_message': 'interactive',
+    'generate_marketing': 'marketing',
+    'generate_voice_audio': 'marketing',
+    'campaigns_batch': 'bulk',
+}
+
+@app.before_request
+def schedule_request():
+    priority = ROUTE_PRIORITIES.get(request.endpoint)
+    if priority is None:
+        return None
+    # X-Request-Timeout: seconds the client will wait, so work still queued after that is dropped
+    timeout = request.headers.get('X-Request-Timeout', type=float)
+    g.schedule_token = scheduler.classify(priority, request.headers.get('X-Tenant-Id'), timeout)
+    try:
+        scheduler.admit(priority)
+    except scheduler.Overloaded as e:
+        return (jsonify({'status': 'error', 'message': str(e)}), 503,
+                {'Retry-After': str(e.retry_after)})
+    return None
+
+@app.teardown_request
+def reset_request_schedule(exc):
+    scheduler.reset(g.pop('schedule_token', None))
+
+def _cache_metrics():
+    cache = get_response_cache()
+    if cache is None:
+        return []
+    info = cache.info()
+    lines = ["# TYPE llm_cache_lookups_total counter"]
+    for result in ("hits", "semantic_hits", "misses"):
+        lines.append(f'llm_cache_lookups_total{{result="{result}"}} {info.get(result, 0)}')
+    return lines
+
+def _limiter_metrics():
+    lines = ["# TYPE llm_limiter_calls_total counter"]
+    gauges = ["# TYPE llm_limiter_concurrency_limit gauge"]
+    for name, limiter in list(rate_limit.limiters.items()):
+        info = limiter.info()
+        labels = f'provider="{limiter.provider}",model="{limiter.model}"'
+        for result in ("succeeded", "retries", "throttled", "failed"):
+            lines.append(f'llm_limiter_calls_total{{{labels},result="{result}"}} {info[result]}')
+        gauges.append(f"llm_limiter_concurrency_limit{{{labels}}} {info['concurrency_limit']}")
+    return lines + gauges
+
+def _singleflight_metrics():
+    lines = ["# TYPE llm_singleflight_calls_total counter"]
+    for name, group in list(singleflight.groups.items()):
+        info = group.info()
+        for result in ("leaders", "coalesced"):
+            lines.append(f'llm_singleflight_calls_total{{group="{name}",result="{result}"}} {info[result]}')
+    return lines
+
+def _scheduler_metrics():
+    lines = ["# TYPE scheduler_requests_total counter"]
+    gauges = ["# TYPE scheduler_queued gauge"]
+    for priority, info in scheduler.info()["classes"].items():
+        for result in ("admitted", "shed", "expired", "granted"):
+            lines.append(f'scheduler_requests_total{{priority="{priority}",result="{result}"}} {info[result]}')
+        gauges.append(f'scheduler_queued{{priority="{priority}"}} {info["queued"]}')
+    return lines + gauges
+
+tracing.COLLECTORS.extend([_cache_metrics, _limiter_metrics, _singleflight_metrics, _scheduler_metrics])
 
 # Function to process messages synchronously
 def sync_process(message):
-    loop = asyncio.new_event_loop()
-    result = loop.run_until_complete(process_message_node(message))
-    loop.close()
-    return result
+    return runtime.run(process_message_node(message))
+
+def wants_stream(data):
+    """Stream as Server-Sent Events when asked via ?stream=1, the body or the Accept header"""
+    return (request.args.get('stream') == '1' or bool(data.get('stream'))
+            or 'text/event-stream' in request.headers.get('Accept', ''))
+
+def sse_event(event, payload):
+    return f"event: {event}\ndata: {json.dumps(payload)}\n\n"
+
+def sse_response(events):
+    return Response(stream_with_context(events), mimetype='text/event-stream',
+                    headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+
+def format_marketing_response(marketing_message, variations):
+    formatted_response = f"Generated Marketing Message:\n{marketing_message}\n\n"
+    formatted_response += "A/B Test Variations:\n"
+    for i, var in enumerate(variations, 1):
+        formatted_response += f"Variation {i}:\n{var}\n\n"
+    return formatted_response
 
 @app.route('/process_message', methods=['POST'])
 def process_message():
@@ -28,9 +194,30 @@ def process_message():
     try:
         data = request.json
         message = data.get('message', '')
-        # You can add chat history/context here if you want
-        prompt = f"You are a helpful WhatsApp assistant. User says: {message}\nAssistant:"
-        response = generate_marketing_text_groq(prompt, model="llama3-8b-8192", max_tokens=120)
+        # With a session_id the reply sees a bounded summary of the conversation.
+        # Web sessions get their own key namespace, so a client-chosen id can
+        # never name a WhatsApp conversation (whatsapp.py keys those "wa:<sender>")
+        session_id = data.get('session_id')
+        store = get_conversation_store()
+        conversation = store.get(f"web:{session_id}") if session_id else None
+        if conversation is not None:
+            prompt = build_prompt(conversation, message)
+        else:
+            prompt = f"You are a helpful WhatsApp assistant. User says: {message}\nAssistant:"
+        if wants_stream(data):
+            def events():
+                parts = []
+                for delta in runtime.iterate(astream_marketing_text_groq(prompt, model="llama3-8b-8192", max_tokens=120)):
+                    parts.append(delta)
+                    yield sse_event('delta', {'text': delta})
+                response = ''.join(parts).strip()
+                if conversation is not None:
+                    store.add_turn(conversation, message, response)
+                yield sse_event('done', {'status': 'success', 'response': response})
+            return sse_response(events())
+        response = runtime.run(agenerate_marketing_text_groq(prompt, model="llama3-8b-8192", max_tokens=120))
+        if conversation is not None:
+            store.add_turn(conversation, message, response)
         return jsonify({
             'status': 'success',
             'response': response
@@ -48,24 +235,72 @@ def generate_marketing():
         data = request.json
         product_info = data.get('product_info', '')
         campaign_type = data.get('campaign_type', 'promotion')
+        # With with_video, a cached YouTube video for video_query (default: the
+        # product) is attached; a miss returns null and is resolved for next time
+        video = None
+        if data.get('with_video'):
+            video = youtube.get_youtube_resolver().lookup(data.get('video_query') or product_info)
         
-        # Generate marketing message
-        marketing_message = create_marketing_message(product_info, campaign_type)
+        # With VARIATION_POOL=1 a pre-generated bundle answers instantly; the LLM is only called on a miss
+        pool = get_variation_pool()
+        pooled = pool.take(product_info, campaign_type) if pool is not None else None
+        if pooled is not None:
+            marketing_message, variations = pooled
+            if wants_stream(data):
+                def pooled_events():
+                    yield sse_event('marketing_message', {'index': 0, 'text': marketing_message})
+                    for index, text in enumerate(variations):
+                        yield sse_event('variation', {'index': index, 'text': text})
+                    yield sse_event('done', {
+                        'status': 'success',
+                        'marketing_message': marketing_message,
+                        'ab_variations': variations,
+                        'formatted_response': format_marketing_response(marketing_message, variations),
+                        'video': video
+                    })
+                return sse_response(pooled_events())
+            return jsonify({
+                'status': 'success',
+                'marketing_message': marketing_message,
+                'ab_variations': variations,
+                'formatted_response': format_marketing_response(marketing_message, variations),
+                'video': video
+            })
+
+        if wants_stream(data):
+            # One event per result, in the order they finish
+            def events():
+                marketing_message, variations = None, [None, None]
+                for kind, index, text in runtime.iterate(aiter_marketing_bundle(
+                        product_info, campaign_type, 2, deadline=MARKETING_DEADLINE_SECONDS)):
+                    if kind == 'marketing_message':
+                        marketing_message = text
+                    else:
+                        variations[index] = text
+                    yield sse_event(kind, {'index': index, 'text': text})
+                yield sse_event('done', {
+                    'status': 'success',
+                    'marketing_message': marketing_message,
+                    'ab_variations': variations,
+                    'formatted_response': format_marketing_response(marketing_message, variations),
+                    'video': video
+                })
+            return sse_response(events())
         
-        # Generate A/B variations
-        variations = create_ab_test_variations(product_info, campaign_type, 2)
+        # Generate the marketing message and A/B variations concurrently
+        marketing_message, variations = runtime.run(acreate_marketing_bundle(
+            product_info, campaign_type, 2, deadline=MARKETING_DEADLINE_SECONDS
+        ))
         
         # Format response
-        formatted_response = f"Generated Marketing Message:\n{marketing_message}\n\n"
-        formatted_response += "A/B Test Variations:\n"
-        for i, var in enumerate(variations, 1):
-            formatted_response += f"Variation {i}:\n{var}\n\n"
+        formatted_response = format_marketing_response(marketing_message, variations)
         
         return jsonify({
             'status': 'success',
             'marketing_message': marketing_message,
             'ab_variations': variations,
-            'formatted_response': formatted_response
+            'formatted_response': formatted_response,
+            'video': video
         })
     except Exception as e:
         return jsonify({
@@ -73,6 +308,194 @@ def generate_marketing():
             'message': str(e)
         }), 500
 
+@app.route('/voice', methods=['POST'])
+def generate_voice_audio():
+    """Stream mp3 audio for text (ElevenLabs, cached on disk by text and voice)"""
+    try:
+        data = request.json
+        text = (data.get('text') or '').strip()
+        if not text:
+            return jsonify({'status': 'error', 'message': 'text is required'}), 400
+        chunks = runtime.iterate(voice.astream_voice(text, data.get('voice') or voice.TTS_VOICE))
+        # Pull the first chunk here so synthesis errors still get a JSON error response
+        first = next(chunks, b'')
+        return Response(stream_with_context(itertools.chain([first], chunks)), mimetype='audio/mpeg')
+    except Exception as e:
+        return jsonify({
+            'status': 'error',
+            'message': str(e)
+        }), 500
+
+@app.route('/campaigns/batch', methods=['POST'])
+def campaigns_batch():
+    """Enqueue a JSONL/CSV upload of product_info/campaign_type rows as a bulk job"""
+    try:
+        upload = request.files.get('file')
+        if upload is not None:
+            rows = parse_rows(upload.read(), upload.filename or '')
+        else:
+            filename = '.csv' if 'csv' in (request.content_type or '') else ''
+            rows = parse_rows(request.get_data(), filename)
+        runner = get_campaign_runner()
+        job_id, unique_items = runner.submit(rows)
+        if request.args.get('stream') == '1':
+            return Response(stream_with_context(runner.stream_results(job_id)),
+                            mimetype='application/x-ndjson', headers={'X-Job-Id': job_id})
+        return jsonify({
+            'status': 'accepted',
+            'job_id': job_id,
+            'total_rows': len(rows),
+            'unique_items': unique_items,
+            'results_url': f'/campaigns/{job_id}/results'
+        }), 202
+    except CampaignError as e:
+        return jsonify({
+            'status': 'error',
+            'message': str(e)
+        }), 400
+    except Exception as e:
+        return jsonify({
+            'status': 'error',
+            'message': str(e)
+        }), 500
+
+@app.route('/campaigns/<job_id>', methods=['GET'])
+def campaign_status(job_id):
+    """Progress of a bulk job"""
+    job = get_campaign_runner().store.job(job_id)
+    if job is None:
+        return jsonify({'status': 'error', 'message': 'unknown job'}), 404
+    return jsonify(job)
+
+@app.route('/campaigns/<job_id>/results', methods=['GET'])
+def campaign_results(job_id):
+    """Stream finished results as JSONL; pass ?offset=N to resume after N results"""
+    runner = get_campaign_runner()
+    if runner.store.job(job_id) is None:
+        return jsonify({'status': 'error', 'message': 'unknown job'}), 404
+    offset = request.args.get('offset', 0, type=int)
+    return Response(stream_with_context(runner.stream_results(job_id, offset)),
+                    mimetype='application/x-ndjson')
+
+@app.route('/webhook/whatsapp', methods=['GET'])
+def whatsapp_verify():
+    """Cloud API webhook verification: echo hub.challenge when the verify token matches"""
+    if (request.args.get('hub.mode') == 'subscribe' and whatsapp.WHATSAPP_VERIFY_TOKEN
+            and request.args.get('hub.verify_token') == whatsapp.WHATSAPP_VERIFY_TOKEN):
+        return request.args.get('hub.challenge', ''), 200
+    return jsonify({'status': 'error', 'message': 'verification failed'}), 403
+
+@app.route('/webhook/whatsapp', methods=['POST'])
+def whatsapp_webhook():
+    """Record inbound WhatsApp messages and acknowledge; replies are generated and sent in the background"""
+    body = request.get_data()
+    if not whatsapp.verify_signature(body, request.headers.get('X-Hub-Signature-256')):
+        return jsonify({'status': 'error', 'message': 'invalid signature'}), 403
+    try:
+        payload = json.loads(body)
+    except ValueError:
+        return jsonify({'status': 'error', 'message': 'invalid JSON'}), 400
+    result = whatsapp.get_whatsapp_gateway().receive(payload)
+    if result is None:
+        # The provider redelivers later
+        return jsonify({'status': 'error', 'message': 'queue full'}), 503, {'Retry-After': '5'}
+    return jsonify({'status': 'success', **result})
+
+@app.route('/healthz', methods=['GET'])
+def healthz():
+    """Liveness: the process is up and serving requests"""
+    return jsonify({'status': 'ok'})
+
+@app.route('/readyz', methods=['GET'])
+def readyz():
+    """Readiness: background warm-up (if enabled) has finished"""
+    status = 200 if warmup_state['done'] else 503
+    return jsonify({'status': 'ready' if warmup_state['done'] else 'warming_up',
+                    'warmup': warmup_state}), status
+
+@app.route('/cache/stats', methods=['GET'])
+def cache_stats():
+    """Hit/miss/eviction counters for the LLM response cache"""
+    cache = get_response_cache()
+    if cache is None:
+        return jsonify({'status': 'disabled'})
+    return jsonify({'status': 'success', 'cache': cache.info()})
+
+@app.route('/limits/stats', methods=['GET'])
+def limits_stats():
+    """Retry/throttle counters and current concurrency limit per provider and model"""
+    return jsonify({
+        'status': 'success',
+        'limits': {name: limiter.info() for name, limiter in list(rate_limit.limiters.items())},
+    })
+
+@app.route('/singleflight/stats', methods=['GET'])
+def singleflight_stats():
+    """Upstream calls made (leaders) versus identical requests that shared one (coalesced)"""
+    return jsonify({
+        'status': 'success',
+        'groups': {name: group.info() for name, group in list(singleflight.groups.items())},
+    })
+
+@app.route('/scheduler/stats', methods=['GET'])
+def scheduler_stats():
+    """Queued calls plus admitted/shed/expired/granted counters per priority class"""
+    return jsonify({'status': 'success', 'scheduler': scheduler.info()})
+
+@app.route('/conversations/stats', methods=['GET'])
+def conversations_stats():
+    """Live sessions plus spill/load and summary compaction counters"""
+    return jsonify({'status': 'success', 'conversations': get_conversation_store().info()})
+
+@app.route('/voice/stats', methods=['GET'])
+def voice_stats():
+    """Hit/miss/eviction counters and size of the text-to-speech audio cache"""
+    return jsonify({'status': 'success', 'cache': voice.get_audio_cache().info()})
+
+@app.route('/whatsapp/stats', methods=['GET'])
+def whatsapp_stats():
+    """Inbound/duplicate/sent counters, queue depth and inbox status counts of the WhatsApp webhook"""
+    return jsonify({'status': 'success', 'whatsapp': whatsapp.get_whatsapp_gateway().info()})
+
+@app.route('/youtube/stats', methods=['GET'])
+def youtube_stats():
+    """Hit rate, failures and prefetch counters of the cached YouTube video lookup"""
+    return jsonify({'status': 'success', 'youtube': youtube.get_youtube_resolver().info()})
+
+@app.route('/variation_pool/stats', methods=['GET'])
+def variation_pool_stats():
+    """Hit rate, ready bundles and refill counters of the pre-generated variation pool"""
+    pool = get_variation_pool()
+    if pool is None:
+        return jsonify({'status': 'disabled'})
+    return jsonify({'status': 'success', 'pool': pool.info()})
+
+@app.route('/router/stats', methods=['GET'])
+def router_stats():
+    """Hedging/failover counters and latency/error EWMAs per route and backend"""
+    return jsonify({
+        'status': 'success',
+        'routes': {name: route.info() for name, route in list(router.routers.items())},
+    })
+
+@app.route('/metrics', methods=['GET'])
+def metrics():
+    """Prometheus exposition of request, node and provider latency histograms"""
+    return Response(tracing.render_metrics(), mimetype='text/plain; version=0.0.4')
+
+@app.route('/debug/traces', methods=['GET'])
+def debug_traces():
+    """Most recent traces, newest first"""
+    return jsonify({'status': 'success', 'traces': tracing.recent_traces(int(request.args.get('limit', 20)))})
+
+@app.route('/debug/traces/<trace_id>', methods=['GET'])
+def debug_trace(trace_id):
+    """All spans of one request (queue wait, network time, tokens, cache hits, fallbacks)"""
+    trace = tracing.get_trace(trace_id)
+    if trace is None:
+        return jsonify({'status': 'error', 'message': 'unknown or expired trace'}), 404
+    return jsonify({'status': 'success', 'trace': trace.to_dict()})
+
 @app.route('/', methods=['GET'])
 def index():
     """Serve the index page"""
@@ -249,6 +672,37 @@ def index():
                     evt.currentTarget.className += " active";
                 }
                 
+                // Read a Server-Sent Events response and call onEvent(name, data) per event
+                async function readEvents(response, onEvent) {
+                    const reader = response.body.getReader();
+                    const decoder = new TextDecoder();
+                    let buffer = '';
+                    while (true) {
+                        const { value, done } = await reader.read();
+                        if (done) break;
+                        buffer += decoder.decode(value, { stream: true });
+                        let boundary;
+                        while ((boundary = buffer.indexOf('\\n\\n')) !== -1) {
+                            const block = buffer.slice(0, boundary);
+                            buffer = buffer.slice(boundary + 2);
+                            let name = 'message', data = '';
+                            block.split('\\n').forEach(line => {
+                                if (line.startsWith('event: ')) name = line.slice(7);
+                                else if (line.startsWith('data: ')) data += line.slice(6);
+                            });
+                            onEvent(name, JSON.parse(data));
+                        }
+                    }
+                }
+                
+                function renderMarketing(message, variations) {
+                    let text = 'Generated Marketing Message:\\n' + (message || '...') + '\\n\\nA/B Test Variations:\\n';
+                    variations.forEach((variation, i) => {
+                        text += 'Variation ' + (i + 1) + ':\\n' + (variation || '...') + '\\n\\n';
+                    });
+                    document.getElementById('marketingResult').textContent = text;
+                }
+                
                 async function generateMarketing() {
                     const productInfo = document.getElementById('productInfo').value;
                     const campaignType = document.getElementById('campaignType').value;
@@ -261,12 +715,14 @@ def index():
                     // Show loading
                     document.getElementById('marketingLoading').classList.remove('hidden');
                     document.getElementById('marketingResult').classList.add('hidden');
+                    document.getElementById('whatsappSendBtn').style.display = "none";
                     
                     try {
                         const response = await fetch('/generate_marketing', {
                             method: 'POST',
                             headers: {
-                                'Content-Type': 'application/json'
+                                'Content-Type': 'application/json',
+                                'Accept': 'text/event-stream'
                             },
                             body: JSON.stringify({ 
                                 product_info: productInfo,
@@ -274,29 +730,39 @@ def index():
                             })
                         });
                         
-                        const data = await response.json();
-                        
-                        // Hide loading
-                        document.getElementById('marketingLoading').classList.add('hidden');
-                        document.getElementById('marketingResult').classList.remove('hidden');
-                        
-                        if (data.status === 'success') {
-                            document.getElementById('marketingResult').textContent = data.formatted_response;
-
-                            // WhatsApp integration
-                            const phone = ""; // Optionally, set a default phone number with country code (e.g., "919999999999")
-                            const text = encodeURIComponent(data.marketing_message);
-                            const waBtn = document.getElementById('whatsappSendBtn');
-                            waBtn.href = `https://wa.me/${phone}?text=${text}`;
-                            waBtn.style.display = "inline-block";
-                        } else {
-                            document.getElementById('marketingResult').textContent = 'Error: ' + data.message;
-                            document.getElementById('whatsappSendBtn').style.display = "none";
+                        if (!response.ok) {
+                            const data = await response.json();
+                            throw new Error(data.message);
                         }
+                        
+                        let message = null;
+                        const variations = [null, null];
+                        await readEvents(response, (name, data) => {
+                            // Hide loading as soon as the first result arrives
+                            document.getElementById('marketingLoading').classList.add('hidden');
+                            document.getElementById('marketingResult').classList.remove('hidden');
+                            
+                            if (name === 'marketing_message') {
+                                message = data.text;
+                            } else if (name === 'variation') {
+                                variations[data.index] = data.text;
+                            } else if (name === 'done') {
+                                message = data.marketing_message;
+                                
+                                // WhatsApp integration
+                                const phone = ""; // Optionally, set a default phone number with country code (e.g., "919999999999")
+                                const text = encodeURIComponent(data.marketing_message);
+                                const waBtn = document.getElementById('whatsappSendBtn');
+                                waBtn.href = `https://wa.me/${phone}?text=${text}`;
+                                waBtn.style.display = "inline-block";
+                            }
+                            renderMarketing(message, variations);
+                        });
                     } catch (error) {
                         document.getElementById('marketingLoading').classList.add('hidden');
                         document.getElementById('marketingResult').classList.remove('hidden');
                         document.getElementById('marketingResult').textContent = 'Error: ' + error.message;
+                        document.getElementById('whatsappSendBtn').style.display = "none";
                     }
                 }
                 
@@ -316,22 +782,30 @@ def index():
                         const response = await fetch('/process_message', {
                             method: 'POST',
                             headers: {
-                                'Content-Type': 'application/json'
+                                'Content-Type': 'application/json',
+                                'Accept': 'text/event-stream'
                             },
                             body: JSON.stringify({ message })
                         });
                         
-                        const data = await response.json();
-                        
-                        // Hide loading
-                        document.getElementById('chatLoading').classList.add('hidden');
-                        document.getElementById('chatResult').classList.remove('hidden');
-                        
-                        if (data.status === 'success') {
-                            document.getElementById('chatResult').textContent = data.response;
-                        } else {
-                            document.getElementById('chatResult').textContent = 'Error: ' + data.message;
+                        if (!response.ok) {
+                            const data = await response.json();
+                            throw new Error(data.message);
                         }
+                        
+                        const chatResult = document.getElementById('chatResult');
+                        chatResult.textContent = '';
+                        await readEvents(response, (name, data) => {
+                            // Hide loading on the first token
+                            document.getElementById('chatLoading').classList.add('hidden');
+                            chatResult.classList.remove('hidden');
+                            
+                            if (name === 'delta') {
+                                chatResult.textContent += data.text;
+                            } else if (name === 'done') {
+                                chatResult.textContent = data.response;
+                            }
+                        });
                     } catch (error) {
                         document.getElementById('chatLoading').classList.add('hidden');
                         document.getElementById('chatResult').classList.remove('hidden');
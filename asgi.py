@@ -0,0 +1,12 @@
+# asgi.py
+"""ASGI entry point, e.g. ``uvicorn asgi:application --workers 1``.
+
+Requests are served by the Flask app through asgiref's WSGI adapter, while
+every LLM call runs on the single shared event loop from runtime.py (started
+on first use, so it is safe to preload this module before forking workers).
+"""
+from asgiref.wsgi import WsgiToAsgi
+
+from wsgi import application as wsgi_application
+
+application = WsgiToAsgi(wsgi_application)
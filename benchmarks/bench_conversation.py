@@ -0,0 +1,102 @@
+"""Prompt size and latency over long conversations.
+
+Plays --conversations concurrent chats of --turns messages each against the
+local stub (which charges --prompt-token-ms per prompt token, like prefill on
+a real model) and compares sending the full history every turn with the
+conversation store's rolling summary + recent turns. Reports estimated prompt
+tokens and latency for the first, middle and last turns.
+
+    python benchmarks/bench_conversation.py --turns 50 --conversations 4
+"""
+import argparse
+import asyncio
+import os
+import statistics
+import tempfile
+import time
+
+from common import print_table, summarize
+from stub_llm import start_stub_server
+
+MESSAGES = [
+    "Hi, do you still have the eco bottles in blue?",
+    "How long do they keep drinks cold?",
+    "Can I get my name engraved on one?",
+    "What would shipping to Nairobi cost?",
+    "Is there a discount if I order 20 for my team?",
+    "Can you remind me what colours you mentioned?",
+]
+
+
+def full_history_prompt(history, message):
+    lines = [f"User: {user}\nAssistant: {assistant}" for user, assistant in history]
+    context = "\n".join(lines)
+    return f"You are a helpful WhatsApp assistant.\n\n{context}\n\nUser says: {message}\nAssistant:"
+
+
+async def chat(mode, number, turns, store, marketing_helper, conversations, estimate_tokens):
+    rows = []
+    history = []
+    conversation = store.get(f"bench-{mode}-{number}") if store else None
+    for turn in range(turns):
+        message = f"{MESSAGES[turn % len(MESSAGES)]} (#{turn})"
+        if conversation is None:
+            prompt = full_history_prompt(history, message)
+        else:
+            prompt = conversations.build_prompt(conversation, message)
+        start = time.perf_counter()
+        reply = await marketing_helper.agenerate_marketing_text_groq(prompt, max_tokens=120)
+        rows.append((turn, estimate_tokens(prompt), time.perf_counter() - start))
+        if conversation is None:
+            history.append((message, reply))
+        else:
+            store.add_turn(conversation, message, reply)
+    return rows
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--turns", type=int, default=50)
+    parser.add_argument("--conversations", type=int, default=4)
+    parser.add_argument("--latency-ms", type=float, default=50.0)
+    parser.add_argument("--prompt-token-ms", type=float, default=0.2)
+    args = parser.parse_args()
+
+    server, base_url = start_stub_server(latency_ms=args.latency_ms, prompt_token_ms=args.prompt_token_ms)
+    os.environ["GROQ_API_KEY"] = "stub-key"
+    os.environ["GROQ_BASE_URL"] = base_url
+    os.environ["LLM_CACHE"] = "off"
+    os.environ["CONVERSATION_DB_PATH"] = os.path.join(tempfile.mkdtemp(), "conversations.sqlite3")
+
+    import conversations
+    import marketing_helper
+    from rate_limit import estimate_tokens
+    from runtime import runtime
+
+    results = []
+    for mode in ("full history", "rolling summary"):
+        store = conversations.ConversationStore() if mode == "rolling summary" else None
+
+        async def run_all():
+            return await asyncio.gather(*(
+                chat(mode, n, args.turns, store, marketing_helper, conversations, estimate_tokens)
+                for n in range(args.conversations)
+            ))
+
+        start = time.perf_counter()
+        per_chat = runtime.run(run_all())
+        elapsed = time.perf_counter() - start
+        turns = [row for rows in per_chat for row in rows]
+        row = summarize(mode, [latency for _, _, latency in turns], elapsed)
+        for label, index in (("first", 0), ("mid", args.turns // 2), ("last", args.turns - 1)):
+            row[f"tokens_{label}"] = round(statistics.mean(t for n, t, _ in turns if n == index))
+        row["tokens_max"] = max(t for _, t, _ in turns)
+        if store is not None:
+            row["compactions"] = store.info()["compactions"]
+        results.append(row)
+    print_table(results)
+    server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,80 @@
+"""Per-node timing and LLM calls per message for the w_crew graph.
+
+"linear" replays the old strict chain (process_message -> get_wiki_info ->
+format_response, three calls every time); "graph" runs the compiled graph
+via ainvoke, which overlaps the context calls and skips the wiki step for
+messages without a named entity.
+
+    python benchmarks/bench_crew.py --messages 40 --latency-ms 150
+"""
+import argparse
+import asyncio
+import os
+import time
+
+from common import percentile, print_table
+from stub_llm import start_stub_server
+
+MESSAGES = [
+    "Do you deliver on Sundays?",
+    "What is the price of the large water bottle?",
+    "Can you tell me about Marie Curie?",
+    "my order has not arrived yet, can you check",
+    "Is this bottle as good as the ones Elon Musk uses?",
+    "Do you have a discount for bulk orders?",
+    "Thanks! Is the blue one back in stock?",
+    "I read that Greta Thunberg recommends reusable bottles",
+]
+
+
+def timings_row(name, states, latencies):
+    row = {
+        "mode": name,
+        "messages": len(states),
+        "p50_ms": round(percentile(latencies, 50) * 1000, 1),
+        "p99_ms": round(percentile(latencies, 99) * 1000, 1),
+        "llm_calls_avg": round(sum(s["llm_calls"] for s in states) / len(states), 2),
+    }
+    nodes = sorted({node for s in states for node in s["timings"]})
+    for node in nodes:
+        values = [s["timings"][node] for s in states if node in s["timings"]]
+        row[f"{node}_ms"] = round(sum(values) / len(values) * 1000, 1)
+    return row
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--messages", type=int, default=40)
+    parser.add_argument("--latency-ms", type=float, default=150.0)
+    args = parser.parse_args()
+
+    server, base_url = start_stub_server(latency_ms=args.latency_ms)
+    os.environ["HF_INFERENCE_URL"] = base_url[:-len("/v1")] + "/hf"
+    os.environ["LLM_CACHE"] = "off"
+
+    import w_crew
+    from workflow import initial_state, run_crew
+
+    messages = [MESSAGES[i % len(MESSAGES)] for i in range(args.messages)]
+
+    def linear(message):
+        state = initial_state(message)
+        state = w_crew.process_message(state)
+        # The old chain fed processed_message to the wiki step unconditionally
+        state = w_crew.get_wiki_info(state)
+        return w_crew.format_response(state)
+
+    rows = []
+    for name, run in (("linear", lambda m: linear(m)), ("graph", lambda m: asyncio.run(run_crew(m)))):
+        states, latencies = [], []
+        for message in messages:
+            start = time.perf_counter()
+            states.append(run(message))
+            latencies.append(time.perf_counter() - start)
+        rows.append(timings_row(name, states, latencies))
+    print_table(rows)
+    server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,86 @@
+"""Benchmark Groq client reuse against a local OpenAI-compatible stub.
+
+Compares the old behaviour (a new ``openai.OpenAI`` client per call) with the
+pooled module-level client and the async, concurrency-limited variant. The
+response cache and single-flight are off, so every row makes real calls to
+the stub rather than reusing an earlier row's completions.
+
+    python benchmarks/bench_groq_client.py --requests 200 --concurrency 8
+"""
+import argparse
+import asyncio
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from common import print_table, summarize
+from stub_llm import start_stub_server
+
+
+def run_threaded(name, call, prompts, concurrency):
+    def timed(prompt):
+        start = time.perf_counter()
+        call(prompt)
+        return time.perf_counter() - start
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        latencies = list(pool.map(timed, prompts))
+    return summarize(name, latencies, time.perf_counter() - start)
+
+
+def run_async(name, acall, prompts):
+    async def timed(prompt):
+        start = time.perf_counter()
+        await acall(prompt)
+        return time.perf_counter() - start
+
+    async def main():
+        return await asyncio.gather(*(timed(p) for p in prompts))
+
+    start = time.perf_counter()
+    latencies = asyncio.run(main())
+    return summarize(name, latencies, time.perf_counter() - start)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--requests", type=int, default=200)
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--latency-ms", type=float, default=20.0)
+    args = parser.parse_args()
+
+    # Project modules read these at import, so they are set before any of them is imported
+    os.environ["GROQ_MAX_CONCURRENCY"] = str(args.concurrency)
+    os.environ["LLM_CACHE"] = "off"
+    os.environ["SINGLE_FLIGHT"] = "0"
+    server, base_url = start_stub_server(latency_ms=args.latency_ms)
+    os.environ["GROQ_API_KEY"] = "stub-key"
+    os.environ["GROQ_BASE_URL"] = base_url
+
+    import openai
+    import marketing_helper
+
+    def per_call_client(prompt):
+        # Previous behaviour: a fresh client and connection pool for every completion
+        client = openai.OpenAI(api_key="stub-key", base_url=base_url)
+        client.chat.completions.create(
+            model="llama3-8b-8192",
+            messages=[{"role": "user", "content": prompt}],
+            max_tokens=120,
+            temperature=0.8,
+        )
+        client.close()
+
+    prompts = [f"Promote product #{i}" for i in range(args.requests)]
+    rows = [
+        run_threaded("per-call client", per_call_client, prompts, args.concurrency),
+        run_threaded("pooled client", marketing_helper.generate_marketing_text_groq, prompts, args.concurrency),
+        run_async("async pooled", marketing_helper.agenerate_marketing_text_groq, prompts),
+    ]
+    print_table(rows)
+    server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
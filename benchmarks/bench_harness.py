@@ -0,0 +1,275 @@
+"""Reproducible load profiles for the app against the local LLM stub.
+
+Starts the stub (tunable latency, per-token delay, error rate and server-side
+rate limit) and the app in a child process pointed at it, then drives
+``/process_message`` and ``/generate_marketing`` with scripted profiles:
+
+- steady: --clients closed-loop clients for --duration seconds
+- burst:  --burst-size requests fired at once every --burst-interval seconds
+- soak:   a few clients for a long run, sampling the server's RSS for growth
+
+Each run records throughput, p50/p95/p99, errors and server memory to JSON,
+and can be compared against a stored baseline (exit code 1 on regression).
+Request bodies come from a JSONL workload file (``{"endpoint": ..., "body":
+{...}}`` per line, see benchmarks/workload.jsonl).
+
+    python benchmarks/bench_harness.py --profiles steady burst --out results.json
+    python benchmarks/bench_harness.py --save-baseline benchmarks/baseline.json
+    python benchmarks/bench_harness.py --baseline benchmarks/baseline.json --tolerance 10
+"""
+import argparse
+import asyncio
+import itertools
+import json
+import os
+import platform
+import subprocess
+import sys
+import time
+
+from common import ROOT, print_table, summarize
+from stub_llm import start_stub_server
+
+ENDPOINTS = ("/process_message", "/generate_marketing")
+DEFAULT_WORKLOAD = os.path.join(os.path.dirname(os.path.abspath(__file__)), "workload.jsonl")
+# Metrics where a larger value is a regression, and where a smaller one is
+HIGHER_IS_WORSE = ("p50_ms", "p95_ms", "p99_ms", "error_pct", "rss_peak_mb")
+LOWER_IS_WORSE = ("rps",)
+
+
+def load_workload(path):
+    """Map endpoint -> list of request bodies from a JSONL file"""
+    workload = {endpoint: [] for endpoint in ENDPOINTS}
+    with open(path, encoding="utf-8") as f:
+        for number, line in enumerate(f, 1):
+            if not line.strip():
+                continue
+            entry = json.loads(line)
+            endpoint = entry.get("endpoint")
+            if endpoint not in workload:
+                raise SystemExit(f"{path}:{number}: unknown endpoint {endpoint!r}")
+            workload[endpoint].append(entry["body"])
+    return workload
+
+
+def read_rss_mb(pid):
+    """(current, peak) resident set size of pid in MB, from /proc on Linux"""
+    values = {}
+    try:
+        with open(f"/proc/{pid}/status") as f:
+            for line in f:
+                if line.startswith(("VmRSS:", "VmHWM:")):
+                    key, amount = line.split()[:2]
+                    values[key] = int(amount) / 1024
+    except OSError:
+        return None, None
+    return values.get("VmRSS:"), values.get("VmHWM:")
+
+
+def serve(port):
+    """Child process: run the app on a threaded werkzeug server"""
+    sys.path.insert(0, ROOT)
+    from werkzeug.serving import make_server
+    import app as app_module
+
+    server = make_server("127.0.0.1", port, app_module.app, threaded=True)
+    server.socket.listen(1024)
+    print("ready", flush=True)
+    server.serve_forever()
+
+
+def start_app(env):
+    import socket
+
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        port = s.getsockname()[1]
+    proc = subprocess.Popen(
+        [sys.executable, os.path.abspath(__file__), "--serve", str(port)],
+        cwd=ROOT, env=env, stdout=subprocess.PIPE, stderr=subprocess.DEVNULL, text=True,
+    )
+    for line in proc.stdout:
+        if line.strip() == "ready":
+            break
+    else:
+        raise SystemExit("app server failed to start")
+    return proc, f"http://127.0.0.1:{port}"
+
+
+class Recorder:
+    def __init__(self):
+        self.latencies = []
+        self.errors = 0
+
+    async def send(self, client, url, body):
+        start = time.perf_counter()
+        try:
+            response = await client.post(url, json=body)
+            response.raise_for_status()
+            self.latencies.append(time.perf_counter() - start)
+        except Exception:
+            self.errors += 1
+
+
+async def closed_loop(client, url, bodies, clients, duration, recorder):
+    end = time.perf_counter() + duration
+
+    async def worker():
+        while time.perf_counter() < end:
+            await recorder.send(client, url, next(bodies))
+
+    await asyncio.gather(*(worker() for _ in range(clients)))
+
+
+async def bursts(client, url, bodies, size, interval, duration, recorder):
+    pending = []
+    start = time.perf_counter()
+    while time.perf_counter() - start < duration:
+        pending.extend(asyncio.ensure_future(recorder.send(client, url, next(bodies))) for _ in range(size))
+        await asyncio.sleep(interval)
+    await asyncio.gather(*pending)
+
+
+async def sample_rss(pid, samples, every=1.0):
+    while True:
+        samples.append(read_rss_mb(pid)[0])
+        await asyncio.sleep(every)
+
+
+async def run_profile(profile, base_url, endpoint, bodies, pid, args):
+    import httpx
+
+    recorder = Recorder()
+    samples = []
+    limits = httpx.Limits(max_connections=1024, max_keepalive_connections=256)
+    async with httpx.AsyncClient(limits=limits, timeout=120) as client:
+        sampler = asyncio.ensure_future(sample_rss(pid, samples))
+        start = time.perf_counter()
+        url = base_url + endpoint
+        if profile == "steady":
+            await closed_loop(client, url, bodies, args.clients, args.duration, recorder)
+        elif profile == "burst":
+            await bursts(client, url, bodies, args.burst_size, args.burst_interval, args.duration, recorder)
+        else:
+            await closed_loop(client, url, bodies, args.soak_clients, args.soak_duration, recorder)
+        elapsed = time.perf_counter() - start
+        sampler.cancel()
+    row = summarize(f"{endpoint} {profile}", recorder.latencies, elapsed)
+    total = len(recorder.latencies) + recorder.errors
+    row["error_pct"] = round(100.0 * recorder.errors / total, 2) if total else 0.0
+    rss = [s for s in samples if s is not None]
+    row["rss_mb"] = round(rss[-1], 1) if rss else None
+    row["rss_peak_mb"] = round(read_rss_mb(pid)[1] or 0, 1) or None
+    if profile == "soak" and len(rss) > 1:
+        row["rss_growth_mb"] = round(rss[-1] - rss[0], 1)
+    return row
+
+
+def compare(results, baseline, tolerance):
+    """Annotate rows with % change against the baseline; return the regressions"""
+    previous = {row["name"]: row for row in baseline["results"]}
+    regressions = []
+    for row in results:
+        base = previous.get(row["name"])
+        if base is None:
+            continue
+        for metric in HIGHER_IS_WORSE + LOWER_IS_WORSE:
+            old, new = base.get(metric), row.get(metric)
+            if not old or new is None:
+                continue
+            change = 100.0 * (new - old) / old
+            row[f"{metric}_vs_base"] = f"{change:+.1f}%"
+            worse = change > tolerance if metric in HIGHER_IS_WORSE else change < -tolerance
+            if worse:
+                regressions.append(f"{row['name']}: {metric} {old} -> {new} ({change:+.1f}%)")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--profiles", nargs="+", choices=("steady", "burst", "soak"), default=["steady", "burst"])
+    parser.add_argument("--endpoints", nargs="+", choices=ENDPOINTS, default=list(ENDPOINTS))
+    parser.add_argument("--workload", default=DEFAULT_WORKLOAD)
+    parser.add_argument("--clients", type=int, default=32)
+    parser.add_argument("--duration", type=float, default=15.0)
+    parser.add_argument("--burst-size", type=int, default=64)
+    parser.add_argument("--burst-interval", type=float, default=3.0)
+    parser.add_argument("--soak-clients", type=int, default=4)
+    parser.add_argument("--soak-duration", type=float, default=300.0)
+    parser.add_argument("--latency-ms", type=float, default=100.0)
+    parser.add_argument("--jitter-ms", type=float, default=20.0)
+    parser.add_argument("--token-ms", type=float, default=0.0)
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    parser.add_argument("--rate-limit-rps", type=float, default=0.0)
+    parser.add_argument("--cache", action="store_true", help="keep the LLM response cache on")
+    parser.add_argument("--out", help="write results JSON here")
+    parser.add_argument("--baseline", help="compare against this results JSON")
+    parser.add_argument("--save-baseline", help="write results JSON as the new baseline")
+    parser.add_argument("--tolerance", type=float, default=10.0, help="allowed regression in percent")
+    parser.add_argument("--serve", type=int, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.serve:
+        serve(args.serve)
+        return
+
+    workload = load_workload(args.workload)
+    stub_config = dict(latency_ms=args.latency_ms, jitter_ms=args.jitter_ms, token_ms=args.token_ms,
+                       error_rate=args.error_rate, rate_limit_rps=args.rate_limit_rps)
+    stub, stub_url = start_stub_server(**stub_config)
+    env = dict(
+        os.environ,
+        GROQ_API_KEY="stub-key",
+        GROQ_BASE_URL=stub_url,
+        HF_INFERENCE_URL=stub_url[:-len("/v1")] + "/hf",
+        LLM_CACHE=os.environ.get("LLM_CACHE", "memory") if args.cache else "off",
+    )
+    proc, base_url = start_app(env)
+    rows = []
+    try:
+        import httpx
+        # Warm-up so lazy clients and imports are not billed to the first profile
+        for endpoint in args.endpoints:
+            for body in workload[endpoint][:2]:
+                httpx.post(base_url + endpoint, json=body, timeout=120)
+        for endpoint in args.endpoints:
+            if not workload[endpoint]:
+                continue
+            bodies = itertools.cycle(workload[endpoint])
+            for profile in args.profiles:
+                rows.append(asyncio.run(run_profile(profile, base_url, endpoint, bodies, proc.pid, args)))
+    finally:
+        proc.terminate()
+        proc.wait(timeout=10)
+        stub.shutdown()
+
+    report = {
+        "meta": {
+            "timestamp": time.time(),
+            "git_rev": subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=ROOT,
+                                      capture_output=True, text=True).stdout.strip(),
+            "python": platform.python_version(),
+            "cpus": os.cpu_count(),
+            "stub": stub_config,
+            "args": {k: v for k, v in vars(args).items() if k not in ("serve", "out", "baseline", "save_baseline")},
+        },
+        "results": rows,
+    }
+    regressions = []
+    if args.baseline:
+        with open(args.baseline, encoding="utf-8") as f:
+            regressions = compare(rows, json.load(f), args.tolerance)
+    print_table(rows)
+    for path in (args.out, args.save_baseline):
+        if path:
+            with open(path, "w", encoding="utf-8") as f:
+                json.dump(report, f, indent=2)
+    if regressions:
+        print("\nRegressions beyond {:.0f}%:".format(args.tolerance))
+        for line in regressions:
+            print(f"  {line}")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,85 @@
+"""Tail latency of one backend versus the hedged router.
+
+Two stubs stand in for two providers: the "groq" stub answers in --latency-ms
+but a --slow-rate fraction of its requests take --slow-ms; the "hf" stub is a
+little slower on average with the same kind of (independent) tail. Compares
+sending everything to groq against routing groq,hf with a hedge after
+--hedge-ms, and reports p50/p95/p99 plus how much extra load the hedges cost.
+
+    python benchmarks/bench_hedging.py --requests 300 --slow-rate 0.05 --slow-ms 2000 --hedge-ms 150
+"""
+import argparse
+import asyncio
+import os
+import time
+
+from common import print_table, summarize
+from stub_llm import start_stub_server
+
+GROQ_MODEL = "llama3-8b-8192"
+
+
+def run(name, route, prompts, concurrency):
+    async def main():
+        semaphore = asyncio.Semaphore(concurrency)
+        latencies = []
+
+        async def one(prompt):
+            async with semaphore:
+                start = time.perf_counter()
+                await route.complete(prompt, 60)
+                latencies.append(time.perf_counter() - start)
+
+        await asyncio.gather(*(one(p) for p in prompts))
+        return latencies
+
+    start = time.perf_counter()
+    latencies = asyncio.run(main())
+    row = summarize(name, latencies, time.perf_counter() - start)
+    stats = route.info()
+    row["hedged_pct"] = round(100.0 * stats["hedged"] / stats["requests"], 1)
+    row["hedge_wins"] = stats["hedge_wins"]
+    return row
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--requests", type=int, default=300)
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--latency-ms", type=float, default=50.0)
+    parser.add_argument("--alt-latency-ms", type=float, default=80.0)
+    parser.add_argument("--jitter-ms", type=float, default=10.0)
+    parser.add_argument("--slow-rate", type=float, default=0.05)
+    parser.add_argument("--slow-ms", type=float, default=2000.0)
+    parser.add_argument("--hedge-ms", type=float, default=150.0)
+    args = parser.parse_args()
+
+    tail = dict(jitter_ms=args.jitter_ms, slow_rate=args.slow_rate, slow_ms=args.slow_ms)
+    groq_stub, groq_url = start_stub_server(latency_ms=args.latency_ms, **tail)
+    hf_stub, hf_url = start_stub_server(latency_ms=args.alt_latency_ms, **tail)
+    os.environ["GROQ_API_KEY"] = "stub-key"
+    os.environ["GROQ_BASE_URL"] = groq_url
+    os.environ["HF_INFERENCE_URL"] = hf_url[:-len("/v1")] + "/hf"
+    os.environ["LLM_CACHE"] = "off"
+
+    import router
+    import w_crew
+
+    backends = [f"groq:{GROQ_MODEL}", f"hf:{w_crew.HF_MODEL}"]
+    configs = (
+        ("groq only", router.Router("single", backends[:1], hedge_delay=args.hedge_ms / 1000)),
+        ("hedged", router.Router("hedged", backends, hedge_delay=args.hedge_ms / 1000)),
+    )
+    rows = []
+    for name, route in configs:
+        run("warm-up", route, [f"warm-up {i}" for i in range(args.concurrency)], args.concurrency)
+        route.stats = dict.fromkeys(route.stats, 0)
+        prompts = [f"Promote product #{i} ({name})" for i in range(args.requests)]
+        rows.append(run(name, route, prompts, args.concurrency))
+    print_table(rows)
+    groq_stub.shutdown()
+    hf_stub.shutdown()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,90 @@
+"""Sustained-load test of the app against the local stub LLM.
+
+Runs --clients concurrent closed-loop clients for --duration seconds against
+one endpoint of the in-process app (threaded werkzeug server) and reports
+throughput, latency percentiles and errors.
+
+    python benchmarks/bench_load.py --clients 128 --duration 20 --endpoint /generate_marketing
+"""
+import argparse
+import asyncio
+import os
+import threading
+import time
+
+from common import print_table, summarize
+from stub_llm import start_stub_server
+
+PAYLOADS = {
+    "/process_message": {"message": "Do you deliver on Sundays?"},
+    "/generate_marketing": {"product_info": "eco-friendly water bottles", "campaign_type": "promotion"},
+}
+
+
+async def closed_loop_clients(url, payload, clients, duration):
+    import httpx
+
+    latencies, errors = [], 0
+    end = time.perf_counter() + duration
+    limits = httpx.Limits(max_connections=clients, max_keepalive_connections=clients)
+    async with httpx.AsyncClient(limits=limits, timeout=60) as client:
+        async def worker(i):
+            nonlocal errors
+            while time.perf_counter() < end:
+                body = dict(payload)
+                # Vary the payload so the response cache does not answer everything
+                body.update({k: f"{v} #{i}-{len(latencies)}" for k, v in payload.items()})
+                start = time.perf_counter()
+                try:
+                    response = await client.post(url, json=body)
+                    response.raise_for_status()
+                    latencies.append(time.perf_counter() - start)
+                except Exception:
+                    errors += 1
+
+        start = time.perf_counter()
+        await asyncio.gather(*(worker(i) for i in range(clients)))
+        elapsed = time.perf_counter() - start
+    return latencies, errors, elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--clients", type=int, default=128)
+    parser.add_argument("--duration", type=float, default=20.0)
+    parser.add_argument("--endpoint", choices=sorted(PAYLOADS), default="/process_message")
+    parser.add_argument("--latency-ms", type=float, default=200.0)
+    parser.add_argument("--max-concurrency", type=int, default=256,
+                        help="GROQ_MAX_CONCURRENCY / HF_MAX_CONCURRENCY for the run")
+    args = parser.parse_args()
+
+    stub, base_url = start_stub_server(latency_ms=args.latency_ms)
+    os.environ.update({
+        "GROQ_API_KEY": "stub-key",
+        "GROQ_BASE_URL": base_url,
+        "HF_INFERENCE_URL": base_url[:-len("/v1")] + "/hf",
+        "GROQ_MAX_CONCURRENCY": str(args.max_concurrency),
+        "GROQ_MAX_CONNECTIONS": str(args.max_concurrency),
+        "HF_MAX_CONCURRENCY": str(args.max_concurrency),
+    })
+
+    from werkzeug.serving import make_server
+    import app as app_module
+
+    server = make_server("127.0.0.1", 0, app_module.app, threaded=True)
+    server.socket.listen(1024)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    url = f"http://127.0.0.1:{server.server_port}{args.endpoint}"
+
+    latencies, errors, elapsed = asyncio.run(
+        closed_loop_clients(url, PAYLOADS[args.endpoint], args.clients, args.duration)
+    )
+    row = summarize(f"{args.endpoint} x{args.clients}", latencies, elapsed)
+    row["errors"] = errors
+    print_table([row])
+    server.shutdown()
+    stub.shutdown()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,145 @@
+"""Local fallback model backends: fp32 pipeline and eager model vs int8 torch.ao and ONNX Runtime.
+
+CPU only. Each backend (see LOCAL_BACKEND in local_batcher.py) is loaded in
+its own child process so resident memory is not shared between them. For
+each it reports load time, RSS after a warm-up, first-token latency (prefill
+plus one decoded token for one prompt) and decode throughput in generated
+tokens/sec for one prompt and for a batch of --batch prompts. The
+``pipeline`` row is the transformers text-generation pipeline as in
+test_hf.py (batch 1 only).
+
+--random-weights builds a distilgpt2-shaped model with random weights and a
+synthetic tokenizer, for hosts that cannot download the model; speed and
+memory depend on the architecture, not on the weights. onnx-int8 needs
+``pip install optimum[onnxruntime]``.
+
+    python benchmarks/bench_local_backends.py --backends pipeline torch torch-int8 onnx-int8
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+os.environ.setdefault("CUDA_VISIBLE_DEVICES", "")
+
+from common import ROOT, percentile, print_table
+
+PROMPT = "Create a short, engaging WhatsApp marketing message for eco-friendly water bottle #{}:"
+BACKENDS = ("pipeline", "torch", "torch-int8", "onnx-int8")
+
+
+def read_rss_mb():
+    values = {}
+    with open("/proc/self/status") as f:
+        for line in f:
+            if line.startswith(("VmRSS:", "VmHWM:")):
+                key, amount = line.split()[:2]
+                values[key] = round(int(amount) / 1024, 1)
+    return values.get("VmRSS:"), values.get("VmHWM:")
+
+
+def random_model(path):
+    """Save a randomly initialised distilgpt2-shaped model and a word-level tokenizer to path"""
+    from tokenizers import Tokenizer, models, pre_tokenizers
+    from transformers import GPT2Config, GPT2LMHeadModel, PreTrainedTokenizerFast
+
+    eos = "<|endoftext|>"
+    vocab = {f"w{i}": i for i in range(50256)}
+    vocab[eos] = 50256
+    tokenizer = Tokenizer(models.WordLevel(vocab, unk_token=eos))
+    tokenizer.pre_tokenizer = pre_tokenizers.Whitespace()
+    PreTrainedTokenizerFast(
+        tokenizer_object=tokenizer, eos_token=eos, bos_token=eos, unk_token=eos,
+        model_input_names=["input_ids", "attention_mask"],
+    ).save_pretrained(path)
+    GPT2LMHeadModel(GPT2Config(n_layer=6)).save_pretrained(path)
+    return path
+
+
+def measure(backend, model_name, args):
+    """Child process: load one backend and time it"""
+    import torch
+
+    import local_batcher
+
+    start = time.perf_counter()
+    if backend == "pipeline":
+        from transformers import pipeline
+
+        generator = pipeline("text-generation", model=model_name)
+        model, tokenizer = generator.model, local_batcher.load_tokenizer(model_name)
+    else:
+        model, tokenizer = local_batcher.LOADERS[backend](model_name)
+    load_seconds = time.perf_counter() - start
+
+    def generate(prompts, new_tokens):
+        if backend == "pipeline":
+            generator(prompts[0], max_new_tokens=new_tokens, min_new_tokens=new_tokens,
+                      pad_token_id=tokenizer.pad_token_id)
+            return
+        inputs = tokenizer(prompts, return_tensors="pt", padding=True)
+        with torch.inference_mode():
+            model.generate(**inputs, max_new_tokens=new_tokens, min_new_tokens=new_tokens,
+                           do_sample=True, pad_token_id=tokenizer.pad_token_id)
+
+    def timed(prompts, new_tokens, rounds):
+        times = []
+        for _ in range(rounds):
+            start = time.perf_counter()
+            generate(prompts, new_tokens)
+            times.append(time.perf_counter() - start)
+        return percentile(times, 50)
+
+    generate([PROMPT.format(0)], 4)  # warm-up
+    batch = [PROMPT.format(i) for i in range(args.batch)]
+    row = {
+        "name": backend,
+        "load_s": round(load_seconds, 2),
+        "first_token_ms": round(timed([PROMPT.format(1)], 1, args.rounds) * 1000, 1),
+        "tok_per_s_b1": round(args.new_tokens / timed([PROMPT.format(2)], args.new_tokens, args.rounds), 1),
+    }
+    if backend != "pipeline":
+        seconds = timed(batch, args.new_tokens, args.rounds)
+        row[f"tok_per_s_b{args.batch}"] = round(args.batch * args.new_tokens / seconds, 1)
+    row["rss_mb"], row["peak_rss_mb"] = read_rss_mb()
+    return row
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--backends", nargs="+", choices=BACKENDS, default=list(BACKENDS))
+    parser.add_argument("--model", default="distilgpt2")
+    parser.add_argument("--random-weights", action="store_true")
+    parser.add_argument("--new-tokens", type=int, default=60)
+    parser.add_argument("--batch", type=int, default=8)
+    parser.add_argument("--rounds", type=int, default=3)
+    parser.add_argument("--child", choices=BACKENDS, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        print(json.dumps(measure(args.child, args.model, args)))
+        return
+
+    model = random_model(tempfile.mkdtemp()) if args.random_weights else args.model
+    env = dict(os.environ, LOCAL_ONNX_DIR=os.environ.get("LOCAL_ONNX_DIR") or tempfile.mkdtemp())
+    if "onnx-int8" in args.backends:
+        # Export once up front, as a deployment would; the row measures loading the cached export
+        subprocess.run([sys.executable, "-c", f"import local_batcher; local_batcher.load_onnx_model({model!r})"],
+                       cwd=ROOT, env=env, check=True, capture_output=True)
+    rows = []
+    for backend in args.backends:
+        command = [sys.executable, os.path.abspath(__file__), "--child", backend, "--model", model,
+                   "--new-tokens", str(args.new_tokens), "--batch", str(args.batch), "--rounds", str(args.rounds)]
+        result = subprocess.run(command, env=env, capture_output=True, text=True)
+        if result.returncode != 0:
+            print(f"{backend} failed:\n{result.stderr[-2000:]}")
+            continue
+        rows.append(json.loads(result.stdout.strip().splitlines()[-1]))
+    print_table(rows)
+
+
+if __name__ == "__main__":
+    main()
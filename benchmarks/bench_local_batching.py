@@ -0,0 +1,75 @@
+"""Throughput of the local fallback model: per-request pipeline vs micro-batching.
+
+CPU only. Runs each concurrency level for --requests prompts and reports
+latency percentiles, requests/sec and the average batch size achieved.
+
+    python benchmarks/bench_local_batching.py --concurrency 1 8 32 --requests 64
+"""
+import argparse
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+os.environ.setdefault("CUDA_VISIBLE_DEVICES", "")
+
+from common import print_table, summarize
+from local_batcher import BatchingGenerator, load_model
+
+PROMPT = "Create a short, engaging WhatsApp marketing message for eco-friendly water bottle #{}:"
+
+
+def run(name, call, requests, concurrency):
+    def timed(i):
+        start = time.perf_counter()
+        call(PROMPT.format(i))
+        return time.perf_counter() - start
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        latencies = list(pool.map(timed, range(requests)))
+    row = summarize(f"{name} c={concurrency}", latencies, time.perf_counter() - start)
+    return row
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--model", default="distilgpt2")
+    parser.add_argument("--requests", type=int, default=64)
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[1, 8, 32])
+    parser.add_argument("--max-new-tokens", type=int, default=60)
+    parser.add_argument("--batch-size", type=int, default=32)
+    parser.add_argument("--wait-ms", type=float, default=5.0)
+    args = parser.parse_args()
+
+    from transformers import pipeline
+
+    generator = pipeline("text-generation", model=args.model)
+    model, tokenizer = load_model(args.model)
+    batcher = BatchingGenerator(
+        loader=lambda: (model, tokenizer), max_batch_size=args.batch_size,
+        max_wait_ms=args.wait_ms, max_queue=args.requests,
+    ).start()
+
+    def pipeline_call(prompt):
+        generator(prompt, max_new_tokens=args.max_new_tokens, num_return_sequences=1,
+                  truncation=True, pad_token_id=50256)
+
+    def batched_call(prompt):
+        batcher.generate(prompt, max_new_tokens=args.max_new_tokens, timeout=None)
+
+    rows = []
+    for concurrency in args.concurrency:
+        rows.append(run("pipeline", pipeline_call, args.requests, concurrency))
+        before = dict(batcher.stats())
+        row = run("batched", batched_call, args.requests, concurrency)
+        after = batcher.stats()
+        batches = after["batches"] - before["batches"]
+        row["avg_batch"] = round((after["requests"] - before["requests"]) / batches, 2) if batches else 0
+        rows.append(row)
+    for row in rows:
+        row.setdefault("avg_batch", 1)
+    print_table(rows)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,61 @@
+"""Compare sequential vs concurrent /generate_marketing generation.
+
+Sequential awaits the main message and then each A/B variation in turn;
+concurrent is marketing_helper.acreate_marketing_bundle, which runs them all
+as tasks on the shared event loop (with --deadline, if given).
+
+    python benchmarks/bench_marketing_fanout.py --rounds 20 --latency-ms 200
+"""
+import argparse
+import os
+import time
+
+from common import print_table, summarize
+from stub_llm import start_stub_server
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--rounds", type=int, default=20)
+    parser.add_argument("--variations", type=int, default=2)
+    parser.add_argument("--latency-ms", type=float, default=200.0)
+    parser.add_argument("--jitter-ms", type=float, default=100.0)
+    parser.add_argument("--deadline", type=float, default=None)
+    args = parser.parse_args()
+
+    server, base_url = start_stub_server(latency_ms=args.latency_ms, jitter_ms=args.jitter_ms)
+    os.environ["GROQ_API_KEY"] = "stub-key"
+    os.environ["GROQ_BASE_URL"] = base_url
+    # Repeated prompts would be answered from the response cache
+    os.environ["LLM_CACHE"] = "off"
+
+    import marketing_helper
+    from runtime import runtime
+
+    product = "eco-friendly water bottles that keep drinks cold for 24 hours"
+
+    async def sequential():
+        message = await marketing_helper.acreate_marketing_message(product, "promotion")
+        variations = [await marketing_helper.acreate_ab_test_variation(product, i, "promotion")
+                      for i in range(args.variations)]
+        return message, variations
+
+    def concurrent():
+        return marketing_helper.acreate_marketing_bundle(product, "promotion", args.variations,
+                                                         deadline=args.deadline)
+
+    rows = []
+    for name, bundle in (("sequential", sequential), ("concurrent", concurrent)):
+        latencies = []
+        start = time.perf_counter()
+        for _ in range(args.rounds):
+            t0 = time.perf_counter()
+            runtime.run(bundle())
+            latencies.append(time.perf_counter() - t0)
+        rows.append(summarize(name, latencies, time.perf_counter() - start))
+    print_table(rows)
+    server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
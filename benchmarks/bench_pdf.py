@@ -0,0 +1,106 @@
+"""Time and peak RSS of PDF extraction/summarization on a synthetic document.
+
+Each mode runs in a fresh interpreter so its peak RSS is measured in isolation
+(``worker_rss_mb`` is the largest pool worker, where one is used). The
+summarize modes run against the local LLM stub, once cold and once from the
+on-disk cache.
+
+    python benchmarks/bench_pdf.py --pages 500
+"""
+import argparse
+import json
+import os
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+
+from common import ROOT, print_table
+
+MODES = ("concat_all", "preview", "pages_sequential", "pages_parallel", "summarize_cold", "summarize_cached")
+
+
+def make_pdf(path, pages):
+    import fitz
+    line = "Catalog item {page}-{row}: stainless steel bottle, 750 ml, keeps drinks cold 24h, $19.99."
+    with fitz.open() as pdf:
+        for page in range(pages):
+            rows = "\n".join(line.format(page=page, row=row) for row in range(40))
+            pdf.new_page().insert_text((36, 48), rows, fontsize=8)
+        pdf.save(path)
+
+
+def run_mode(mode, path):
+    import pdf_summary
+
+    start = time.perf_counter()
+    if mode == "concat_all":
+        # Previous behaviour: read every page, keep the first 1000 characters
+        import fitz
+        pdf = fitz.open(path)
+        text = "".join([page.get_text() for page in pdf])
+        result = len(text[:1000])
+    elif mode == "preview":
+        result = len(pdf_summary.preview_pdf(path))
+    elif mode == "pages_sequential":
+        result = len(pdf_summary.extract_pages(path, workers=1))
+    elif mode == "pages_parallel":
+        result = len(pdf_summary.extract_pages(path))
+        # Reap the workers so their peak RSS shows up in RUSAGE_CHILDREN
+        pdf_summary.get_pool().shutdown()
+    else:
+        result = len(pdf_summary.summarize_pdf(path))
+    elapsed = time.perf_counter() - start
+    return {
+        "name": mode,
+        "ms": round(elapsed * 1000, 1),
+        "rss_mb": round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1),
+        "worker_rss_mb": round(resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss / 1024, 1),
+        "result": result,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--pages", type=int, default=500)
+    parser.add_argument("--latency-ms", type=float, default=100.0)
+    parser.add_argument("--workers", type=int, default=max(2, os.cpu_count() or 1))
+    parser.add_argument("--run", help=argparse.SUPPRESS)
+    parser.add_argument("--pdf", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.run:
+        print(json.dumps(run_mode(args.run, args.pdf)))
+        return
+
+    from stub_llm import start_stub_server
+
+    server, base_url = start_stub_server(latency_ms=args.latency_ms)
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "catalog.pdf")
+        make_pdf(path, args.pages)
+        env = dict(
+            os.environ,
+            GROQ_API_KEY="stub-key",
+            GROQ_BASE_URL=base_url,
+            LLM_CACHE="off",
+            PDF_CACHE_DIR=os.path.join(tmp, "cache"),
+            PDF_WORKERS=str(args.workers),
+        )
+        rows = []
+        for mode in MODES:
+            proc = subprocess.run(
+                [sys.executable, __file__, "--run", mode, "--pdf", path],
+                cwd=ROOT, env=env, capture_output=True, text=True,
+            )
+            if proc.returncode != 0:
+                raise SystemExit(f"{mode} failed:\n{proc.stderr[-2000:]}")
+            rows.append(json.loads(proc.stdout.strip().splitlines()[-1]))
+    server.shutdown()
+    print(f"{args.pages}-page PDF, {args.workers} workers on {os.cpu_count()} CPUs")
+    print_table(rows)
+
+
+if __name__ == "__main__":
+    main()
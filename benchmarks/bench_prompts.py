@@ -0,0 +1,91 @@
+"""Microbenchmarks for prompt building and completion clean-up.
+
+Each case runs --iterations times (after a short warm-up) and reports the
+mean cost per call, next to the previous per-call implementations. Note the
+previous clean-up only extracted the message; clean_message also enforces the
+280-character limit and adds an emoji when the completion has none.
+
+    python benchmarks/bench_prompts.py --iterations 100000
+"""
+import argparse
+import time
+
+import common  # noqa: F401  (puts the repo root on sys.path)
+from prompts import clean_message, get_templates
+
+PRODUCT = "eco-friendly water bottles that keep drinks cold for 24 hours"
+COMPLETIONS = {
+    "one_line": "🔥 Stay cool all day! Our eco bottles keep drinks cold for 24h. Reply YES to grab yours today! 💧",
+    "explained": (
+        'Here is a WhatsApp message for your product:\n\n"Stay cool all day! Our eco bottles keep drinks '
+        'cold for 24h. Reply YES now!"\n\nThis message uses urgency and a clear call-to-action.'
+    ),
+    "too_long": "Stay hydrated in style with bottles that keep drinks ice cold for a full day " * 5,
+}
+
+
+def old_message_prompt(product_info):
+    return (
+        f"Create a short, engaging WhatsApp marketing message for the following product promotion:\n"
+        f"Product: {product_info}\n\n"
+        "The message should:\n"
+        "- Be brief (under 280 characters)\n"
+        "- Include emojis\n"
+        "- Have a clear call-to-action\n"
+        "- Create urgency\n"
+        "- Be friendly and exciting"
+    )
+
+
+def old_variation_prompts(product_info):
+    return [
+        f"Write a short, urgent WhatsApp marketing message for this product: {product_info}. Use a strong call-to-action, create urgency, and include emojis. Make it sound exciting and exclusive.",
+        f"Write a friendly WhatsApp marketing message for this product: {product_info}. Start with a question to spark curiosity, highlight a unique benefit, and include emojis.",
+        f"Write a WhatsApp marketing message for this product: {product_info}. Mention how many customers love it (social proof), use a warm tone, and include emojis.",
+        f"Write a WhatsApp marketing message for this product: {product_info}. Emphasize a limited-time offer, use a bold statement, and include emojis.",
+        f"Write a personalized WhatsApp marketing message for this product: {product_info}. Address the customer directly, make it feel exclusive, and include emojis."
+    ]
+
+
+def old_extract(message):
+    if "\n" in message:
+        import re
+        match = re.search(r'["“](.+?)["”]', message, re.DOTALL)
+        if match:
+            return match.group(1).strip()
+        return message.split('\n')[0].strip()
+    return message.strip()
+
+
+def bench(fn, iterations):
+    for _ in range(min(1000, iterations)):
+        fn()
+    start = time.perf_counter()
+    for _ in range(iterations):
+        fn()
+    return (time.perf_counter() - start) / iterations * 1e9
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--iterations", type=int, default=100000)
+    args = parser.parse_args()
+
+    templates = get_templates("promotion")
+    cases = [
+        ("message_prompt", lambda: old_message_prompt(PRODUCT), lambda: templates.message_prompt(PRODUCT)),
+        ("variation_prompt", lambda: old_variation_prompts(PRODUCT)[1],
+         lambda: templates.variation_prompt(PRODUCT, 1)),
+    ]
+    for name, completion in COMPLETIONS.items():
+        cases.append((f"clean_{name}", lambda c=completion: old_extract(c), lambda c=completion: clean_message(c)))
+
+    print(f"{'case':<20}{'before ns':>12}{'after ns':>12}{'ratio':>8}")
+    for name, old, new in cases:
+        old_ns = bench(old, args.iterations)
+        new_ns = bench(new, args.iterations)
+        print(f"{name:<20}{old_ns:>12.0f}{new_ns:>12.0f}{old_ns / new_ns:>7.1f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,76 @@
+"""Throughput and fallback rate against a rate-limited provider.
+
+The stub rejects requests over ``--provider-rps`` with 429 + Retry-After (and
+optionally fails a random fraction with 429/503). Compares firing requests
+without client-side limiting or retries against the shared provider limiter
+(token bucket, AIMD concurrency, jittered backoff honouring Retry-After).
+
+    python benchmarks/bench_rate_limit.py --requests 200 --provider-rps 20
+"""
+import argparse
+import asyncio
+import os
+import time
+
+from common import print_table, summarize
+from stub_llm import start_stub_server
+
+MODEL = "llama3-8b-8192"
+
+
+def run(name, prompts, marketing_helper):
+    async def timed(prompt):
+        start = time.perf_counter()
+        text = await marketing_helper.agenerate_marketing_text_groq(prompt, model=MODEL)
+        return time.perf_counter() - start, text.startswith("🔥 Stub reply")
+
+    async def main():
+        return await asyncio.gather(*(timed(p) for p in prompts))
+
+    start = time.perf_counter()
+    results = asyncio.run(main())
+    elapsed = time.perf_counter() - start
+    row = summarize(name, [latency for latency, _ in results], elapsed)
+    succeeded = sum(1 for _, ok in results if ok)
+    row["ok_rps"] = round(succeeded / elapsed, 1)
+    row["fallback_pct"] = round(100.0 * (len(results) - succeeded) / len(results), 1)
+    return row
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--requests", type=int, default=200)
+    parser.add_argument("--provider-rps", type=float, default=20.0)
+    parser.add_argument("--error-rate", type=float, default=0.05)
+    parser.add_argument("--latency-ms", type=float, default=50.0)
+    args = parser.parse_args()
+
+    os.environ["GROQ_API_KEY"] = "stub-key"
+    os.environ["LLM_CACHE"] = "off"
+
+    import marketing_helper
+    import rate_limit
+
+    rows = []
+    configs = (
+        ("no limiter", dict(max_concurrency=args.requests, max_retries=0)),
+        ("limiter", dict(rpm=args.provider_rps * 60, max_retries=4, backoff_base=0.2)),
+    )
+    for name, config in configs:
+        # Fresh stub per run so each starts with a full server-side budget
+        server, base_url = start_stub_server(
+            latency_ms=args.latency_ms, error_rate=args.error_rate, rate_limit_rps=args.provider_rps
+        )
+        marketing_helper.GROQ_BASE_URL = base_url
+        rate_limit.limiters[f"groq:{MODEL}"] = rate_limit.ProviderLimiter(f"groq:{MODEL}", **config)
+        prompts = [f"Promote product #{i} ({name})" for i in range(args.requests)]
+        row = run(name, prompts, marketing_helper)
+        row.update({k: v for k, v in rate_limit.limiters[f"groq:{MODEL}"].info().items()
+                    if k in ("retries", "throttled")})
+        rows.append(row)
+        server.shutdown()
+    print_table(rows)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,152 @@
+"""Chat latency under a mixed load, with priority scheduling and in plain arrival order.
+
+Runs the app in a child process against the stub with a small Groq
+concurrency limit (--llm-concurrency), so LLM slots are the bottleneck. For
+--duration seconds it sends:
+
+- chat: /process_message at a fixed --chat-rate per second (open loop),
+- marketing: --marketing-clients closed-loop /generate_marketing clients,
+  spread over --tenants merchants (X-Tenant-Id), three LLM calls each;
+  a shed (503) client waits for its Retry-After,
+- bulk: one /campaigns/batch upload of --campaign-rows rows.
+
+Each mode (SCHEDULER=0, arrival order; SCHEDULER=1, priority classes and
+per-tenant fair queuing) gets a fresh app. Reports latency per class, 503s
+(shed) and the scheduler's own counters from /scheduler/stats.
+
+    python benchmarks/bench_scheduler.py --chat-rate 4 --marketing-clients 24 --duration 20
+"""
+import argparse
+import asyncio
+import json
+import os
+import tempfile
+import time
+
+from bench_harness import start_app
+from common import print_table, summarize
+from stub_llm import start_stub_server
+
+
+class Recorder:
+    def __init__(self):
+        self.latencies = []
+        self.shed = 0
+        self.errors = 0
+
+    async def send(self, client, url, **kwargs):
+        """Post and record the outcome; returns the seconds a shed request was asked to wait"""
+        start = time.perf_counter()
+        try:
+            response = await client.post(url, **kwargs)
+        except Exception:
+            self.errors += 1
+            return 0.0
+        if response.status_code == 503:
+            self.shed += 1
+            return float(response.headers.get("Retry-After", 1))
+        if response.status_code >= 400:
+            self.errors += 1
+        else:
+            self.latencies.append(time.perf_counter() - start)
+        return 0.0
+
+
+async def mixed_load(base_url, args):
+    import httpx
+
+    chat, marketing, bulk = Recorder(), Recorder(), Recorder()
+    limits = httpx.Limits(max_connections=512, max_keepalive_connections=256)
+    async with httpx.AsyncClient(limits=limits, timeout=120) as client:
+        rows = "\n".join(json.dumps({"product_info": f"Bulk product #{i}", "campaign_type": "promotion"})
+                         for i in range(args.campaign_rows))
+        await bulk.send(client, base_url + "/campaigns/batch", content=rows,
+                        headers={"Content-Type": "application/x-ndjson", "X-Tenant-Id": "bulk-merchant"})
+        end = time.perf_counter() + args.duration
+
+        async def marketing_client(number):
+            tenant = f"merchant-{number % args.tenants}"
+            sent = 0
+            while time.perf_counter() < end:
+                sent += 1
+                retry_after = await marketing.send(
+                    client, base_url + "/generate_marketing", headers={"X-Tenant-Id": tenant},
+                    json={"product_info": f"Eco bottle {number}-{sent}", "campaign_type": "promotion"})
+                if retry_after:
+                    await asyncio.sleep(min(retry_after, max(0.0, end - time.perf_counter())))
+
+        async def chat_load():
+            tasks = []
+            start = time.perf_counter()
+            for number in range(int(args.chat_rate * args.duration)):
+                delay = start + number / args.chat_rate - time.perf_counter()
+                if delay > 0:
+                    await asyncio.sleep(delay)
+                tasks.append(asyncio.ensure_future(chat.send(
+                    client, base_url + "/process_message", headers={"X-Tenant-Id": "merchant-0"},
+                    json={"message": f"Is order #{number} on its way?"})))
+            await asyncio.gather(*tasks)
+
+        start = time.perf_counter()
+        await asyncio.gather(chat_load(), *(marketing_client(i) for i in range(args.marketing_clients)))
+        elapsed = time.perf_counter() - start
+        stats = (await client.get(base_url + "/scheduler/stats")).json()["scheduler"]
+    return chat, marketing, elapsed, stats
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--duration", type=float, default=20.0)
+    parser.add_argument("--chat-rate", type=float, default=4.0, help="chat requests per second")
+    parser.add_argument("--marketing-clients", type=int, default=24)
+    parser.add_argument("--tenants", type=int, default=4)
+    parser.add_argument("--campaign-rows", type=int, default=200)
+    parser.add_argument("--llm-concurrency", type=int, default=4)
+    parser.add_argument("--latency-ms", type=float, default=200.0)
+    parser.add_argument("--max-queue-marketing", type=int, default=64)
+    args = parser.parse_args()
+
+    stub, stub_url = start_stub_server(latency_ms=args.latency_ms, jitter_ms=args.latency_ms / 5)
+    rows, counters = [], []
+    try:
+        for mode in ("0", "1"):
+            name = "priority" if mode == "1" else "arrival order"
+            env = dict(
+                os.environ,
+                SCHEDULER=mode,
+                SCHEDULER_MAX_QUEUE_MARKETING=str(args.max_queue_marketing),
+                GROQ_API_KEY="stub-key",
+                GROQ_BASE_URL=stub_url,
+                GROQ_MAX_CONCURRENCY=str(args.llm_concurrency),
+                # Keep the concurrency limit fixed; queueing here is the point
+                LLM_LATENCY_TARGET="60",
+                HF_INFERENCE_URL=stub_url[:-len("/v1")] + "/hf",
+                LLM_CACHE="off",
+                VARIATION_POOL="0",
+                MARKETING_DEADLINE_SECONDS="60",
+                CAMPAIGN_RPM="6000",
+                CAMPAIGN_DB_PATH=os.path.join(tempfile.mkdtemp(), "campaigns.sqlite3"),
+                CONVERSATION_DB_PATH=os.path.join(tempfile.mkdtemp(), "conversations.sqlite3"),
+            )
+            proc, base_url = start_app(env)
+            try:
+                chat, marketing, elapsed, stats = asyncio.run(mixed_load(base_url, args))
+            finally:
+                proc.terminate()
+                proc.wait(timeout=30)
+            for label, recorder in (("chat", chat), ("marketing", marketing)):
+                row = summarize(f"{name}: {label}", recorder.latencies, elapsed)
+                row.update(shed_503=recorder.shed, errors=recorder.errors)
+                rows.append(row)
+            for priority, info in stats["classes"].items():
+                counters.append({"name": f"{name}: {priority}", **{
+                    key: info[key] for key in ("admitted", "shed", "granted", "expired")}})
+    finally:
+        stub.shutdown()
+    print_table(rows)
+    print()
+    print_table(counters)
+
+
+if __name__ == "__main__":
+    main()
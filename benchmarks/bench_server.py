@@ -0,0 +1,162 @@
+"""Throughput and memory: dev server versus the gunicorn production profile.
+
+Starts the app three ways against the LLM stub and drives ``/process_message``
+with --clients closed-loop clients for --duration seconds:
+
+- dev:              one threaded werkzeug process (what ``python app.py`` runs)
+- gunicorn:         --workers gthread workers, each loading the models itself
+                    (PRELOAD_MODELS=0, WARMUP_ON_START=1)
+- gunicorn+preload: the same, with the models loaded once in the master
+                    before fork (PRELOAD_MODELS=1, see wsgi.py)
+
+Reports throughput and latency plus the summed RSS and PSS (proportional set
+size: shared pages split between the processes sharing them) of the server's
+process tree, from /proc/<pid>/smaps_rollup on Linux. RSS counts shared
+copy-on-write pages once per process; PSS is the memory actually used.
+
+    python benchmarks/bench_server.py --workers 2 --clients 32 --duration 15
+"""
+import argparse
+import asyncio
+import itertools
+import json
+import os
+import socket
+import subprocess
+import sys
+import time
+
+from bench_harness import DEFAULT_WORKLOAD, closed_loop, load_workload, Recorder
+from common import ROOT, print_table, summarize
+from stub_llm import start_stub_server
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def process_tree(pid):
+    """pid and all of its descendants"""
+    pids = [pid]
+    for current in pids:
+        try:
+            with open(f"/proc/{current}/task/{current}/children") as f:
+                pids.extend(int(child) for child in f.read().split())
+        except OSError:
+            pass
+    return pids
+
+
+def memory_mb(pid):
+    """(rss, pss) in MB summed over pid's process tree"""
+    rss = pss = 0
+    for current in process_tree(pid):
+        try:
+            with open(f"/proc/{current}/smaps_rollup") as f:
+                for line in f:
+                    if line.startswith("Rss:"):
+                        rss += int(line.split()[1])
+                    elif line.startswith("Pss:"):
+                        pss += int(line.split()[1])
+        except OSError:
+            pass
+    return round(rss / 1024, 1), round(pss / 1024, 1)
+
+
+def start_server(mode, env, workers):
+    port = free_port()
+    if mode == "dev":
+        command = [sys.executable, os.path.join(ROOT, "benchmarks", "bench_harness.py"), "--serve", str(port)]
+        env = dict(env, WARMUP_ON_START="1")
+    else:
+        command = [sys.executable, "-m", "gunicorn", "-c", "gunicorn.conf.py"]
+        preload = mode == "gunicorn+preload"
+        env = dict(env, GUNICORN_BIND=f"127.0.0.1:{port}", WEB_CONCURRENCY=str(workers),
+                   PRELOAD_MODELS="1" if preload else "0", WARMUP_ON_START="0" if preload else "1")
+    proc = subprocess.Popen(command, cwd=ROOT, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    return proc, f"http://127.0.0.1:{port}"
+
+
+def wait_ready(base_url, proc, checks, timeout=300):
+    """Poll /readyz until it answers 200 ``checks`` times in a row, so every
+    worker behind the shared socket has finished loading"""
+    import httpx
+
+    deadline = time.perf_counter() + timeout
+    streak = 0
+    start = time.perf_counter()
+    while streak < checks:
+        if proc.poll() is not None or time.perf_counter() > deadline:
+            raise SystemExit(f"server at {base_url} failed to become ready")
+        try:
+            ok = httpx.get(base_url + "/readyz", timeout=5).status_code == 200
+        except httpx.HTTPError:
+            ok = False
+        streak = streak + 1 if ok else 0
+        if not ok:
+            time.sleep(0.2)
+    return time.perf_counter() - start
+
+
+async def drive(base_url, bodies, clients, duration):
+    import httpx
+
+    recorder = Recorder()
+    limits = httpx.Limits(max_connections=1024, max_keepalive_connections=256)
+    async with httpx.AsyncClient(limits=limits, timeout=120) as client:
+        start = time.perf_counter()
+        await closed_loop(client, base_url + "/process_message", bodies, clients, duration, recorder)
+        elapsed = time.perf_counter() - start
+    return recorder, elapsed
+
+
+def run(mode, env, bodies, args):
+    proc, base_url = start_server(mode, env, args.workers)
+    try:
+        ready_s = wait_ready(base_url, proc, checks=1 if mode == "dev" else 4 * args.workers)
+        idle_rss, idle_pss = memory_mb(proc.pid)
+        recorder, elapsed = asyncio.run(drive(base_url, bodies, args.clients, args.duration))
+        rss, pss = memory_mb(proc.pid)
+        processes = len(process_tree(proc.pid))
+    finally:
+        proc.terminate()
+        proc.wait(timeout=60)
+    row = summarize(mode, recorder.latencies, elapsed)
+    row.update(errors=recorder.errors, processes=processes, ready_s=round(ready_s, 1),
+               idle_rss_mb=idle_rss, idle_pss_mb=idle_pss, rss_mb=rss, pss_mb=pss)
+    return row
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--modes", nargs="+", choices=("dev", "gunicorn", "gunicorn+preload"),
+                        default=["dev", "gunicorn", "gunicorn+preload"])
+    parser.add_argument("--workers", type=int, default=2)
+    parser.add_argument("--clients", type=int, default=32)
+    parser.add_argument("--duration", type=float, default=15.0)
+    parser.add_argument("--latency-ms", type=float, default=100.0)
+    parser.add_argument("--workload", default=DEFAULT_WORKLOAD)
+    parser.add_argument("--out", help="write results JSON here")
+    args = parser.parse_args()
+
+    stub, stub_url = start_stub_server(latency_ms=args.latency_ms, jitter_ms=20.0)
+    env = dict(
+        os.environ,
+        GROQ_API_KEY="stub-key",
+        GROQ_BASE_URL=stub_url,
+        HF_INFERENCE_URL=stub_url[:-len("/v1")] + "/hf",
+        LLM_CACHE="off",
+    )
+    bodies = itertools.cycle(load_workload(args.workload)["/process_message"])
+    rows = [run(mode, env, bodies, args) for mode in args.modes]
+    stub.shutdown()
+    print_table(rows)
+    if args.out:
+        with open(args.out, "w", encoding="utf-8") as f:
+            json.dump({"args": vars(args), "results": rows}, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,103 @@
+"""Upstream calls and latency for bursts of duplicated prompts, with and without single-flight.
+
+Each burst fires --unique distinct prompts, each repeated --duplicates times,
+all at once (a double-clicked button, many users asking the same question),
+against the stub (--latency-ms per call). The response cache is off, so
+without coalescing every duplicate is a separate upstream call. Runs both
+the sync path (threads calling generate_marketing_text_groq) and the async
+one (tasks calling acomplete_groq).
+
+    python benchmarks/bench_singleflight.py --bursts 10 --unique 4 --duplicates 8
+"""
+import argparse
+import asyncio
+import os
+import threading
+import time
+
+from common import print_table, summarize
+from stub_llm import start_stub_server
+
+MODEL = "llama3-8b-8192"
+
+
+def burst_prompts(burst, unique, duplicates):
+    return [f"Write a promotion for product #{burst}-{i}" for i in range(unique) for _ in range(duplicates)]
+
+
+def run_sync(bursts, unique, duplicates):
+    import marketing_helper
+
+    latencies = []
+    lock = threading.Lock()
+
+    def one(prompt):
+        start = time.perf_counter()
+        marketing_helper.generate_marketing_text_groq(prompt, model=MODEL)
+        with lock:
+            latencies.append(time.perf_counter() - start)
+
+    for burst in range(bursts):
+        threads = [threading.Thread(target=one, args=(p,)) for p in burst_prompts(burst, unique, duplicates)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+    return latencies
+
+
+def run_async(bursts, unique, duplicates):
+    import marketing_helper
+
+    async def main():
+        latencies = []
+
+        async def one(prompt):
+            start = time.perf_counter()
+            await marketing_helper.acomplete_groq(prompt, model=MODEL)
+            latencies.append(time.perf_counter() - start)
+
+        for burst in range(bursts):
+            await asyncio.gather(*(one(p) for p in burst_prompts(burst, unique, duplicates)))
+        return latencies
+
+    return asyncio.run(main())
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--bursts", type=int, default=10)
+    parser.add_argument("--unique", type=int, default=4)
+    parser.add_argument("--duplicates", type=int, default=8)
+    parser.add_argument("--latency-ms", type=float, default=200.0)
+    args = parser.parse_args()
+
+    server, base_url = start_stub_server(latency_ms=args.latency_ms, jitter_ms=20.0)
+    os.environ["GROQ_API_KEY"] = "stub-key"
+    os.environ["GROQ_BASE_URL"] = base_url
+    os.environ["LLM_CACHE"] = "off"
+
+    import rate_limit
+    import singleflight
+
+    limiter = rate_limit.get_limiter("groq", MODEL)
+    group = singleflight.get_flight_group("groq")
+    rows = []
+    for path, run in (("sync", run_sync), ("async", run_async)):
+        for enabled in (False, True):
+            singleflight.SINGLE_FLIGHT = enabled
+            calls_before = limiter.info()["succeeded"]
+            coalesced_before = group.coalesced
+            start = time.perf_counter()
+            latencies = run(args.bursts, args.unique, args.duplicates)
+            row = summarize(f"{path} {'single-flight' if enabled else 'every call'}",
+                            latencies, time.perf_counter() - start)
+            row["upstream_calls"] = limiter.info()["succeeded"] - calls_before
+            row["coalesced"] = group.coalesced - coalesced_before
+            rows.append(row)
+    print_table(rows)
+    server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
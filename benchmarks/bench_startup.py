@@ -0,0 +1,69 @@
+"""Report per-module import time for the app (like ``python -X importtime``).
+
+Fails with exit code 1 when importing ``app`` takes longer than --budget-ms,
+so cold-start regressions (e.g. a model loaded at import time) get caught.
+
+    python benchmarks/bench_startup.py --top 15 --budget-ms 1500
+"""
+import argparse
+import json
+import re
+import subprocess
+import sys
+import time
+
+from common import ROOT
+
+IMPORTTIME_RE = re.compile(r"import time:\s+(\d+)\s+\|\s+(\d+)\s+\|(\s*)(\S+)")
+
+
+def measure_imports(module):
+    """Import module in a fresh interpreter and parse its -X importtime output"""
+    start = time.perf_counter()
+    proc = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        cwd=ROOT, capture_output=True, text=True,
+    )
+    wall = time.perf_counter() - start
+    if proc.returncode != 0:
+        raise SystemExit(f"import {module} failed:\n{proc.stderr[-2000:]}")
+    rows = []
+    for line in proc.stderr.splitlines():
+        match = IMPORTTIME_RE.match(line)
+        if match:
+            self_us, cumulative_us, indent, name = match.groups()
+            rows.append({
+                "module": name,
+                "self_ms": int(self_us) / 1000,
+                "cumulative_ms": int(cumulative_us) / 1000,
+                "depth": (len(indent) - 1) // 2,
+            })
+    return rows, wall
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--module", default="app")
+    parser.add_argument("--top", type=int, default=15)
+    parser.add_argument("--budget-ms", type=float, default=None)
+    parser.add_argument("--json", dest="json_path", default=None, help="write results to this file")
+    args = parser.parse_args()
+
+    rows, wall = measure_imports(args.module)
+    total = next((r["cumulative_ms"] for r in rows if r["module"] == args.module and r["depth"] == 0), 0.0)
+    print(f"import {args.module}: {total:.1f} ms (interpreter wall time {wall * 1000:.1f} ms)")
+    print(f"{'cumulative_ms':>14}  {'self_ms':>9}  module")
+    for row in sorted(rows, key=lambda r: r["cumulative_ms"], reverse=True)[:args.top]:
+        print(f"{row['cumulative_ms']:>14.1f}  {row['self_ms']:>9.1f}  {'  ' * row['depth']}{row['module']}")
+
+    if args.json_path:
+        with open(args.json_path, "w") as f:
+            json.dump({"module": args.module, "total_ms": total, "wall_ms": wall * 1000, "imports": rows}, f, indent=2)
+
+    if args.budget_ms is not None and total > args.budget_ms:
+        print(f"FAIL: import {args.module} took {total:.1f} ms, budget is {args.budget_ms:.1f} ms")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,81 @@
+"""Time-to-first-byte and total latency: buffered JSON vs SSE streaming.
+
+Starts the Flask app in-process (threaded werkzeug server) against the local
+stub LLM, which emits tokens every --token-ms, and measures both endpoints.
+
+    python benchmarks/bench_streaming.py --requests 20 --token-ms 20
+"""
+import argparse
+import http.client
+import json
+import os
+import threading
+import time
+
+from common import percentile, print_table
+from stub_llm import start_stub_server
+
+
+def timed_post(port, path, payload, stream):
+    """POST payload and return (ttfb, total) in seconds"""
+    conn = http.client.HTTPConnection("127.0.0.1", port, timeout=60)
+    headers = {"Content-Type": "application/json"}
+    if stream:
+        headers["Accept"] = "text/event-stream"
+    start = time.perf_counter()
+    conn.request("POST", path, body=json.dumps(payload), headers=headers)
+    response = conn.getresponse()
+    response.read(1)
+    ttfb = time.perf_counter() - start
+    response.read()
+    total = time.perf_counter() - start
+    conn.close()
+    return ttfb, total
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--requests", type=int, default=20)
+    parser.add_argument("--latency-ms", type=float, default=100.0)
+    parser.add_argument("--jitter-ms", type=float, default=50.0)
+    parser.add_argument("--token-ms", type=float, default=20.0)
+    args = parser.parse_args()
+
+    stub, base_url = start_stub_server(latency_ms=args.latency_ms, jitter_ms=args.jitter_ms,
+                                       token_ms=args.token_ms)
+    os.environ.update({"GROQ_API_KEY": "stub-key", "GROQ_BASE_URL": base_url, "LLM_CACHE": "off"})
+
+    from werkzeug.serving import make_server
+    import app as app_module
+
+    server = make_server("127.0.0.1", 0, app_module.app, threaded=True)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    port = server.server_port
+
+    cases = [
+        ("/process_message", {"message": "Do you deliver on Sundays?"}),
+        ("/generate_marketing", {"product_info": "eco-friendly water bottles", "campaign_type": "promotion"}),
+    ]
+    rows = []
+    for path, payload in cases:
+        for stream in (False, True):
+            ttfbs, totals = [], []
+            for _ in range(args.requests):
+                ttfb, total = timed_post(port, path, payload, stream)
+                ttfbs.append(ttfb)
+                totals.append(total)
+            rows.append({
+                "endpoint": path,
+                "mode": "sse" if stream else "json",
+                "ttfb_p50_ms": round(percentile(ttfbs, 50) * 1000, 1),
+                "ttfb_p99_ms": round(percentile(ttfbs, 99) * 1000, 1),
+                "total_p50_ms": round(percentile(totals, 50) * 1000, 1),
+                "total_p99_ms": round(percentile(totals, 99) * 1000, 1),
+            })
+    print_table(rows)
+    server.shutdown()
+    stub.shutdown()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,88 @@
+"""Overhead of the tracing/metrics layer on real request paths.
+
+Runs /generate_marketing and /process_message through the Flask test client
+against the local stub, alternating batches with tracing on and off
+(``tracing.TRACING``) so drift affects both sides equally. Also reports the
+raw cost of one trace with a typical number of spans, which is what the
+percentage should be judged against when the stub latency is small.
+
+    python benchmarks/bench_tracing.py --rounds 10 --batch 20 --latency-ms 20
+"""
+import argparse
+import os
+import statistics
+import time
+
+from common import print_table, summarize
+from stub_llm import start_stub_server
+
+
+def span_cost(iterations=20000, spans=4):
+    import tracing
+
+    start = time.perf_counter()
+    for _ in range(iterations):
+        trace, token = tracing.start_trace("bench")
+        for _ in range(spans):
+            with tracing.span("llm.bench", model="m") as span:
+                span.set(queue_wait_ms=0.1, network_ms=1.0, tokens_in=10, tokens_out=20)
+                span.event("cache_miss", model="m")
+            tracing.LLM_SECONDS.observe(0.01, "bench", "m", "ok")
+        trace.root.finish()
+        tracing.HTTP_SECONDS.observe(trace.root.duration, "/bench", "POST", "200")
+        tracing.end_trace(token)
+    return (time.perf_counter() - start) / iterations
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--rounds", type=int, default=10)
+    parser.add_argument("--batch", type=int, default=20)
+    parser.add_argument("--latency-ms", type=float, default=20.0)
+    args = parser.parse_args()
+
+    server, base_url = start_stub_server(latency_ms=args.latency_ms)
+    os.environ["GROQ_API_KEY"] = "stub-key"
+    os.environ["GROQ_BASE_URL"] = base_url
+    os.environ["LLM_CACHE"] = "off"
+
+    import app as app_module
+    import tracing
+
+    client = app_module.app.test_client()
+    routes = {
+        "/generate_marketing": {"product_info": "eco-friendly water bottles"},
+        "/process_message": {"message": "When do you open on Sundays?"},
+    }
+    for path, body in routes.items():
+        client.post(path, json=body)  # warm up clients and connection pools
+
+    rows = []
+    for path, body in routes.items():
+        latencies = {True: [], False: []}
+        elapsed = {True: 0.0, False: 0.0}
+        for _ in range(args.rounds):
+            for enabled in (True, False):
+                tracing.TRACING = enabled
+                start = time.perf_counter()
+                for _ in range(args.batch):
+                    t0 = time.perf_counter()
+                    client.post(path, json=body)
+                    latencies[enabled].append(time.perf_counter() - t0)
+                elapsed[enabled] += time.perf_counter() - start
+        tracing.TRACING = True
+        on = summarize(f"{path} traced", latencies[True], elapsed[True])
+        off = summarize(f"{path} untraced", latencies[False], elapsed[False])
+        mean_on, mean_off = statistics.mean(latencies[True]), statistics.mean(latencies[False])
+        on["overhead_pct"] = round(100 * (mean_on - mean_off) / mean_off, 2)
+        rows.extend([on, off])
+    print_table(rows)
+
+    per_trace = span_cost()
+    print(f"\none trace with 4 spans + 5 observations: {per_trace * 1e6:.1f} us "
+          f"({100 * per_trace / (args.latency_ms / 1000):.3f}% of one {args.latency_ms:.0f} ms provider call)")
+    server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,98 @@
+"""/generate_marketing latency with and without the pre-generated variation pool.
+
+Replays a skewed (Zipf-like) mix of products and campaign types through the
+Flask test client from --clients threads with --think-ms between requests,
+first with the pool off, then on. The pool starts empty, so its first
+request per key is a miss; refills happen in the gaps between requests.
+Reports hit rate, latency percentiles and how many bundles were generated in
+the background (extra provider calls bought for the hits). Refills yield to
+live traffic, so raising --clients or lowering --think-ms lowers the hit rate.
+
+    python benchmarks/bench_variation_pool.py --requests 200 --latency-ms 300
+"""
+import argparse
+import os
+import random
+import threading
+import time
+
+from common import print_table, summarize
+from stub_llm import start_stub_server
+
+PRODUCTS = [
+    "eco-friendly water bottles", "wireless earbuds", "running shoes", "organic coffee beans",
+    "yoga mats", "phone cases", "scented candles", "kids' backpacks", "LED desk lamps",
+    "protein bars", "sunglasses", "bamboo toothbrushes",
+]
+CAMPAIGN_TYPES = ["promotion", "announcement", "reminder"]
+
+
+def workload(count, seed=7):
+    rng = random.Random(seed)
+    keys = [(p, c) for p in PRODUCTS for c in CAMPAIGN_TYPES]
+    weights = [1.0 / rank for rank in range(1, len(keys) + 1)]
+    return rng.choices(keys, weights=weights, k=count)
+
+
+def run(name, client, requests, clients, think):
+    latencies = []
+    lock = threading.Lock()
+    queue = list(requests)
+
+    def worker():
+        while True:
+            with lock:
+                if not queue:
+                    return
+                product_info, campaign_type = queue.pop()
+            start = time.perf_counter()
+            client.post("/generate_marketing", json={"product_info": product_info, "campaign_type": campaign_type})
+            elapsed = time.perf_counter() - start
+            with lock:
+                latencies.append(elapsed)
+            time.sleep(think)
+
+    start = time.perf_counter()
+    threads = [threading.Thread(target=worker) for _ in range(clients)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return summarize(name, latencies, time.perf_counter() - start)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--requests", type=int, default=200)
+    parser.add_argument("--clients", type=int, default=2)
+    parser.add_argument("--think-ms", type=float, default=500.0)
+    parser.add_argument("--latency-ms", type=float, default=300.0)
+    args = parser.parse_args()
+
+    server, base_url = start_stub_server(latency_ms=args.latency_ms, jitter_ms=args.latency_ms / 5)
+    os.environ["GROQ_API_KEY"] = "stub-key"
+    os.environ["GROQ_BASE_URL"] = base_url
+    # The response cache would turn repeats into hits on its own; measure the pool alone
+    os.environ["LLM_CACHE"] = "off"
+
+    import app as app_module
+    import variation_pool
+
+    client = app_module.app.test_client()
+    client.post("/generate_marketing", json={"product_info": "warm-up"})
+    requests = workload(args.requests)
+    rows = []
+    for enabled in (False, True):
+        variation_pool.VARIATION_POOL = enabled
+        row = run("pool" if enabled else "no pool", client, requests, args.clients, args.think_ms / 1000)
+        if enabled:
+            info = variation_pool.get_variation_pool().info()
+            row["hit_pct"] = round(100 * info["hit_rate"], 1)
+            row["bundles_generated"] = info["generated"]
+        rows.append(row)
+    print_table(rows)
+    server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,95 @@
+"""Text-to-speech latency: streamed misses versus cache hits.
+
+Sends --texts distinct texts to ``POST /voice`` from --concurrency threads via
+the Flask test client, against the stub's ElevenLabs endpoint (one audio
+chunk per word, --chunk-ms apart), then sends the same texts again. Reports
+time to first audio byte and to the full file. Before this pipeline the
+whole file was synthesized and saved before anything could be sent, so a
+miss's ``total`` is what the old first byte cost.
+
+    python benchmarks/bench_voice.py --texts 40 --concurrency 8 --latency-ms 200 --chunk-ms 20
+"""
+import argparse
+import os
+import tempfile
+import threading
+import time
+
+from common import percentile, print_table
+from stub_llm import start_stub_server
+
+WORDS = "thanks for shopping with us your order of eco bottles ships tomorrow reply help for support".split()
+
+
+def texts(count, words=15):
+    return [" ".join(WORDS[(i + j) % len(WORDS)] for j in range(words)) + f" #{i}" for i in range(count)]
+
+
+def run(name, client, items, concurrency):
+    first_bytes, totals, sizes = [], [], []
+    lock = threading.Lock()
+    queue = list(items)
+
+    def worker():
+        while True:
+            with lock:
+                if not queue:
+                    return
+                text = queue.pop()
+            start = time.perf_counter()
+            response = client.post("/voice", json={"text": text}, buffered=False)
+            first = None
+            size = 0
+            for chunk in response.iter_encoded():
+                if first is None:
+                    first = time.perf_counter() - start
+                size += len(chunk)
+            response.close()
+            with lock:
+                first_bytes.append(first)
+                totals.append(time.perf_counter() - start)
+                sizes.append(size)
+
+    threads = [threading.Thread(target=worker) for _ in range(concurrency)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return {
+        "name": name,
+        "requests": len(totals),
+        "first_byte_p50_ms": round(percentile(first_bytes, 50) * 1000, 2),
+        "first_byte_p95_ms": round(percentile(first_bytes, 95) * 1000, 2),
+        "total_p50_ms": round(percentile(totals, 50) * 1000, 2),
+        "total_p95_ms": round(percentile(totals, 95) * 1000, 2),
+        "avg_kb": round(sum(sizes) / len(sizes) / 1024, 1),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--texts", type=int, default=40)
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--latency-ms", type=float, default=200.0)
+    parser.add_argument("--chunk-ms", type=float, default=20.0)
+    args = parser.parse_args()
+
+    server, base_url = start_stub_server(latency_ms=args.latency_ms, token_ms=args.chunk_ms)
+    os.environ["ELEVENLABS_API_KEY"] = "stub-key"
+    os.environ["ELEVENLABS_BASE_URL"] = base_url[:-len("/v1")]
+    os.environ["TTS_CACHE_DIR"] = tempfile.mkdtemp()
+
+    import app as app_module
+    import voice
+
+    client = app_module.app.test_client()
+    items = texts(args.texts)
+    rows = [run("miss (streamed)", client, items, args.concurrency),
+            run("hit (disk cache)", client, items, args.concurrency)]
+    print_table(rows)
+    print(f"\ncache: {voice.get_audio_cache().info()}")
+    server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
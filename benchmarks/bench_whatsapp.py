@@ -0,0 +1,143 @@
+"""WhatsApp webhook: ack latency and sustained end-to-end messages per second.
+
+Runs the app in a child process against the stub (LLM and WhatsApp Cloud API
+endpoints) and posts Cloud-API-style webhook payloads at --rate per second for
+--duration seconds, spread over --senders phone numbers. A --retry-rate
+fraction of posts redeliver an earlier message, as the provider does when an
+ack is slow, and must not be answered twice. Reports ack latency as seen by
+the client and inside the app (Server-Timing), then waits for the replies to
+reach the stub and reports delivered messages per second, missing replies and
+duplicate replies. Raise --rate until delivery stops keeping up to find the
+sustained throughput.
+
+    python benchmarks/bench_whatsapp.py --rate 50 --duration 15 --latency-ms 50
+"""
+import argparse
+import asyncio
+import os
+import random
+import tempfile
+import time
+
+from bench_harness import start_app
+from common import percentile, print_table, summarize
+from stub_llm import start_stub_server
+
+
+def webhook_payload(message_id, sender, text):
+    return {
+        "object": "whatsapp_business_account",
+        "entry": [{
+            "id": "stub-account",
+            "changes": [{
+                "field": "messages",
+                "value": {
+                    "messaging_product": "whatsapp",
+                    "metadata": {"phone_number_id": "stub-phone"},
+                    "contacts": [{"wa_id": sender}],
+                    "messages": [{"id": message_id, "from": sender, "timestamp": str(int(time.time())),
+                                  "type": "text", "text": {"body": text}}],
+                },
+            }],
+        }],
+    }
+
+
+async def post_messages(base_url, args):
+    """Post at a fixed --rate (open loop) for --duration seconds"""
+    import httpx
+
+    latencies, server_times, sent_ids = [], [], []
+    errors = 0
+    limits = httpx.Limits(max_connections=256, max_keepalive_connections=256)
+    async with httpx.AsyncClient(limits=limits, timeout=30) as client:
+        async def post(number):
+            nonlocal errors
+            if sent_ids and random.random() < args.retry_rate:
+                message_id, sender = random.choice(sent_ids)
+            else:
+                message_id, sender = f"wamid.bench{number}", f"1555{number % args.senders:07d}"
+            start = time.perf_counter()
+            try:
+                response = await client.post(base_url + "/webhook/whatsapp", json=webhook_payload(
+                    message_id, sender, f"Do you have eco bottles in stock? #{message_id}"))
+                response.raise_for_status()
+            except Exception:
+                errors += 1
+                return
+            latencies.append(time.perf_counter() - start)
+            # Server-Timing: app;dur=<ms>, the time spent in the app itself
+            server_times.append(float(response.headers["Server-Timing"].split("dur=")[1]) / 1000.0)
+            if response.json()["accepted"]:
+                sent_ids.append((message_id, sender))
+
+        tasks = []
+        start = time.perf_counter()
+        for number in range(int(args.rate * args.duration)):
+            delay = start + number / args.rate - time.perf_counter()
+            if delay > 0:
+                await asyncio.sleep(delay)
+            tasks.append(asyncio.ensure_future(post(number)))
+        await asyncio.gather(*tasks)
+        elapsed = time.perf_counter() - start
+    return latencies, server_times, errors, len(sent_ids), elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rate", type=float, default=50.0, help="webhook posts per second")
+    parser.add_argument("--duration", type=float, default=15.0)
+    parser.add_argument("--senders", type=int, default=500)
+    parser.add_argument("--retry-rate", type=float, default=0.05)
+    parser.add_argument("--latency-ms", type=float, default=50.0)
+    parser.add_argument("--send-ms", type=float, default=5.0)
+    parser.add_argument("--llm-concurrency", type=int, default=32)
+    parser.add_argument("--drain-timeout", type=float, default=120.0)
+    args = parser.parse_args()
+
+    stub, stub_url = start_stub_server(latency_ms=args.latency_ms, jitter_ms=args.latency_ms / 5,
+                                       send_ms=args.send_ms)
+    env = dict(
+        os.environ,
+        HF_INFERENCE_URL=stub_url[:-len("/v1")] + "/hf",
+        HF_MAX_CONCURRENCY=str(args.llm_concurrency),
+        GROQ_API_KEY="",
+        LLM_CACHE="off",
+        WHATSAPP_API_URL=stub_url,
+        WHATSAPP_PHONE_NUMBER_ID="stub-phone",
+        WHATSAPP_TOKEN="stub-token",
+        WHATSAPP_APP_SECRET="",
+        WHATSAPP_INSECURE_WEBHOOK="1",
+        WHATSAPP_DB_PATH=os.path.join(tempfile.mkdtemp(), "whatsapp.sqlite3"),
+        CONVERSATION_DB_PATH=os.path.join(tempfile.mkdtemp(), "conversations.sqlite3"),
+    )
+    sent_log = stub.RequestHandlerClass.config.sent
+    proc, base_url = start_app(env)
+    try:
+        latencies, server_times, errors, accepted, elapsed = asyncio.run(post_messages(base_url, args))
+        deadline = time.perf_counter() + args.drain_timeout
+        while len(sent_log) < accepted and time.perf_counter() < deadline:
+            time.sleep(0.2)
+    finally:
+        proc.terminate()
+        proc.wait(timeout=30)
+        stub.shutdown()
+
+    sent = list(sent_log)
+    ack = summarize("webhook ack", latencies, elapsed)
+    ack.update(server_p50_ms=round(percentile(server_times, 50) * 1000, 2),
+               server_p99_ms=round(percentile(server_times, 99) * 1000, 2),
+               errors=errors, accepted=accepted, redelivered=len(latencies) - accepted)
+    delivery = {"name": "replies delivered", "requests": len(sent)}
+    if len(sent) > 1:
+        first, last = sent[0][0], sent[-1][0]
+        delivery["msgs_per_s"] = round(len(sent) / (last - first), 2) if last > first else None
+    delivery["missing"] = accepted - len({message_id for _, _, message_id in sent})
+    delivery["duplicate_replies"] = len(sent) - len({message_id for _, _, message_id in sent})
+    print_table([ack])
+    print()
+    print_table([delivery])
+
+
+if __name__ == "__main__":
+    main()
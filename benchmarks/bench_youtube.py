@@ -0,0 +1,120 @@
+"""Request-path latency and hit rate of the YouTube video lookup.
+
+Offline: a stub resolver stands in for pytube, taking --resolve-ms per lookup
+and failing for a --failure-rate fraction of queries. --requests lookups
+arrive at --rate per second, with queries drawn from --categories product
+categories by a Zipf-like popularity (a few categories are asked for most).
+Compared:
+
+- blocking: resolve on every request, as get_video_url used to
+- cached: youtube.MediaResolver.lookup, which answers from the TTL cache and
+  resolves misses in the background
+- cached + prefetch: the same, with the most requested categories refreshed
+  before their entries expire
+
+Reports latency in the request path, hit rate (a miss answers without a
+video; blocking's rate is the ceiling, as it only misses failing queries)
+and calls made to the resolver. The TTL is scaled down so that entries
+expire during the run.
+
+    python benchmarks/bench_youtube.py --requests 400 --rate 10 --ttl 5
+"""
+import argparse
+import random
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from common import print_table, summarize
+
+
+class StubResolver:
+    def __init__(self, resolve_ms, failure_rate):
+        self.resolve_ms = resolve_ms
+        self.failure_rate = failure_rate
+        self.calls = 0
+        self._lock = threading.Lock()
+
+    def __call__(self, query):
+        import youtube
+
+        with self._lock:
+            self.calls += 1
+        time.sleep(random.uniform(0.8, 1.2) * self.resolve_ms / 1000.0)
+        # Failures are per query, like a category without a playable video
+        if random.Random(query).random() < self.failure_rate:
+            raise youtube.MediaNotFound(query)
+        return youtube.stub_resolve(query)
+
+
+def queries(args):
+    rng = random.Random(42)
+    weights = [1.0 / (rank + 1) for rank in range(args.categories)]
+    names = [f"eco product category {i}" for i in range(args.categories)]
+    return rng.choices(names, weights=weights, k=args.requests)
+
+
+def run(name, lookup, stream, rate):
+    """Call lookup for each query at a fixed rate (open loop), each in its own request thread"""
+    latencies = []
+
+    def request(query):
+        began = time.perf_counter()
+        found = lookup(query) is not None
+        latencies.append(time.perf_counter() - began)
+        return found
+
+    futures = []
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=64) as pool:
+        for number, query in enumerate(stream):
+            delay = start + number / rate - time.perf_counter()
+            if delay > 0:
+                time.sleep(delay)
+            futures.append(pool.submit(request, query))
+    row = summarize(name, latencies, time.perf_counter() - start)
+    row["hit_rate"] = round(sum(f.result() for f in futures) / len(stream), 3)
+    return row
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--requests", type=int, default=400)
+    parser.add_argument("--rate", type=float, default=10.0, help="lookups per second")
+    parser.add_argument("--categories", type=int, default=30)
+    parser.add_argument("--resolve-ms", type=float, default=400.0)
+    parser.add_argument("--failure-rate", type=float, default=0.1)
+    parser.add_argument("--ttl", type=float, default=5.0, help="seconds a resolved video stays cached")
+    parser.add_argument("--negative-ttl", type=float, default=1.0)
+    parser.add_argument("--prefetch-top", type=int, default=20)
+    args = parser.parse_args()
+
+    import youtube
+
+    stream = queries(args)
+    rows = []
+
+    resolver = StubResolver(args.resolve_ms, args.failure_rate)
+
+    def blocking(query):
+        try:
+            return resolver(youtube.normalize_query(query))
+        except youtube.MediaNotFound:
+            return None
+
+    rows.append(run("blocking", blocking, stream, args.rate))
+    rows[-1]["resolver_calls"] = resolver.calls
+
+    for name, top in (("cached", 0), ("cached + prefetch", args.prefetch_top)):
+        resolver = StubResolver(args.resolve_ms, args.failure_rate)
+        media = youtube.MediaResolver(resolver, ttl=args.ttl, negative_ttl=args.negative_ttl,
+                                      prefetch_top=top, prefetch_interval=args.ttl / 3, prefetch_queries=[])
+        row = run(name, media.lookup, stream, args.rate)
+        row["resolver_calls"] = resolver.calls
+        row["timeouts"] = media.info()["timeouts"]
+        rows.append(row)
+    print_table(rows)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,39 @@
+"""Shared helpers for the benchmark scripts."""
+import os
+import sys
+
+# Make the app modules importable when running ``python benchmarks/<script>.py``
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.append(ROOT)
+
+
+def percentile(values, pct):
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, max(0, int(round(pct / 100.0 * (len(ordered) - 1)))))
+    return ordered[index]
+
+
+def summarize(name, latencies, elapsed):
+    """Build a result row with p50/p95/p99 latency (ms) and throughput."""
+    return {
+        "name": name,
+        "requests": len(latencies),
+        "p50_ms": round(percentile(latencies, 50) * 1000, 2),
+        "p95_ms": round(percentile(latencies, 95) * 1000, 2),
+        "p99_ms": round(percentile(latencies, 99) * 1000, 2),
+        "rps": round(len(latencies) / elapsed, 2) if elapsed else 0.0,
+    }
+
+
+def print_table(rows):
+    if not rows:
+        return
+    columns = []
+    for row in rows:
+        columns.extend(c for c in row if c not in columns)
+    widths = {c: max(len(c), *(len(str(r.get(c, ""))) for r in rows)) for c in columns}
+    print("  ".join(c.ljust(widths[c]) for c in columns))
+    for row in rows:
+        print("  ".join(str(row.get(c, "")).ljust(widths[c]) for c in columns))
@@ -0,0 +1,251 @@
+"""Local OpenAI-, HF-inference-, ElevenLabs- and WhatsApp-compatible stub server used by the benchmarks.
+
+Run standalone with ``python benchmarks/stub_llm.py --port 8001 --latency-ms 50``
+and point the app at it with ``GROQ_BASE_URL=http://127.0.0.1:8001/v1``,
+``HF_INFERENCE_URL=http://127.0.0.1:8001/hf``,
+``ELEVENLABS_BASE_URL=http://127.0.0.1:8001`` and
+``WHATSAPP_API_URL=http://127.0.0.1:8001/v1``.
+"""
+import argparse
+import json
+import random
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+
+class StubConfig:
+    def __init__(self, latency_ms=50.0, jitter_ms=0.0, token_ms=0.0, error_rate=0.0, rate_limit_rps=0.0,
+                 slow_rate=0.0, slow_ms=0.0, prompt_token_ms=0.0, send_ms=5.0):
+        self.latency_ms = latency_ms
+        self.jitter_ms = jitter_ms
+        # Slow tail: this fraction of requests takes slow_ms instead (e.g. 0.05 and 2000)
+        self.slow_rate = slow_rate
+        self.slow_ms = slow_ms
+        # Delay per prompt token (~4 characters), so longer prompts are slower to answer
+        self.prompt_token_ms = prompt_token_ms
+        # Delay per generated token, so streaming clients see tokens trickle in
+        self.token_ms = token_ms
+        # Fraction of requests answered with a random 429/503
+        self.error_rate = error_rate
+        # Server-side request budget; requests over it get a 429 with Retry-After
+        self.rate_limit_rps = rate_limit_rps
+        # WhatsApp message sends take this long; accepted ones are recorded in sent
+        self.send_ms = send_ms
+        self.sent = []
+        self._allowance = rate_limit_rps
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def delay(self, prompt=""):
+        if self.slow_rate and random.random() < self.slow_rate:
+            return self.slow_ms / 1000.0
+        jitter = random.uniform(-self.jitter_ms, self.jitter_ms) if self.jitter_ms else 0.0
+        prefill = self.prompt_token_ms * (len(prompt) // 4)
+        return max(0.0, self.latency_ms + jitter + prefill) / 1000.0
+
+    def throttle(self):
+        """Return ``(status, retry_after_seconds)`` for a rejected request, else None"""
+        if self.error_rate and random.random() < self.error_rate:
+            return random.choice((429, 503)), 0.1
+        if not self.rate_limit_rps:
+            return None
+        with self._lock:
+            now = time.monotonic()
+            self._allowance = min(self.rate_limit_rps, self._allowance + (now - self._updated) * self.rate_limit_rps)
+            self._updated = now
+            if self._allowance >= 1:
+                self._allowance -= 1
+                return None
+            return 429, (1 - self._allowance) / self.rate_limit_rps
+
+
+class StubHandler(BaseHTTPRequestHandler):
+    # HTTP/1.1 so clients can keep connections alive between requests
+    protocol_version = "HTTP/1.1"
+    config = StubConfig()
+
+    def log_message(self, format, *args):
+        pass
+
+    def _read_json(self):
+        length = int(self.headers.get("Content-Length") or 0)
+        body = self.rfile.read(length) if length else b""
+        return json.loads(body or b"{}")
+
+    def _send_json(self, payload, status=200, headers=None):
+        body = json.dumps(payload).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _reject(self):
+        rejected = self.config.throttle()
+        if rejected is None:
+            return False
+        status, wait = rejected
+        self._send_json(
+            {"error": {"message": "stub rate limit", "type": "rate_limit_exceeded"}},
+            status=status,
+            headers={"Retry-After": str(max(1, round(wait))), "retry-after-ms": str(int(wait * 1000))},
+        )
+        return True
+
+    def _send_chunk(self, data):
+        self.wfile.write(f"{len(data):x}\r\n".encode("ascii") + data + b"\r\n")
+        self.wfile.flush()
+
+    def _stream_completion(self, model, prompt):
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.send_header("Transfer-Encoding", "chunked")
+        self.end_headers()
+        for token in completion_text(prompt).split(" "):
+            time.sleep(self.config.token_ms / 1000.0)
+            chunk = chat_completion_chunk(model, token + " ")
+            self._send_chunk(f"data: {json.dumps(chunk)}\n\n".encode("utf-8"))
+        self._send_chunk(b"data: [DONE]\n\n")
+        self._send_chunk(b"")
+
+    def _stream_speech(self, text):
+        # Fake mp3: one chunk per word, token_ms apart, like audio generated incrementally
+        self.send_response(200)
+        self.send_header("Content-Type", "audio/mpeg")
+        self.send_header("Transfer-Encoding", "chunked")
+        self.end_headers()
+        for word in text.split() or [""]:
+            time.sleep(self.config.token_ms / 1000.0)
+            self._send_chunk(speech_chunk(word))
+        self._send_chunk(b"")
+
+    def do_POST(self):
+        payload = self._read_json()
+        speech = "/text-to-speech/" in self.path
+        whatsapp = self.path.endswith("/messages")
+        if (self.path.endswith("/chat/completions") or self.path.startswith("/hf") or speech or whatsapp) \
+                and self._reject():
+            return
+        if whatsapp:
+            # WhatsApp Cloud API: POST /v1/{phone_number_id}/messages {"to": ..., "text": {"body": ...}}
+            time.sleep(self.config.send_ms / 1000.0)
+            self.config.sent.append((time.perf_counter(), payload.get("to"), payload.get("context", {}).get("message_id")))
+            self._send_json({
+                "messaging_product": "whatsapp",
+                "contacts": [{"input": payload.get("to"), "wa_id": payload.get("to")}],
+                "messages": [{"id": f"wamid.stub{len(self.config.sent)}"}],
+            })
+        elif speech:
+            # ElevenLabs: POST /v1/text-to-speech/{voice_id}/stream {"text": ..., "model_id": ...}
+            text = payload.get("text", "")
+            time.sleep(self.config.delay(text))
+            self._stream_speech(text)
+        elif self.path.endswith("/chat/completions"):
+            model = payload.get("model", "stub")
+            prompt = payload.get("messages", [{}])[-1].get("content", "")
+            time.sleep(self.config.delay(prompt))
+            if payload.get("stream"):
+                self._stream_completion(model, prompt)
+                return
+            content = completion_text(prompt)
+            time.sleep(self.config.token_ms * len(content.split(" ")) / 1000.0)
+            self._send_json(chat_completion(model, prompt))
+        elif self.path.startswith("/hf"):
+            # HF text-generation inference: {"inputs": ..., "parameters": {...}}
+            time.sleep(self.config.delay(payload.get("inputs", "")))
+            content = completion_text(payload.get("inputs", ""))
+            time.sleep(self.config.token_ms * len(content.split(" ")) / 1000.0)
+            self._send_json([{"generated_text": content}])
+        else:
+            self._send_json({"error": {"message": f"unknown path {self.path}"}}, status=404)
+
+
+def speech_chunk(word, size=1024):
+    seed = word.encode("utf-8") or b"-"
+    return (seed * (size // len(seed) + 1))[:size]
+
+
+def completion_text(prompt):
+    return f"🔥 Stub reply for: {prompt[:40]} Reply YES now!"
+
+
+def chat_completion_chunk(model, delta):
+    return {
+        "id": "chatcmpl-stub",
+        "object": "chat.completion.chunk",
+        "created": int(time.time()),
+        "model": model,
+        "choices": [{"index": 0, "delta": {"content": delta}, "finish_reason": None}],
+    }
+
+
+def chat_completion(model, prompt):
+    content = completion_text(prompt)
+    return {
+        "id": "chatcmpl-stub",
+        "object": "chat.completion",
+        "created": int(time.time()),
+        "model": model,
+        "choices": [{
+            "index": 0,
+            "message": {"role": "assistant", "content": content},
+            "finish_reason": "stop",
+        }],
+        "usage": {
+            "prompt_tokens": len(prompt) // 4,
+            "completion_tokens": len(content) // 4,
+            "total_tokens": (len(prompt) + len(content)) // 4,
+        },
+    }
+
+
+class StubServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def handle_error(self, request, client_address):
+        # Clients that cancel (e.g. the loser of a hedged request) hang up mid-response
+        if isinstance(sys.exc_info()[1], ConnectionError):
+            return
+        super().handle_error(request, client_address)
+
+
+def start_stub_server(port=0, **config):
+    """Start the stub in a daemon thread and return ``(server, base_url)``.
+
+    The HF text-generation endpoint lives at ``base_url[:-3] + "/hf"``.
+    """
+    handler = type("ConfiguredStubHandler", (StubHandler,), {"config": StubConfig(**config)})
+    server = StubServer(("127.0.0.1", port), handler)
+    # The default backlog of 5 drops connections under load tests
+    server.socket.listen(1024)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f"http://127.0.0.1:{server.server_address[1]}/v1"
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="OpenAI-compatible stub LLM server")
+    parser.add_argument("--port", type=int, default=8001)
+    parser.add_argument("--latency-ms", type=float, default=50.0)
+    parser.add_argument("--jitter-ms", type=float, default=0.0)
+    parser.add_argument("--token-ms", type=float, default=0.0)
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    parser.add_argument("--rate-limit-rps", type=float, default=0.0)
+    parser.add_argument("--slow-rate", type=float, default=0.0)
+    parser.add_argument("--slow-ms", type=float, default=0.0)
+    parser.add_argument("--prompt-token-ms", type=float, default=0.0)
+    parser.add_argument("--send-ms", type=float, default=5.0)
+    args = parser.parse_args()
+    server, url = start_stub_server(args.port, latency_ms=args.latency_ms, jitter_ms=args.jitter_ms,
+                                    token_ms=args.token_ms, error_rate=args.error_rate,
+                                    rate_limit_rps=args.rate_limit_rps, slow_rate=args.slow_rate,
+                                    slow_ms=args.slow_ms, prompt_token_ms=args.prompt_token_ms,
+                                    send_ms=args.send_ms)
+    print(f"Stub LLM listening on {url}")
+    try:
+        threading.Event().wait()
+    except KeyboardInterrupt:
+        server.shutdown()
@@ -0,0 +1,320 @@
+# campaigns.py
+"""Bulk campaign generation jobs.
+
+A job is an uploaded JSONL or CSV file of ``product_info``/``campaign_type``
+rows. Identical rows are generated once, every unique item is persisted to
+sqlite and worked off on the shared event loop with bounded concurrency and a
+requests-per-minute budget, and finished results can be streamed back as JSONL
+(and resumed from an offset) while the job is still running.
+
+Every server worker shares the sqlite file, so each item is claimed by the
+process that works it off: its pid plus a lease (CAMPAIGN_LEASE seconds),
+renewed while the process is alive. On start-up a process resumes only items
+that are unclaimed, whose owner is gone or whose lease has run out, so two
+workers never generate the same item; an item finished twice (after a lease
+ran out under a stalled owner) keeps its first result.
+"""
+import asyncio
+import csv
+import hashlib
+import io
+import json
+import os
+import sqlite3
+import threading
+import time
+import uuid
+
+from dotenv import load_dotenv
+
+import scheduler
+import tracing
+from marketing_helper import acreate_marketing_bundle
+from rate_limit import TokenBucket
+from runtime import runtime
+
+load_dotenv()
+
+CAMPAIGN_DB_PATH = os.getenv("CAMPAIGN_DB_PATH", "campaigns.sqlite3")
+CAMPAIGN_CONCURRENCY = int(os.getenv("CAMPAIGN_CONCURRENCY", "4"))
+# LLM requests per minute the batch worker may spend (each item costs 1 + variations)
+CAMPAIGN_RPM = float(os.getenv("CAMPAIGN_RPM", "120"))
+CAMPAIGN_VARIATIONS = int(os.getenv("CAMPAIGN_VARIATIONS", "2"))
+CAMPAIGN_ITEM_DEADLINE = float(os.getenv("CAMPAIGN_ITEM_DEADLINE", "30"))
+CAMPAIGN_MAX_ROWS = int(os.getenv("CAMPAIGN_MAX_ROWS", "5000"))
+# Seconds a claim on an item lasts without renewal; owners renew every third of it
+CAMPAIGN_LEASE = float(os.getenv("CAMPAIGN_LEASE", "60"))
+
+
+class CampaignError(ValueError):
+    """Raised for uploads that cannot be turned into a job"""
+
+
+def parse_rows(data, filename=""):
+    """Parse an uploaded JSONL or CSV file into (product_info, campaign_type) rows"""
+    text = data.decode("utf-8-sig") if isinstance(data, bytes) else data
+    stripped = text.lstrip()
+    if filename.endswith(".jsonl") or (not filename.endswith(".csv") and stripped.startswith("{")):
+        records = []
+        for number, line in enumerate(text.splitlines(), 1):
+            if not line.strip():
+                continue
+            try:
+                records.append(json.loads(line))
+            except json.JSONDecodeError as e:
+                raise CampaignError(f"line {number} is not valid JSON: {e}")
+    else:
+        records = list(csv.DictReader(io.StringIO(text)))
+
+    rows = []
+    for number, record in enumerate(records, 1):
+        product_info = (record.get("product_info") or "").strip()
+        if not product_info:
+            raise CampaignError(f"row {number} has no product_info")
+        rows.append((product_info, (record.get("campaign_type") or "promotion").strip()))
+    if not rows:
+        raise CampaignError("no rows found")
+    if len(rows) > CAMPAIGN_MAX_ROWS:
+        raise CampaignError(f"too many rows ({len(rows)} > {CAMPAIGN_MAX_ROWS})")
+    return rows
+
+
+def item_key(product_info, campaign_type):
+    normalized = " ".join(product_info.lower().split())
+    return hashlib.sha256(f"{campaign_type}|{normalized}".encode("utf-8")).hexdigest()[:16]
+
+
+class JobStore:
+    """sqlite persistence for jobs and their unique items"""
+
+    def __init__(self, path=CAMPAIGN_DB_PATH):
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.executescript(
+            "CREATE TABLE IF NOT EXISTS jobs ("
+            " id TEXT PRIMARY KEY, created_at REAL NOT NULL, total_rows INTEGER NOT NULL,"
+            " total_items INTEGER NOT NULL, finished_at REAL);"
+            "CREATE TABLE IF NOT EXISTS items ("
+            " job_id TEXT NOT NULL, key TEXT NOT NULL, product_info TEXT NOT NULL,"
+            " campaign_type TEXT NOT NULL, rows TEXT NOT NULL, result TEXT,"
+            " finish_order INTEGER, owner INTEGER, lease_until REAL, PRIMARY KEY (job_id, key));"
+            "CREATE INDEX IF NOT EXISTS items_finished ON items (job_id, finish_order);"
+        )
+        # Stores created before items were claimed
+        columns = {row[1] for row in self._conn.execute("PRAGMA table_info(items)")}
+        for column, kind in (("owner", "INTEGER"), ("lease_until", "REAL")):
+            if column not in columns:
+                self._conn.execute(f"ALTER TABLE items ADD COLUMN {column} {kind}")
+        self._conn.commit()
+
+    def create_job(self, rows):
+        """Store a job, collapsing duplicate rows into one item; returns (job_id, item count)"""
+        job_id = uuid.uuid4().hex
+        items = {}
+        for number, (product_info, campaign_type) in enumerate(rows, 1):
+            key = item_key(product_info, campaign_type)
+            items.setdefault(key, (product_info, campaign_type, []))[2].append(number)
+        with self._lock:
+            self._conn.execute(
+                "INSERT INTO jobs (id, created_at, total_rows, total_items) VALUES (?, ?, ?, ?)",
+                (job_id, time.time(), len(rows), len(items)),
+            )
+            self._conn.executemany(
+                "INSERT INTO items (job_id, key, product_info, campaign_type, rows) VALUES (?, ?, ?, ?, ?)",
+                [(job_id, key, p, c, json.dumps(numbers)) for key, (p, c, numbers) in items.items()],
+            )
+            self._conn.commit()
+        return job_id, len(items)
+
+    def claim_items(self, job_id=None, lease=CAMPAIGN_LEASE):
+        """Claim unfinished items that are unclaimed, orphaned or past their lease; returns this process's"""
+        pid, now = os.getpid(), time.time()
+        scope, args = ("AND job_id = ?", (job_id,)) if job_id is not None else ("", ())
+        with self._lock:
+            owners = [row[0] for row in self._conn.execute(
+                f"SELECT DISTINCT owner FROM items WHERE result IS NULL AND owner IS NOT NULL {scope}", args
+            )]
+            # Other server workers sharing the file keep theirs while they renew the lease
+            orphaned = [owner for owner in owners if owner != pid and not _alive(owner)]
+            self._conn.executemany(
+                f"UPDATE items SET owner = ?, lease_until = ? WHERE result IS NULL AND owner IS ? {scope}",
+                [(pid, now + lease, owner) + args for owner in [None] + orphaned],
+            )
+            self._conn.execute(
+                f"UPDATE items SET owner = ?, lease_until = ? WHERE result IS NULL AND lease_until < ? {scope}",
+                (pid, now + lease, now) + args,
+            )
+            self._conn.commit()
+            return self._conn.execute(
+                f"SELECT job_id, key, product_info, campaign_type FROM items "
+                f"WHERE result IS NULL AND owner = ? {scope}", (pid,) + args
+            ).fetchall()
+
+    def renew_leases(self, lease=CAMPAIGN_LEASE):
+        """Extend the lease on every unfinished item this process owns"""
+        with self._lock:
+            self._conn.execute(
+                "UPDATE items SET lease_until = ? WHERE owner = ? AND result IS NULL",
+                (time.time() + lease, os.getpid()),
+            )
+            self._conn.commit()
+
+    def finish_item(self, job_id, key, result):
+        with self._lock:
+            order = self._conn.execute(
+                "SELECT COALESCE(MAX(finish_order), 0) + 1 FROM items WHERE job_id = ?", (job_id,)
+            ).fetchone()[0]
+            updated = self._conn.execute(
+                "UPDATE items SET result = ?, finish_order = ? WHERE job_id = ? AND key = ? AND result IS NULL",
+                (json.dumps(result), order, job_id, key),
+            ).rowcount
+            if not updated:
+                # Finished by the process that took over after this one's lease ran out
+                self._conn.commit()
+                return
+            remaining = self._conn.execute(
+                "SELECT COUNT(*) FROM items WHERE job_id = ? AND result IS NULL", (job_id,)
+            ).fetchone()[0]
+            if remaining == 0:
+                self._conn.execute("UPDATE jobs SET finished_at = ? WHERE id = ?", (time.time(), job_id))
+            self._conn.commit()
+
+    def job(self, job_id):
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT created_at, total_rows, total_items, finished_at FROM jobs WHERE id = ?", (job_id,)
+            ).fetchone()
+            if row is None:
+                return None
+            done = self._conn.execute(
+                "SELECT COUNT(*) FROM items WHERE job_id = ? AND result IS NOT NULL", (job_id,)
+            ).fetchone()[0]
+        created_at, total_rows, total_items, finished_at = row
+        return {
+            "job_id": job_id,
+            "status": "done" if finished_at else "running",
+            "total_rows": total_rows,
+            "unique_items": total_items,
+            "completed_items": done,
+            "created_at": created_at,
+            "finished_at": finished_at,
+        }
+
+    def results(self, job_id, offset=0):
+        """Finished items in completion order, starting after the first `offset`"""
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT finish_order, product_info, campaign_type, rows, result FROM items "
+                "WHERE job_id = ? AND finish_order > ? ORDER BY finish_order",
+                (job_id, offset),
+            ).fetchall()
+        return [
+            dict(offset=order, product_info=p, campaign_type=c, rows=json.loads(numbers), **json.loads(result))
+            for order, p, c, numbers, result in rows
+        ]
+
+
+def _alive(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
+
+
+class CampaignRunner:
+    """Works off pending items on the shared event loop"""
+
+    def __init__(self, store, concurrency=CAMPAIGN_CONCURRENCY, rpm=CAMPAIGN_RPM):
+        self.store = store
+        self.concurrency = concurrency
+        # Paces the batch evenly; the provider limiters still apply underneath
+        self.limiter = TokenBucket(rpm, burst=1 + CAMPAIGN_VARIATIONS)
+        self._semaphore = None
+        self._renewer = None
+        self._lock = threading.Lock()
+        self._progress = threading.Condition()
+
+    def submit(self, rows):
+        job_id, unique_items = self.store.create_job(rows)
+        self._enqueue(self.store.claim_items(job_id))
+        return job_id, unique_items
+
+    def resume(self):
+        """Re-enqueue items of jobs interrupted by a restart that no live worker is working on"""
+        pending = self.store.claim_items()
+        self._enqueue(pending)
+        return len(pending)
+
+    def _enqueue(self, items):
+        if items and self._renewer is None:
+            with self._lock:
+                if self._renewer is None:
+                    self._renewer = runtime.submit(self._renew(), daemon=True)
+        for job_id, key, product_info, campaign_type in items:
+            runtime.submit(self._run_item(job_id, key, product_info, campaign_type))
+
+    async def _renew(self):
+        tracing.detach()
+        while True:
+            await asyncio.sleep(CAMPAIGN_LEASE / 3)
+            try:
+                await asyncio.to_thread(self.store.renew_leases)
+            except sqlite3.Error as e:
+                print(f"Renewing campaign leases failed: {e}")
+
+    async def _run_item(self, job_id, key, product_info, campaign_type):
+        # Runs in its own task long after the upload responded, so it joins no trace
+        # (its spans would pile onto the upload's); the uploader's tenant (if any) is kept
+        tracing.detach()
+        scheduler.classify("bulk", timeout=0)
+        if self._semaphore is None:
+            self._semaphore = asyncio.Semaphore(self.concurrency)
+        async with self._semaphore:
+            wait = self.limiter.reserve(1 + CAMPAIGN_VARIATIONS)
+            if wait:
+                await asyncio.sleep(wait)
+            try:
+                message, variations = await acreate_marketing_bundle(
+                    product_info, campaign_type, CAMPAIGN_VARIATIONS, deadline=CAMPAIGN_ITEM_DEADLINE
+                )
+                result = {"status": "success", "marketing_message": message, "ab_variations": variations}
+            except Exception as e:
+                print(f"Campaign item {job_id}/{key} failed: {e}")
+                result = {"status": "error", "message": str(e)}
+        await asyncio.to_thread(self.store.finish_item, job_id, key, result)
+        with self._progress:
+            self._progress.notify_all()
+
+    def stream_results(self, job_id, offset=0, poll=1.0):
+        """Yield finished results as JSON lines until the job is complete"""
+        while True:
+            job = self.store.job(job_id)
+            for result in self.store.results(job_id, offset):
+                offset = result["offset"]
+                yield json.dumps(result) + "\n"
+            if job is None or job["status"] == "done":
+                return
+            with self._progress:
+                self._progress.wait(timeout=poll)
+
+
+_campaign_runner = None
+_campaign_runner_lock = threading.Lock()
+
+
+def get_campaign_runner():
+    """Return the process-wide runner, resuming unfinished jobs on first use"""
+    global _campaign_runner
+    if _campaign_runner is None:
+        with _campaign_runner_lock:
+            if _campaign_runner is None:
+                runner = CampaignRunner(JobStore())
+                resumed = runner.resume()
+                if resumed:
+                    print(f"Resumed {resumed} pending campaign item(s)")
+                _campaign_runner = runner
+    return _campaign_runner
@@ -0,0 +1,261 @@
+# conversations.py
+"""Per-session conversation memory for the chat assistant.
+
+Each session ("wa:<phone>" for WhatsApp, "web:<session_id>" for the web
+API) keeps its recent turns verbatim plus a rolling summary of everything
+older. Once the verbatim turns
+exceed CONVERSATION_HISTORY_TOKENS the oldest ones are folded into the
+summary in the background (one LLM call per few turns, not per turn), so the
+context sent with each message stays bounded instead of growing with the
+conversation. build_prompt trims whatever is still over budget.
+
+Active sessions live in memory (LRU); sessions pushed out by
+CONVERSATION_MAX_SESSIONS, and everything at exit, are spilled to sqlite and
+loaded back on their next message.
+"""
+import atexit
+import json
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+from dotenv import load_dotenv
+
+import scheduler
+import tracing
+from rate_limit import estimate_tokens
+from runtime import runtime
+
+load_dotenv()
+
+CONVERSATION_MAX_SESSIONS = int(os.getenv("CONVERSATION_MAX_SESSIONS", "1000"))
+CONVERSATION_DB_PATH = os.getenv("CONVERSATION_DB_PATH", "conversations.sqlite3")
+# Sessions idle for longer than this start over
+CONVERSATION_TTL = float(os.getenv("CONVERSATION_TTL", str(24 * 3600)))
+# Verbatim history allowed before the oldest turns are folded into the summary
+CONVERSATION_HISTORY_TOKENS = int(os.getenv("CONVERSATION_HISTORY_TOKENS", "400"))
+CONVERSATION_SUMMARY_TOKENS = int(os.getenv("CONVERSATION_SUMMARY_TOKENS", "120"))
+# Hard cap on summary + history in a prompt
+CONVERSATION_CONTEXT_TOKENS = int(os.getenv("CONVERSATION_CONTEXT_TOKENS", "600"))
+CONVERSATION_SUMMARY_MODEL = os.getenv("CONVERSATION_SUMMARY_MODEL", "llama3-8b-8192")
+
+SYSTEM_PROMPT = "You are a helpful WhatsApp assistant."
+SUMMARY_PROMPT = (
+    "Update the running summary of a WhatsApp conversation between a customer and an assistant. "
+    "Keep names, products, orders, dates and open questions; drop small talk. "
+    "Answer with the summary only, under {words} words.\n\n"
+    "Summary so far: {summary}\n\nNew messages:\n{turns}\n\nUpdated summary:"
+)
+
+
+def turn_text(user, assistant):
+    return f"User: {user}\nAssistant: {assistant}"
+
+
+def clip_tokens(text, max_tokens, keep="tail"):
+    """Trim text to roughly max_tokens (per estimate_tokens), keeping its head or tail"""
+    max_chars = max_tokens * 4
+    if len(text) <= max_chars:
+        return text
+    return "..." + text[-max_chars:] if keep == "tail" else text[:max_chars] + "..."
+
+
+class Conversation:
+    __slots__ = ("session_id", "summary", "turns", "turn_count", "updated", "compacting")
+
+    def __init__(self, session_id, summary="", turns=(), turn_count=0, updated=None):
+        self.session_id = session_id
+        self.summary = summary
+        self.turns = [tuple(turn) for turn in turns]  # (user, assistant), oldest first
+        self.turn_count = turn_count
+        self.updated = time.time() if updated is None else updated
+        self.compacting = False
+
+    def history_tokens(self):
+        return sum(estimate_tokens(turn_text(*turn)) for turn in self.turns)
+
+    def to_json(self):
+        return json.dumps({"summary": self.summary, "turns": self.turns, "turn_count": self.turn_count})
+
+    @classmethod
+    def from_json(cls, session_id, data, updated):
+        data = json.loads(data)
+        return cls(session_id, data["summary"], data["turns"], data["turn_count"], updated)
+
+
+def context_text(conversation, budget=CONVERSATION_CONTEXT_TOKENS):
+    """The summary plus as many recent turns as fit in budget tokens ("" for a new conversation)"""
+    summary = clip_tokens(conversation.summary, CONVERSATION_SUMMARY_TOKENS) if conversation.summary else ""
+    remaining = budget - estimate_tokens(summary)
+    recent = []
+    for turn in reversed(conversation.turns):
+        text = turn_text(*turn)
+        cost = estimate_tokens(text)
+        if cost > remaining:
+            break
+        recent.append(text)
+        remaining -= cost
+    parts = []
+    if summary:
+        parts.append(f"Conversation so far: {summary}")
+    if recent:
+        parts.append("Recent messages:\n" + "\n".join(reversed(recent)))
+    return "\n\n".join(parts)
+
+
+def build_prompt(conversation, message, budget=CONVERSATION_CONTEXT_TOKENS):
+    """Chat prompt for message with the conversation's bounded context"""
+    context = context_text(conversation, budget)
+    if context:
+        return f"{SYSTEM_PROMPT}\n\n{context}\n\nUser says: {message}\nAssistant:"
+    return f"{SYSTEM_PROMPT} User says: {message}\nAssistant:"
+
+
+class ConversationStore:
+    """LRU of live conversations that spills to sqlite"""
+
+    def __init__(self, path=CONVERSATION_DB_PATH, max_sessions=CONVERSATION_MAX_SESSIONS, ttl=CONVERSATION_TTL):
+        self.path = path
+        self.max_sessions = max_sessions
+        self.ttl = ttl
+        self._sessions = OrderedDict()
+        self._lock = threading.Lock()
+        self._conn = None
+        self.stats = {"loaded": 0, "spilled": 0, "expired": 0, "compactions": 0, "compaction_errors": 0}
+
+    def _db(self):
+        # Opened on first spill so stateless deployments never create the file
+        if self._conn is None:
+            self._conn = sqlite3.connect(self.path, check_same_thread=False)
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS conversations ("
+                " session_id TEXT PRIMARY KEY, data TEXT NOT NULL, updated REAL NOT NULL)"
+            )
+            self._conn.commit()
+        return self._conn
+
+    def _load(self, session_id):
+        if self._conn is None and not os.path.exists(self.path):
+            return None
+        row = self._db().execute(
+            "SELECT data, updated FROM conversations WHERE session_id = ?", (session_id,)
+        ).fetchone()
+        if row is None:
+            return None
+        self.stats["loaded"] += 1
+        return Conversation.from_json(session_id, *row)
+
+    def _spill(self, conversations):
+        self._db().executemany(
+            "INSERT OR REPLACE INTO conversations (session_id, data, updated) VALUES (?, ?, ?)",
+            [(c.session_id, c.to_json(), c.updated) for c in conversations],
+        )
+        self._conn.commit()
+        self.stats["spilled"] += len(conversations)
+
+    def get(self, session_id):
+        """The session's conversation, loading it from sqlite or starting a new one"""
+        with self._lock:
+            conversation = self._sessions.pop(session_id, None)
+            if conversation is None:
+                conversation = self._load(session_id)
+            if conversation is not None and time.time() - conversation.updated > self.ttl:
+                self.stats["expired"] += 1
+                conversation = None
+            if conversation is None:
+                conversation = Conversation(session_id)
+            self._sessions[session_id] = conversation
+            evicted = []
+            while len(self._sessions) > self.max_sessions:
+                evicted.append(self._sessions.popitem(last=False)[1])
+            if evicted:
+                self._spill(evicted)
+        return conversation
+
+    def add_turn(self, conversation, user, assistant):
+        """Append a finished turn; folds old turns into the summary in the background when due"""
+        with self._lock:
+            conversation.turns.append((user, assistant))
+            conversation.turn_count += 1
+            conversation.updated = time.time()
+            due = not conversation.compacting and conversation.history_tokens() > CONVERSATION_HISTORY_TOKENS
+            if due:
+                conversation.compacting = True
+        if due:
+            return runtime.submit(self.compact(conversation))
+        return None
+
+    async def compact(self, conversation):
+        """Fold the oldest turns into the summary until history is back under half its budget"""
+        with self._lock:
+            folded, tokens = 0, conversation.history_tokens()
+            while folded < len(conversation.turns) - 1 and tokens > CONVERSATION_HISTORY_TOKENS // 2:
+                tokens -= estimate_tokens(turn_text(*conversation.turns[folded]))
+                folded += 1
+            turns = conversation.turns[:folded]
+            previous = conversation.summary
+        if not turns:
+            conversation.compacting = False
+            return
+        # Summaries are background work, even when a chat turn triggered them
+        schedule_token = scheduler.classify("bulk", timeout=0)
+        try:
+            with tracing.span("conversation.compact", turns=folded):
+                summary = await self._summarize(previous, turns)
+            with self._lock:
+                conversation.summary = summary
+                # New turns may have been appended meanwhile; only drop the ones summarized
+                del conversation.turns[:folded]
+                self.stats["compactions"] += 1
+                if self._sessions.get(conversation.session_id) is not conversation:
+                    # Spilled while we were summarizing; the stored copy is stale
+                    self._spill([conversation])
+        finally:
+            scheduler.reset(schedule_token)
+            conversation.compacting = False
+
+    async def _summarize(self, previous, turns):
+        text = "\n".join(turn_text(*turn) for turn in turns)
+        from marketing_helper import GROQ_API_KEY, acomplete_groq
+        if GROQ_API_KEY:
+            prompt = SUMMARY_PROMPT.format(words=CONVERSATION_SUMMARY_TOKENS * 3 // 4,
+                                           summary=previous or "(none)", turns=text)
+            try:
+                summary = await acomplete_groq(prompt, model=CONVERSATION_SUMMARY_MODEL,
+                                               max_tokens=CONVERSATION_SUMMARY_TOKENS, temperature=0.2)
+                return clip_tokens(summary, CONVERSATION_SUMMARY_TOKENS, keep="head")
+            except Exception as e:
+                print(f"Conversation summary error: {e}")
+                self.stats["compaction_errors"] += 1
+                tracing.fallback("conversation_summary")
+        # Without the LLM keep the most recent part of the transcript
+        return clip_tokens(f"{previous}\n{text}".strip(), CONVERSATION_SUMMARY_TOKENS)
+
+    def flush(self):
+        """Spill every live conversation to sqlite (called at exit)"""
+        with self._lock:
+            live = [c for c in self._sessions.values() if c.turns or c.summary]
+            if live:
+                self._spill(live)
+
+    def info(self):
+        with self._lock:
+            return dict(self.stats, live_sessions=len(self._sessions))
+
+
+_conversation_store = None
+_conversation_store_lock = threading.Lock()
+
+
+def get_conversation_store():
+    """Return the process-wide store, spilled to sqlite when the process exits"""
+    global _conversation_store
+    if _conversation_store is None:
+        with _conversation_store_lock:
+            if _conversation_store is None:
+                _conversation_store = ConversationStore()
+                atexit.register(_conversation_store.flush)
+    return _conversation_store
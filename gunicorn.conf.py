@@ -0,0 +1,61 @@
+# gunicorn.conf.py
+"""Production server profile: ``gunicorn -c gunicorn.conf.py``.
+
+The app is imported once in the master (see wsgi.py) and forked into
+WEB_CONCURRENCY workers of GUNICORN_THREADS threads each. Each worker runs
+its own event loop and provider limiters, so the GROQ_/HF_MAX_CONCURRENCY
+limits apply per worker. On SIGTERM a worker stops accepting connections,
+finishes its in-flight requests (up to GUNICORN_GRACEFUL_TIMEOUT) and then
+drains background LLM work (summaries, campaign items) for up to
+DRAIN_TIMEOUT seconds before exiting.
+
+WEB_CONCURRENCY defaults to 1. Conversation memory (the live-session LRU),
+the voice AudioCache's size index and byte budget, and WhatsApp's per-sender
+ordering live in process memory and are not shared between workers, so with
+more than one worker a conversation can be served from a stale copy, the
+audio directory can grow past TTS_CACHE_MAX_BYTES and two messages from
+one sender can be answered out of order. Scale with GUNICORN_THREADS
+instead.
+
+Set GUNICORN_WORKER_CLASS=uvicorn.workers.UvicornWorker to serve asgi.py
+with uvicorn workers instead.
+"""
+import os
+
+worker_class = os.getenv("GUNICORN_WORKER_CLASS", "gthread")
+wsgi_app = "asgi:application" if "uvicorn" in worker_class else "wsgi:application"
+bind = os.getenv("GUNICORN_BIND", f"0.0.0.0:{os.getenv('PORT', '5000')}")
+workers = int(os.getenv("WEB_CONCURRENCY", "1"))
+# Threads per worker; SSE responses hold one for the whole stream
+threads = int(os.getenv("GUNICORN_THREADS", "16"))
+preload_app = True
+# LLM calls and streams can take longer than gunicorn's 30s default
+timeout = int(os.getenv("GUNICORN_TIMEOUT", "120"))
+graceful_timeout = int(os.getenv("GUNICORN_GRACEFUL_TIMEOUT", "30"))
+keepalive = int(os.getenv("GUNICORN_KEEPALIVE", "5"))
+# Recycle workers now and then to cap slow memory growth
+max_requests = int(os.getenv("GUNICORN_MAX_REQUESTS", "0"))
+max_requests_jitter = max_requests // 10
+backlog = 1024
+accesslog = os.getenv("GUNICORN_ACCESS_LOG") or None
+errorlog = "-"
+
+DRAIN_TIMEOUT = float(os.getenv("DRAIN_TIMEOUT", "20"))
+
+
+def post_fork(server, worker):
+    import app
+
+    if app.WARMUP_ON_START:
+        app.start_warm_up()
+
+
+def worker_exit(server, worker):
+    # In-flight requests are done; let WhatsApp replies already generated go
+    # out, then background LLM work finish. Live conversations are spilled to
+    # sqlite by their atexit hook afterwards.
+    import whatsapp
+    from runtime import runtime
+
+    whatsapp.drain_gateway(DRAIN_TIMEOUT)
+    runtime.shutdown(timeout=DRAIN_TIMEOUT)
@@ -0,0 +1,335 @@
+# llm_cache.py
+"""Response cache for LLM generations.
+
+Lookups are exact on (normalized prompt, model, max_tokens, temperature bucket)
+with an optional near-duplicate fallback that compares hashed n-gram
+embeddings of the prompt. Entries expire after a TTL and the least recently
+used ones are evicted once the memory budget is exceeded.
+"""
+import hashlib
+import os
+import re
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+from dotenv import load_dotenv
+
+import tracing
+
+load_dotenv()
+
+LLM_CACHE = os.getenv("LLM_CACHE", "memory")  # memory | sqlite | off
+LLM_CACHE_TTL = float(os.getenv("LLM_CACHE_TTL", "3600"))
+LLM_CACHE_MAX_BYTES = int(os.getenv("LLM_CACHE_MAX_BYTES", str(16 * 1024 * 1024)))
+LLM_CACHE_PATH = os.getenv("LLM_CACHE_PATH", "llm_cache.sqlite3")
+# Cosine similarity needed for a near-duplicate hit; 0 disables semantic lookup
+LLM_CACHE_SEMANTIC_THRESHOLD = float(os.getenv("LLM_CACHE_SEMANTIC_THRESHOLD", "0"))
+LLM_CACHE_SEMANTIC_MAX_ENTRIES = int(os.getenv("LLM_CACHE_SEMANTIC_MAX_ENTRIES", "2048"))
+
+_WHITESPACE_RE = re.compile(r"\s+")
+
+
+def normalize_prompt(prompt):
+    return _WHITESPACE_RE.sub(" ", prompt).strip().lower()
+
+
+def cache_scope(model, max_tokens, temperature):
+    """Everything except the prompt that must match for a cached answer to be reusable"""
+    return f"{model}|{max_tokens}|{round(float(temperature), 1)}"
+
+
+def make_key(prompt, model, max_tokens, temperature):
+    raw = f"{cache_scope(model, max_tokens, temperature)}|{normalize_prompt(prompt)}"
+    return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+
+class CacheStats:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.semantic_hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+        self.stores = 0
+
+    def incr(self, name, amount=1):
+        with self._lock:
+            setattr(self, name, getattr(self, name) + amount)
+
+    def as_dict(self):
+        with self._lock:
+            return {
+                "hits": self.hits,
+                "semantic_hits": self.semantic_hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "expirations": self.expirations,
+                "stores": self.stores,
+            }
+
+
+class MemoryBackend:
+    """In-process LRU store with TTL and a byte budget"""
+
+    def __init__(self, max_bytes=LLM_CACHE_MAX_BYTES, ttl=LLM_CACHE_TTL, stats=None):
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self.stats = stats or CacheStats()
+        self._entries = OrderedDict()  # key -> (value, expires_at, size)
+        self._bytes = 0
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            value, expires_at, size = entry
+            if expires_at < time.time():
+                del self._entries[key]
+                self._bytes -= size
+                self.stats.incr("expirations")
+                return None
+            self._entries.move_to_end(key)
+            return value
+
+    def set(self, key, value):
+        size = len(key) + len(value.encode("utf-8"))
+        if size > self.max_bytes:
+            return
+        with self._lock:
+            old = self._entries.pop(key, None)
+            if old is not None:
+                self._bytes -= old[2]
+            self._entries[key] = (value, time.time() + self.ttl, size)
+            self._bytes += size
+            while self._bytes > self.max_bytes:
+                _, (_, _, evicted_size) = self._entries.popitem(last=False)
+                self._bytes -= evicted_size
+                self.stats.incr("evictions")
+
+    def info(self):
+        with self._lock:
+            return {"backend": "memory", "entries": len(self._entries), "bytes": self._bytes,
+                    "max_bytes": self.max_bytes}
+
+
+class SqliteBackend:
+    """Disk-backed LRU store so cached generations survive restarts"""
+
+    def __init__(self, path=LLM_CACHE_PATH, max_bytes=LLM_CACHE_MAX_BYTES, ttl=LLM_CACHE_TTL,
+                 stats=None):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self.stats = stats or CacheStats()
+        self._lock = threading.Lock()
+        # Recency from hits, written with the next set() rather than committed on every read
+        self._touched = {}  # key -> last access
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS entries ("
+            "key TEXT PRIMARY KEY, value TEXT NOT NULL, size INTEGER NOT NULL, "
+            "expires_at REAL NOT NULL, last_access REAL NOT NULL)"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS entries_lru ON entries (last_access)")
+        self._conn.commit()
+
+    def get(self, key):
+        now = time.time()
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT value, expires_at FROM entries WHERE key = ?", (key,)
+            ).fetchone()
+            if row is None:
+                return None
+            if row[1] < now:
+                self._conn.execute("DELETE FROM entries WHERE key = ?", (key,))
+                self._conn.commit()
+                self.stats.incr("expirations")
+                return None
+            self._touched[key] = now
+            return row[0]
+
+    def _flush_touched(self):
+        if self._touched:
+            self._conn.executemany("UPDATE entries SET last_access = ? WHERE key = ?",
+                                   [(at, key) for key, at in self._touched.items()])
+            self._touched.clear()
+
+    def set(self, key, value):
+        size = len(key) + len(value.encode("utf-8"))
+        if size > self.max_bytes:
+            return
+        now = time.time()
+        with self._lock:
+            # Eviction below picks by last_access, so pending hits must land first
+            self._flush_touched()
+            self._conn.execute(
+                "INSERT OR REPLACE INTO entries (key, value, size, expires_at, last_access) "
+                "VALUES (?, ?, ?, ?, ?)",
+                (key, value, size, now + self.ttl, now),
+            )
+            total = self._conn.execute("SELECT COALESCE(SUM(size), 0) FROM entries").fetchone()[0]
+            while total > self.max_bytes:
+                oldest = self._conn.execute(
+                    "SELECT key, size FROM entries ORDER BY last_access LIMIT 1"
+                ).fetchone()
+                self._conn.execute("DELETE FROM entries WHERE key = ?", (oldest[0],))
+                total -= oldest[1]
+                self.stats.incr("evictions")
+            self._conn.commit()
+
+    def info(self):
+        with self._lock:
+            entries, total = self._conn.execute(
+                "SELECT COUNT(*), COALESCE(SUM(size), 0) FROM entries"
+            ).fetchone()
+        return {"backend": "sqlite", "path": self.path, "entries": entries, "bytes": total,
+                "max_bytes": self.max_bytes}
+
+
+class HashingEmbedder:
+    """Cheap local embedding: hashed character trigrams, L2-normalized"""
+
+    def __init__(self, dim=512):
+        self.dim = dim
+
+    def __call__(self, text):
+        import numpy as np
+        text = f" {normalize_prompt(text)} "
+        vector = np.zeros(self.dim, dtype=np.float32)
+        for i in range(len(text) - 2):
+            digest = hashlib.blake2b(text[i:i + 3].encode("utf-8"), digest_size=4).digest()
+            vector[int.from_bytes(digest, "little") % self.dim] += 1.0
+        norm = np.linalg.norm(vector)
+        return vector / norm if norm else vector
+
+
+class SemanticIndex:
+    """Brute-force cosine index of prompt embeddings, grouped by cache scope"""
+
+    def __init__(self, embedder=None, max_entries=LLM_CACHE_SEMANTIC_MAX_ENTRIES):
+        self.embedder = embedder or HashingEmbedder()
+        self.max_entries = max_entries
+        self._scopes = {}  # scope -> {key: vector}
+        self._matrices = {}  # scope -> (keys, stacked vectors), rebuilt lazily
+        # One recency order across all scopes, so a busy scope cannot evict the others wholesale
+        self._lru = OrderedDict()  # (scope, key) -> None
+        self._lock = threading.Lock()
+
+    def add(self, scope, key, prompt):
+        vector = self.embedder(prompt)
+        with self._lock:
+            self._scopes.setdefault(scope, {})[key] = vector
+            self._lru[(scope, key)] = None
+            self._lru.move_to_end((scope, key))
+            self._matrices.pop(scope, None)
+            while len(self._lru) > self.max_entries:
+                (oldest_scope, oldest_key), _ = self._lru.popitem(last=False)
+                self._remove(oldest_scope, oldest_key)
+
+    def discard(self, scope, key):
+        with self._lock:
+            if (scope, key) in self._lru:
+                del self._lru[(scope, key)]
+                self._remove(scope, key)
+
+    def _remove(self, scope, key):
+        entries = self._scopes[scope]
+        del entries[key]
+        if not entries:
+            del self._scopes[scope]
+        self._matrices.pop(scope, None)
+
+    def nearest(self, scope, prompt, threshold):
+        """Return the key of the most similar prompt in scope, if above threshold"""
+        import numpy as np
+        with self._lock:
+            entries = self._scopes.get(scope)
+            if not entries:
+                return None
+            matrix = self._matrices.get(scope)
+            if matrix is None:
+                matrix = (list(entries.keys()), np.vstack(list(entries.values())))
+                self._matrices[scope] = matrix
+        keys, vectors = matrix
+        scores = vectors @ self.embedder(prompt)
+        best = int(np.argmax(scores))
+        if scores[best] < threshold:
+            return None
+        with self._lock:
+            if (scope, keys[best]) in self._lru:
+                self._lru.move_to_end((scope, keys[best]))
+        return keys[best]
+
+
+class ResponseCache:
+    """Exact + optional near-duplicate cache in front of an LLM call"""
+
+    def __init__(self, backend, semantic_threshold=0.0, semantic_index=None):
+        self.backend = backend
+        self.stats = backend.stats
+        self.semantic_threshold = semantic_threshold
+        self.semantic_index = semantic_index
+        if semantic_threshold and semantic_index is None:
+            self.semantic_index = SemanticIndex()
+
+    def lookup(self, prompt, model, max_tokens, temperature):
+        key = make_key(prompt, model, max_tokens, temperature)
+        value = self.backend.get(key)
+        if value is not None:
+            self.stats.incr("hits")
+            tracing.current().event("cache_hit", model=model)
+            return value
+        if self.semantic_index is not None:
+            scope = cache_scope(model, max_tokens, temperature)
+            near_key = self.semantic_index.nearest(scope, prompt, self.semantic_threshold)
+            if near_key is not None:
+                value = self.backend.get(near_key)
+                if value is not None:
+                    self.stats.incr("semantic_hits")
+                    tracing.current().event("cache_hit", model=model, semantic=True)
+                    return value
+                # The backend already evicted or expired it
+                self.semantic_index.discard(scope, near_key)
+        self.stats.incr("misses")
+        tracing.current().event("cache_miss", model=model)
+        return None
+
+    def store(self, prompt, model, max_tokens, temperature, value):
+        key = make_key(prompt, model, max_tokens, temperature)
+        self.backend.set(key, value)
+        self.stats.incr("stores")
+        if self.semantic_index is not None:
+            self.semantic_index.add(cache_scope(model, max_tokens, temperature), key, prompt)
+
+    def info(self):
+        info = self.backend.info()
+        info.update(self.stats.as_dict())
+        info["semantic_threshold"] = self.semantic_threshold
+        return info
+
+
+_response_cache = None
+_response_cache_lock = threading.Lock()
+
+
+def get_response_cache():
+    """Return the process-wide cache configured from LLM_CACHE_*, or None when disabled"""
+    global _response_cache
+    if LLM_CACHE == "off":
+        return None
+    if _response_cache is None:
+        with _response_cache_lock:
+            if _response_cache is None:
+                if LLM_CACHE == "sqlite":
+                    backend = SqliteBackend()
+                else:
+                    backend = MemoryBackend()
+                _response_cache = ResponseCache(backend, LLM_CACHE_SEMANTIC_THRESHOLD)
+    return _response_cache
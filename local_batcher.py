@@ -0,0 +1,261 @@
+# local_batcher.py
+"""Micro-batching worker for the local distilgpt2 fallback model.
+
+Concurrent callers submit prompts to a bounded queue. A single worker thread
+collects whatever arrives within LOCAL_BATCH_WAIT_MS (up to
+LOCAL_BATCH_SIZE prompts), left-pads them and runs one batched ``generate``,
+then resolves each caller's future with its own continuation.
+
+LOCAL_BACKEND picks how the model runs on CPU:
+
+- ``torch``: the fp32 PyTorch model in eager mode (default)
+- ``torch-int8``: the same model with its linear layers dynamically quantized
+  to int8 by ``torch.ao`` (needs no extra packages)
+- ``onnx-int8``: the model exported to ONNX with past key/values inputs and
+  dynamically quantized to int8, run by ONNX Runtime (needs
+  ``optimum[onnxruntime]``). The export runs once and is kept in LOCAL_ONNX_DIR.
+
+All three decode incrementally, reusing the key/value cache of earlier
+positions, and work with the same batched ``generate`` call.
+"""
+import os
+import queue
+import threading
+import time
+from concurrent.futures import Future
+
+from dotenv import load_dotenv
+
+load_dotenv()
+
+LOCAL_MODEL = os.getenv("LOCAL_MODEL", "distilgpt2")
+LOCAL_BATCH_SIZE = int(os.getenv("LOCAL_BATCH_SIZE", "16"))
+LOCAL_BATCH_WAIT_MS = float(os.getenv("LOCAL_BATCH_WAIT_MS", "5"))
+LOCAL_QUEUE_SIZE = int(os.getenv("LOCAL_QUEUE_SIZE", "128"))
+LOCAL_TIMEOUT = float(os.getenv("LOCAL_TIMEOUT", "30"))
+LOCAL_BACKEND = os.getenv("LOCAL_BACKEND", "torch")  # torch | torch-int8 | onnx-int8
+LOCAL_ONNX_DIR = os.getenv("LOCAL_ONNX_DIR", ".onnx_models")
+# After a failed model load, callers fail fast for this many seconds before it is tried again
+LOCAL_LOAD_RETRY = float(os.getenv("LOCAL_LOAD_RETRY", "300"))
+
+
+class LocalBackendBusy(Exception):
+    """Raised when the inference queue is full and the caller should fall back"""
+
+
+class LocalBackendUnavailable(Exception):
+    """Raised while the model cannot be loaded (e.g. no network to fetch it)"""
+
+
+def load_tokenizer(model_name=LOCAL_MODEL):
+    from transformers import AutoTokenizer
+
+    tokenizer = AutoTokenizer.from_pretrained(model_name)
+    # GPT-2 has no pad token; pad on the left so every row ends at the prompt
+    tokenizer.pad_token = tokenizer.eos_token
+    tokenizer.padding_side = "left"
+    return tokenizer
+
+
+def load_model(model_name=LOCAL_MODEL):
+    """Load the causal LM and a left-padding tokenizer for batched generation"""
+    from transformers import AutoModelForCausalLM
+
+    model = AutoModelForCausalLM.from_pretrained(model_name)
+    model.eval()
+    return model, load_tokenizer(model_name)
+
+
+def _conv1d_to_linear(model):
+    """Swap GPT-2's Conv1D projections for equivalent nn.Linear layers, which torch.ao can quantize"""
+    import torch
+    from transformers.pytorch_utils import Conv1D
+
+    for module in list(model.modules()):
+        for name, child in list(module.named_children()):
+            if isinstance(child, Conv1D):
+                # Conv1D keeps its weight as (in, out); Linear wants (out, in). A transposed
+                # view avoids copying, and the meta device skips allocating a weight to overwrite
+                linear = torch.nn.Linear(child.weight.shape[0], child.weight.shape[1], device="meta")
+                linear.weight = torch.nn.Parameter(child.weight.data.t(), requires_grad=False)
+                linear.bias = torch.nn.Parameter(child.bias.data, requires_grad=False)
+                setattr(module, name, linear)
+    return model
+
+
+def load_quantized_model(model_name=LOCAL_MODEL):
+    """The fp32 model with int8 dynamically quantized linear layers (weights int8, activations
+    quantized per batch), including the output projection over the vocabulary"""
+    import torch
+
+    model, tokenizer = load_model(model_name)
+    # In place, so the fp32 copies of the quantized weights are freed
+    torch.ao.quantization.quantize_dynamic(_conv1d_to_linear(model), {torch.nn.Linear}, dtype=torch.qint8,
+                                           inplace=True)
+    return model, tokenizer
+
+
+def load_onnx_model(model_name=LOCAL_MODEL, export_dir=LOCAL_ONNX_DIR):
+    """Export the model to ONNX (with past key/values) and quantize it to int8 once, then load
+    it in ONNX Runtime"""
+    from optimum.onnxruntime import ORTModelForCausalLM
+
+    path = os.path.join(export_dir, model_name.strip("/").replace("/", "--"))
+    if not os.path.exists(os.path.join(path, "model_quantized.onnx")):
+        from optimum.onnxruntime import ORTQuantizer
+        from optimum.onnxruntime.configuration import AutoQuantizationConfig
+
+        start = time.perf_counter()
+        exported = ORTModelForCausalLM.from_pretrained(model_name, export=True, use_cache=True)
+        config = AutoQuantizationConfig.avx2(is_static=False, per_channel=False)
+        ORTQuantizer.from_pretrained(exported).quantize(save_dir=path, quantization_config=config)
+        load_tokenizer(model_name).save_pretrained(path)
+        print(f"Exported {model_name} to int8 ONNX in {time.perf_counter() - start:.1f}s")
+    model = ORTModelForCausalLM.from_pretrained(path, file_name="model_quantized.onnx", use_cache=True)
+    return model, load_tokenizer(path)
+
+
+LOADERS = {"torch": load_model, "torch-int8": load_quantized_model, "onnx-int8": load_onnx_model}
+
+
+class _Request:
+    __slots__ = ("prompt", "max_new_tokens", "future", "enqueued_at")
+
+    def __init__(self, prompt, max_new_tokens):
+        self.prompt = prompt
+        self.max_new_tokens = max_new_tokens
+        self.future = Future()
+        self.enqueued_at = time.perf_counter()
+
+
+class BatchingGenerator:
+    def __init__(self, loader=load_model, max_batch_size=LOCAL_BATCH_SIZE,
+                 max_wait_ms=LOCAL_BATCH_WAIT_MS, max_queue=LOCAL_QUEUE_SIZE):
+        self.loader = loader
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait_ms / 1000.0
+        self._queue = queue.Queue(maxsize=max_queue)
+        self._model = None
+        self._tokenizer = None
+        self._thread = None
+        self._pid = None
+        self._load_error = None  # (time.monotonic(), exception) of the last failed load
+        self._lock = threading.Lock()
+        self.batches = 0
+        self.requests = 0
+
+    def load(self):
+        """Load the model without starting the worker, e.g. before forking server workers"""
+        if self._model is None:
+            with self._lock:
+                if self._model is None:
+                    failed = self._load_error
+                    if failed is not None and time.monotonic() - failed[0] < LOCAL_LOAD_RETRY:
+                        raise LocalBackendUnavailable(f"local model failed to load: {failed[1]}")
+                    try:
+                        self._model, self._tokenizer = self.loader()
+                    except Exception as e:
+                        self._load_error = (time.monotonic(), e)
+                        raise
+        return self
+
+    def start(self):
+        """Load the model and start the worker thread (again after a fork; idempotent)"""
+        if self._thread is None or self._pid != os.getpid():
+            self.load()
+            with self._lock:
+                if self._thread is None or self._pid != os.getpid():
+                    self._pid = os.getpid()
+                    self._thread = threading.Thread(
+                        target=self._run, name="local-batcher", daemon=True
+                    )
+                    self._thread.start()
+        return self
+
+    def submit(self, prompt, max_new_tokens=60):
+        """Queue a prompt and return a Future for its generated continuation"""
+        self.start()
+        request = _Request(prompt, max_new_tokens)
+        try:
+            self._queue.put_nowait(request)
+        except queue.Full:
+            raise LocalBackendBusy(f"local inference queue is full ({self._queue.maxsize} pending)")
+        return request.future
+
+    def generate(self, prompt, max_new_tokens=60, timeout=LOCAL_TIMEOUT):
+        return self.submit(prompt, max_new_tokens).result(timeout=timeout)
+
+    def stats(self):
+        return {
+            "batches": self.batches,
+            "requests": self.requests,
+            "avg_batch_size": round(self.requests / self.batches, 2) if self.batches else 0.0,
+            "queue_depth": self._queue.qsize(),
+        }
+
+    def _collect(self):
+        batch = [self._queue.get()]
+        deadline = time.perf_counter() + self.max_wait
+        while len(batch) < self.max_batch_size:
+            remaining = deadline - time.perf_counter()
+            if remaining <= 0:
+                break
+            try:
+                batch.append(self._queue.get(timeout=remaining))
+            except queue.Empty:
+                break
+        return batch
+
+    def _run(self):
+        while True:
+            batch = [r for r in self._collect() if r.future.set_running_or_notify_cancel()]
+            if not batch:
+                continue
+            try:
+                outputs = self._generate_batch(
+                    [r.prompt for r in batch], max(r.max_new_tokens for r in batch)
+                )
+            except Exception as e:
+                print(f"Error with local batch of {len(batch)}: {e}")
+                for request in batch:
+                    request.future.set_exception(e)
+                continue
+            self.batches += 1
+            self.requests += len(batch)
+            for request, text in zip(batch, outputs):
+                request.future.set_result(text)
+
+    def _generate_batch(self, prompts, max_new_tokens):
+        import torch
+
+        max_prompt_tokens = getattr(self._model.config, "n_positions", 1024) - max_new_tokens
+        inputs = self._tokenizer(
+            prompts, return_tensors="pt", padding=True, truncation=True,
+            max_length=max_prompt_tokens,
+        )
+        with torch.inference_mode():
+            output_ids = self._model.generate(
+                **inputs,
+                max_new_tokens=max_new_tokens,
+                do_sample=True,
+                pad_token_id=self._tokenizer.pad_token_id,
+            )
+        # Left padding means every prompt ends at the same column
+        new_tokens = output_ids[:, inputs["input_ids"].shape[1]:]
+        return [t.strip() for t in self._tokenizer.batch_decode(new_tokens, skip_special_tokens=True)]
+
+
+_local_batcher = None
+_local_batcher_lock = threading.Lock()
+
+
+def get_local_batcher():
+    """Return the process-wide batcher for LOCAL_BACKEND (the model loads on first submit)"""
+    global _local_batcher
+    if _local_batcher is None:
+        with _local_batcher_lock:
+            if _local_batcher is None:
+                if LOCAL_BACKEND not in LOADERS:
+                    raise ValueError(f"unknown LOCAL_BACKEND {LOCAL_BACKEND!r}, expected one of {sorted(LOADERS)}")
+                _local_batcher = BatchingGenerator(loader=LOADERS[LOCAL_BACKEND])
+    return _local_batcher
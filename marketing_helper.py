@@ -1,11 +1,18 @@
 # marketing_helper.py
-from huggingface_hub import InferenceClient
 import os
 from dotenv import load_dotenv
 import time
 import random
-from transformers import pipeline
-import openai
+import asyncio
+import threading
+import weakref
+from llm_cache import get_response_cache, make_key
+from prompts import API_KEY_MISSING, clean_message, get_templates
+from local_batcher import LOCAL_TIMEOUT, get_local_batcher
+from rate_limit import estimate_tokens, get_limiter
+from router import NoBackendAvailable, get_router, register_provider
+from singleflight import get_flight_group
+import tracing
 
 # Load environment variables
 load_dotenv()
@@ -13,12 +20,26 @@ load_dotenv()
 # Get API token from environment variables
 HF_TOKEN = os.getenv("HUGGINGFACE_API_KEY")
 GROQ_API_KEY = os.getenv("GROQ_API_KEY")
+GROQ_BASE_URL = os.getenv("GROQ_BASE_URL", "https://api.groq.com/openai/v1")
+GROQ_TIMEOUT = float(os.getenv("GROQ_TIMEOUT", "30"))
+GROQ_MAX_CONNECTIONS = int(os.getenv("GROQ_MAX_CONNECTIONS", "20"))
+GROQ_TEMPERATURE = 0.8
 
-# Initialize the Hugging Face inference client
-client = InferenceClient(token=HF_TOKEN)
+# Heavy clients and models are created on first use so importing this module
+# (and starting the app) stays fast; the local model is only a fallback.
+_hf_client = None
+_lazy_lock = threading.Lock()
 
-# Initialize the local text generation pipeline once
-generator = pipeline("text-generation", model="distilgpt2")
+
+def get_hf_client():
+    """Return the shared Hugging Face inference client"""
+    global _hf_client
+    if _hf_client is None:
+        with _lazy_lock:
+            if _hf_client is None:
+                from huggingface_hub import InferenceClient
+                _hf_client = InferenceClient(token=HF_TOKEN)
+    return _hf_client
 
 
 # Template messages for fallback scenarios
@@ -29,83 +50,334 @@ FALLBACK_TEMPLATES = [
     "⚡ FLASH SALE on {product}! Get yours before they're gone! Reply NOW to claim your discount!"
 ]
 
+def fallback_message():
+    """Pick a canned marketing message for when generation fails or is too slow"""
+    template = random.choice(FALLBACK_TEMPLATES)
+    return template.format(product="our products")
+
 def generate_marketing_text(prompt, max_retries=2):
-   
+    """Generate text with the local distilgpt2 fallback via the micro-batching worker"""
     try:
-        result = generator(
-            prompt,
-            max_new_tokens=60,
-            num_return_sequences=1,
-            truncation=True,
-            pad_token_id=50256
-        )
-        # Remove the prompt from the output if present
-        text = result[0]['generated_text']
-        if text.startswith(prompt):
-            text = text[len(prompt):].strip()
-        return text
+        # Concurrent callers share one batched forward pass; a full queue
+        # raises LocalBackendBusy so we shed load to the templates instead
+        return get_local_batcher().generate(prompt, max_new_tokens=60)
     except Exception as e:
         print(f"Error with local model: {str(e)}")
-        template = random.choice(FALLBACK_TEMPLATES)
-        return template.format(product="our products")
+        tracing.fallback(f"local_{type(e).__name__}")
+        return fallback_message()
+
+async def agenerate_marketing_text(prompt):
+    """Async variant of generate_marketing_text; the batch runs on the batcher's own thread"""
+    try:
+        # Submitting may load the model first, which must not block the loop
+        future = await asyncio.to_thread(get_local_batcher().submit, prompt, 60)
+        return await asyncio.wait_for(asyncio.wrap_future(future), LOCAL_TIMEOUT)
+    except Exception as e:
+        print(f"Error with local model: {str(e)}")
+        tracing.fallback(f"local_{type(e).__name__}")
+        return fallback_message()
+
+def marketing_message_prompt(product_info, campaign_type="promotion"):
+    return get_templates(campaign_type).message_prompt(product_info)
 
 def create_marketing_message(product_info, campaign_type="promotion"):
-    prompt = (
-        f"Create a short, engaging WhatsApp marketing message for the following product promotion:\n"
-        f"Product: {product_info}\n\n"
-        "The message should:\n"
-        "- Be brief (under 280 characters)\n"
-        "- Include emojis\n"
-        "- Have a clear call-to-action\n"
-        "- Create urgency\n"
-        "- Be friendly and exciting"
-    )
     # Only return the generated message, not any explanation
-    message = generate_marketing_text_groq(prompt)
-    # If the model returns extra explanation, keep only the first quoted or first line
-    if "\n" in message:
-        # Try to extract the first quoted string, else just the first line
-        import re
-        match = re.search(r'["“](.+?)["”]', message, re.DOTALL)
-        if match:
-            return match.group(1).strip()
-        return message.split('\n')[0].strip()
-    return message.strip()
+    message = generate_marketing_text_groq(marketing_message_prompt(product_info, campaign_type))
+    return clean_message(message, campaign_type)
+
+async def acreate_marketing_message(product_info, campaign_type="promotion"):
+    message = await agenerate_marketing_text_routed(marketing_message_prompt(product_info, campaign_type))
+    return clean_message(message, campaign_type)
+
+def ab_test_prompt(product_info, index, campaign_type="promotion"):
+    return get_templates(campaign_type).variation_prompt(product_info, index)
+
+def create_ab_test_variation(product_info, index, campaign_type="promotion"):
+    """Create the A/B variation for the index-th prompt style"""
+    message = generate_marketing_text_groq(ab_test_prompt(product_info, index, campaign_type))
+    return clean_message(message, campaign_type)
+
+async def acreate_ab_test_variation(product_info, index, campaign_type="promotion"):
+    message = await agenerate_marketing_text_routed(ab_test_prompt(product_info, index, campaign_type))
+    return clean_message(message, campaign_type)
 
 def create_ab_test_variations(product_info, campaign_type="promotion", num_variations=2):
     """Create multiple diverse variations for A/B testing using Groq LLMs"""
-    prompts = [
-        f"Write a short, urgent WhatsApp marketing message for this product: {product_info}. Use a strong call-to-action, create urgency, and include emojis. Make it sound exciting and exclusive.",
-        f"Write a friendly WhatsApp marketing message for this product: {product_info}. Start with a question to spark curiosity, highlight a unique benefit, and include emojis.",
-        f"Write a WhatsApp marketing message for this product: {product_info}. Mention how many customers love it (social proof), use a warm tone, and include emojis.",
-        f"Write a WhatsApp marketing message for this product: {product_info}. Emphasize a limited-time offer, use a bold statement, and include emojis.",
-        f"Write a personalized WhatsApp marketing message for this product: {product_info}. Address the customer directly, make it feel exclusive, and include emojis."
-    ]
-    variations = []
+    return [create_ab_test_variation(product_info, i, campaign_type) for i in range(num_variations)]
+
+async def aiter_marketing_bundle(product_info, campaign_type="promotion", num_variations=2,
+                                 deadline=None):
+    """Yield (kind, index, text) for the main message and each variation as they finish.
+
+    All completions run as tasks on the running loop. Anything still running
+    after deadline seconds is yielded as a fallback template instead so one
+    slow completion cannot hold up the whole response.
+    """
+    loop = asyncio.get_running_loop()
+    tasks = {asyncio.ensure_future(acreate_marketing_message(product_info, campaign_type)): ("marketing_message", 0)}
     for i in range(num_variations):
-        prompt = prompts[i % len(prompts)]
-        message = generate_marketing_text_groq(prompt)
-        variations.append(message)
-    return variations
+        tasks[asyncio.ensure_future(acreate_ab_test_variation(product_info, i, campaign_type))] = ("variation", i)
+    end = None if deadline is None else loop.time() + deadline
+    try:
+        while tasks:
+            timeout = None if end is None else max(0.0, end - loop.time())
+            done, _ = await asyncio.wait(list(tasks), timeout=timeout, return_when=asyncio.FIRST_COMPLETED)
+            if not done:
+                print(f"Marketing deadline of {deadline}s hit, {len(tasks)} result(s) replaced by fallback")
+                break
+            for task in done:
+                kind, index = tasks.pop(task)
+                if task.exception() is None:
+                    yield kind, index, task.result()
+                else:
+                    tracing.fallback("error")
+                    yield kind, index, fallback_message()
+        for kind, index in list(tasks.values()):
+            tracing.fallback("deadline")
+            yield kind, index, fallback_message()
+    finally:
+        for task in tasks:
+            task.cancel()
+
+async def acreate_marketing_bundle(product_info, campaign_type="promotion", num_variations=2,
+                                   deadline=None):
+    """Generate the main message and A/B variations concurrently on the running loop"""
+    message = None
+    variations = [None] * num_variations
+    async for kind, index, text in aiter_marketing_bundle(product_info, campaign_type,
+                                                          num_variations, deadline):
+        if kind == "marketing_message":
+            message = text
+        else:
+            variations[index] = text
+    return message, variations
 
-def generate_marketing_text_groq(prompt, model="llama3-8b-8192", max_tokens=120):
+# Shared Groq clients: one keep-alive connection pool for the whole process
+# instead of a new client (and TLS handshake) per completion.
+_groq_client = None
+_groq_client_lock = threading.Lock()
+# Async clients are bound to the event loop that created them
+_async_groq = weakref.WeakKeyDictionary()
+
+
+def _groq_limits():
+    import httpx
+    return httpx.Limits(
+        max_connections=GROQ_MAX_CONNECTIONS,
+        max_keepalive_connections=GROQ_MAX_CONNECTIONS,
+        keepalive_expiry=60,
+    )
+
+
+def get_groq_client():
+    """Return the process-wide pooled Groq client"""
+    global _groq_client
+    if _groq_client is None:
+        with _groq_client_lock:
+            if _groq_client is None:
+                import httpx
+                import openai
+                # Retries are handled by the shared limiter (see rate_limit.py)
+                _groq_client = openai.OpenAI(
+                    api_key=GROQ_API_KEY,
+                    base_url=GROQ_BASE_URL,
+                    http_client=httpx.Client(limits=_groq_limits(), timeout=GROQ_TIMEOUT),
+                    max_retries=0,
+                )
+    return _groq_client
+
+
+def get_async_groq_client():
+    """Return the pooled async Groq client for the running loop"""
+    loop = asyncio.get_running_loop()
+    client = _async_groq.get(loop)
+    if client is None:
+        import httpx
+        import openai
+        client = openai.AsyncOpenAI(
+            api_key=GROQ_API_KEY,
+            base_url=GROQ_BASE_URL,
+            http_client=httpx.AsyncClient(limits=_groq_limits(), timeout=GROQ_TIMEOUT),
+            max_retries=0,
+        )
+        _async_groq[loop] = client
+    return client
+
+
+def _groq_request(prompt, model, max_tokens, **extra):
+    request = dict(
+        model=model,
+        messages=[{"role": "user", "content": prompt}],
+        max_tokens=max_tokens,
+        temperature=GROQ_TEMPERATURE,
+    )
+    request.update(extra)
+    return request
+
+
+def generate_marketing_text_groq(prompt, model="llama3-8b-8192", max_tokens=120, max_retries=None):
     """Generate marketing text using Groq LLMs (Llama-3, Mixtral, Gemma)"""
     if not GROQ_API_KEY:
         print("Groq API key not found.")
-        return "API key missing."
-    try:
-        client = openai.OpenAI(api_key=GROQ_API_KEY, base_url="https://api.groq.com/openai/v1")
-        response = client.chat.completions.create(
-            model=model,
-            messages=[{"role": "user", "content": prompt}],
-            max_tokens=max_tokens,
-            temperature=0.8,
+        tracing.fallback("no_api_key")
+        return API_KEY_MISSING
+    cache = get_response_cache()
+    if cache is not None:
+        cached = cache.lookup(prompt, model, max_tokens, GROQ_TEMPERATURE)
+        if cached is not None:
+            return cached
+    def call():
+        # Budgets, adaptive concurrency and retries with backoff (honours Retry-After)
+        response = get_limiter("groq", model).call(
+            lambda: get_groq_client().chat.completions.create(**_groq_request(prompt, model, max_tokens)),
+            prompt_tokens=estimate_tokens(prompt), max_tokens=max_tokens, max_retries=max_retries,
         )
         return response.choices[0].message.content.strip()
+
+    try:
+        # Identical prompts already in flight share that call
+        text = get_flight_group("groq").do(make_key(prompt, model, max_tokens, GROQ_TEMPERATURE), call)
     except Exception as e:
         print(f"Groq API error: {e}")
-        template = random.choice(FALLBACK_TEMPLATES)
-        return template.format(product="our products")
+        tracing.fallback(f"groq_{type(e).__name__}")
+        return generate_marketing_text(prompt)
+    if cache is not None:
+        cache.store(prompt, model, max_tokens, GROQ_TEMPERATURE, text)
+    return text
+
+
+def stream_marketing_text_groq(prompt, model="llama3-8b-8192", max_tokens=120):
+    """Yield Groq completion deltas as they arrive (stream=True)"""
+    if not GROQ_API_KEY:
+        print("Groq API key not found.")
+        tracing.fallback("no_api_key")
+        yield API_KEY_MISSING
+        return
+    cache = get_response_cache()
+    if cache is not None:
+        cached = cache.lookup(prompt, model, max_tokens, GROQ_TEMPERATURE)
+        if cached is not None:
+            yield cached
+            return
+    parts = []
+    try:
+        # Only opening the stream is retried; once tokens flow we keep what we got
+        stream = get_limiter("groq", model).call(
+            lambda: get_groq_client().chat.completions.create(
+                **_groq_request(prompt, model, max_tokens, stream=True)),
+            prompt_tokens=estimate_tokens(prompt), max_tokens=max_tokens,
+        )
+        for chunk in stream:
+            delta = chunk.choices[0].delta.content if chunk.choices else None
+            if delta:
+                parts.append(delta)
+                yield delta
+    except Exception as e:
+        print(f"Groq API error: {e}")
+        if not parts:
+            tracing.fallback(f"groq_{type(e).__name__}")
+            yield generate_marketing_text(prompt)
+        return
+    if cache is not None:
+        cache.store(prompt, model, max_tokens, GROQ_TEMPERATURE, "".join(parts).strip())
+
+
+async def astream_marketing_text_groq(prompt, model="llama3-8b-8192", max_tokens=120):
+    """Async variant of stream_marketing_text_groq"""
+    if not GROQ_API_KEY:
+        print("Groq API key not found.")
+        tracing.fallback("no_api_key")
+        yield API_KEY_MISSING
+        return
+    cache = get_response_cache()
+    if cache is not None:
+        cached = cache.lookup(prompt, model, max_tokens, GROQ_TEMPERATURE)
+        if cached is not None:
+            yield cached
+            return
+    client = get_async_groq_client()
+    parts = []
+    try:
+        stream = await get_limiter("groq", model).acall(
+            lambda: client.chat.completions.create(**_groq_request(prompt, model, max_tokens, stream=True)),
+            prompt_tokens=estimate_tokens(prompt), max_tokens=max_tokens,
+        )
+        async for chunk in stream:
+            delta = chunk.choices[0].delta.content if chunk.choices else None
+            if delta:
+                parts.append(delta)
+                yield delta
+    except Exception as e:
+        print(f"Groq API error: {e}")
+        if not parts:
+            tracing.fallback(f"groq_{type(e).__name__}")
+            yield await agenerate_marketing_text(prompt)
+        return
+    if cache is not None:
+        cache.store(prompt, model, max_tokens, GROQ_TEMPERATURE, "".join(parts).strip())
+
+
+async def acomplete_groq(prompt, model="llama3-8b-8192", max_tokens=120, temperature=None, max_retries=None,
+                         use_cache=True):
+    """Cached, coalesced, rate-limited async Groq completion; raises instead of falling back"""
+    temperature = GROQ_TEMPERATURE if temperature is None else temperature
+    cache = get_response_cache() if use_cache else None
+    if cache is not None:
+        cached = cache.lookup(prompt, model, max_tokens, temperature)
+        if cached is not None:
+            return cached
+    client = get_async_groq_client()
+    request = _groq_request(prompt, model, max_tokens, temperature=temperature)
+
+    async def call():
+        response = await get_limiter("groq", model).acall(
+            lambda: client.chat.completions.create(**request),
+            prompt_tokens=estimate_tokens(prompt), max_tokens=max_tokens, max_retries=max_retries,
+        )
+        text = response.choices[0].message.content.strip()
+        if cache is not None:
+            cache.store(prompt, model, max_tokens, temperature, text)
+        return text
+
+    if not use_cache:
+        # The caller wants a fresh generation (e.g. another variation), not a shared one
+        return await call()
+    return await get_flight_group("groq").ado(make_key(prompt, model, max_tokens, temperature), call)
+
+
+async def agenerate_marketing_text_groq(prompt, model="llama3-8b-8192", max_tokens=120, max_retries=None):
+    """Async variant of generate_marketing_text_groq (concurrency is set by the shared "groq" limiter)"""
+    if not GROQ_API_KEY:
+        print("Groq API key not found.")
+        tracing.fallback("no_api_key")
+        return API_KEY_MISSING
+    try:
+        return await acomplete_groq(prompt, model=model, max_tokens=max_tokens, max_retries=max_retries)
+    except Exception as e:
+        print(f"Groq API error: {e}")
+        tracing.fallback(f"groq_{type(e).__name__}")
+        return await agenerate_marketing_text(prompt)
+
+
+register_provider("groq", acomplete_groq, available=lambda: bool(GROQ_API_KEY))
+
+# Backends of the "marketing" route; override with ROUTER_MARKETING_BACKENDS,
+# e.g. "groq:llama3-8b-8192,groq:gemma2-9b-it" or "...,hf:mistralai/Mistral-7B-Instruct-v0.1"
+MARKETING_BACKENDS = "groq:llama3-8b-8192"
+
+
+async def agenerate_marketing_text_routed(prompt, max_tokens=120):
+    """Marketing completion from the fastest healthy backend, hedged to the next one when slow"""
+    try:
+        return await get_router("marketing", MARKETING_BACKENDS).complete(prompt, max_tokens)
+    except NoBackendAvailable as e:
+        print(f"No marketing backend: {e}")
+        tracing.fallback("no_backend")
+    except Exception as e:
+        print(f"Marketing backend error: {e}")
+        tracing.fallback(f"router_{type(e).__name__}")
+    return await agenerate_marketing_text(prompt)
+
 
 # Testing function
 if __name__ == "__main__":
@@ -1,6 +1,230 @@
-import fitz
+# pdf_summary.py
+"""PDF text extraction and summarization.
+
+- ``iter_page_text`` streams page text, so callers that only need the start
+  of a document (``preview_pdf``) stop reading as soon as they have enough.
+- ``extract_pages`` splits large documents into page ranges that are read in
+  a process pool.
+- ``asummarize_pdf`` is a map-reduce pipeline: pages are grouped into chunks,
+  chunks are summarized concurrently with Groq, and the partial summaries are
+  reduced until one summary is left. Results are cached on disk by file hash.
+"""
+import asyncio
+import hashlib
+import json
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor
+
+from dotenv import load_dotenv
+
+load_dotenv()
+
+PDF_PREVIEW_CHARS = int(os.getenv("PDF_PREVIEW_CHARS", "1000"))
+# Documents with at least this many pages are read in page ranges by a process pool
+PDF_PARALLEL_MIN_PAGES = int(os.getenv("PDF_PARALLEL_MIN_PAGES", "100"))
+PDF_WORKERS = int(os.getenv("PDF_WORKERS", str(min(4, os.cpu_count() or 1))))
+# Characters of page text per map step (~3k tokens, well inside an 8k context)
+PDF_CHUNK_CHARS = int(os.getenv("PDF_CHUNK_CHARS", "12000"))
+PDF_SUMMARY_MODEL = os.getenv("PDF_SUMMARY_MODEL", "llama3-8b-8192")
+PDF_SUMMARY_MAX_TOKENS = int(os.getenv("PDF_SUMMARY_MAX_TOKENS", "256"))
+PDF_CACHE_DIR = os.getenv("PDF_CACHE_DIR", ".pdf_cache")
+
+CHUNK_PROMPT = (
+    "Summarize this excerpt (pages {first}-{last}) of a document in a few sentences. "
+    "Keep product names, prices and key facts.\n\n{text}"
+)
+REDUCE_PROMPT = (
+    "Combine these partial summaries of one document into a single concise summary. "
+    "Keep product names, prices and key facts.\n\n{text}"
+)
+
+
+def file_digest(file_path):
+    """sha256 of the file contents, read in blocks"""
+    digest = hashlib.sha256()
+    with open(file_path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def page_count(file_path):
+    import fitz
+    with fitz.open(file_path) as pdf:
+        return pdf.page_count
+
+
+def iter_page_text(file_path, start=0, stop=None):
+    """Yield the text of pages [start, stop) one at a time"""
+    import fitz
+    with fitz.open(file_path) as pdf:
+        stop = pdf.page_count if stop is None else min(stop, pdf.page_count)
+        for number in range(start, stop):
+            yield pdf.load_page(number).get_text()
+
+
+def extract_text(file_path, max_chars):
+    """Return the first max_chars characters, reading only the pages needed"""
+    parts = []
+    size = 0
+    for text in iter_page_text(file_path):
+        parts.append(text)
+        size += len(text)
+        if size >= max_chars:
+            break
+    return "".join(parts)[:max_chars]
+
+
+def _extract_range(args):
+    # Runs in a worker process
+    file_path, start, stop = args
+    return list(iter_page_text(file_path, start, stop))
+
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def get_pool():
+    global _pool
+    if _pool is None:
+        with _pool_lock:
+            if _pool is None:
+                import multiprocessing
+                # spawn: forking a process that runs the event-loop thread is unsafe
+                _pool = ProcessPoolExecutor(PDF_WORKERS, mp_context=multiprocessing.get_context("spawn"))
+    return _pool
+
+
+def extract_pages(file_path, workers=PDF_WORKERS):
+    """Return the text of every page, reading page ranges in parallel for big documents"""
+    total = page_count(file_path)
+    if workers <= 1 or total < PDF_PARALLEL_MIN_PAGES:
+        return list(iter_page_text(file_path))
+    step = -(-total // workers)
+    ranges = [(file_path, start, min(start + step, total)) for start in range(0, total, step)]
+    pages = []
+    for texts in get_pool().map(_extract_range, ranges):
+        pages.extend(texts)
+    return pages
+
+
+def chunk_pages(pages, chunk_chars=PDF_CHUNK_CHARS):
+    """Group consecutive pages into (first_page, last_page, text) chunks of at most chunk_chars"""
+    chunks = []
+    parts, size, first = [], 0, 1
+    for number, text in enumerate(pages, 1):
+        text = text.strip()
+        if not text:
+            continue
+        if parts and size + len(text) > chunk_chars:
+            chunks.append((first, number - 1, "\n".join(parts)))
+            parts, size = [], 0
+        if not parts:
+            first = number
+        parts.append(text[:chunk_chars])
+        size += min(len(text), chunk_chars)
+    if parts:
+        chunks.append((first, len(pages), "\n".join(parts)))
+    return chunks
+
+
+def _extractive(text, max_chars=600):
+    # Used when the LLM is unavailable: the leading sentences of the text
+    text = " ".join(text.split())
+    if len(text) <= max_chars:
+        return text
+    cut = text.rfind(". ", 0, max_chars)
+    return text[:cut + 1] if cut > 0 else text[:max_chars] + "..."
+
+
+async def _summarize(prompt, text):
+    """(summary, extractive): extractive is True when the LLM failed and _extractive stood in"""
+    from marketing_helper import GROQ_API_KEY, acomplete_groq
+    if not GROQ_API_KEY:
+        return _extractive(text), True
+    try:
+        summary = await acomplete_groq(
+            prompt, model=PDF_SUMMARY_MODEL, max_tokens=PDF_SUMMARY_MAX_TOKENS, temperature=0.2
+        )
+        return summary, False
+    except Exception as e:
+        print(f"PDF summary error: {e}")
+        return _extractive(text), True
+
+
+async def map_reduce_summary(pages, chunk_chars=PDF_CHUNK_CHARS):
+    """Summarize chunks concurrently, then reduce the partial summaries to one.
+
+    Returns (summary, extractive); extractive is True when any step fell back
+    to _extractive.
+    """
+    chunks = chunk_pages(pages, chunk_chars)
+    if not chunks:
+        return "", False
+    results = await asyncio.gather(*(
+        _summarize(CHUNK_PROMPT.format(first=first, last=last, text=text), text)
+        for first, last, text in chunks
+    ))
+    extractive = any(fallback for _, fallback in results)
+    summaries = [summary for summary, _ in results]
+    while len(summaries) > 1:
+        groups = chunk_pages(summaries, chunk_chars)
+        if len(groups) == len(summaries):
+            # Partial summaries too long to merge any further
+            return "\n".join(summaries), extractive
+        results = await asyncio.gather(*(
+            _summarize(REDUCE_PROMPT.format(text=text), text) for _, _, text in groups
+        ))
+        extractive = extractive or any(fallback for _, fallback in results)
+        summaries = [summary for summary, _ in results]
+    return summaries[0], extractive
+
+
+def _cache_path(digest):
+    key = hashlib.sha256(f"{digest}|{PDF_SUMMARY_MODEL}|{PDF_CHUNK_CHARS}".encode("utf-8")).hexdigest()
+    return os.path.join(PDF_CACHE_DIR, key + ".json")
+
+
+def _cache_read(path):
+    try:
+        with open(path, encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def _cache_write(path, entry):
+    os.makedirs(PDF_CACHE_DIR, exist_ok=True)
+    tmp = f"{path}.{os.getpid()}.tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump(entry, f)
+    os.replace(tmp, path)
+
+
+async def asummarize_pdf(file_path):
+    """Summarize a PDF with the map-reduce pipeline, caching the result by file hash.
+
+    Summaries that fell back to extractive text (LLM down or no API key) are
+    not cached, so the next request tries the LLM again.
+    """
+    path = _cache_path(await asyncio.to_thread(file_digest, file_path))
+    entry = _cache_read(path)
+    if entry is None:
+        pages = await asyncio.to_thread(extract_pages, file_path)
+        summary, extractive = await map_reduce_summary(pages)
+        entry = {"pages": len(pages), "summary": summary}
+        if not extractive:
+            _cache_write(path, entry)
+    return entry["summary"]
+
 
 def summarize_pdf(file_path):
-    pdf = fitz.open(file_path)
-    text = "".join([page.get_text() for page in pdf])
-    return text[:1000] + "... (summary)"
\ No newline at end of file
+    from runtime import runtime
+    return runtime.run(asummarize_pdf(file_path))
+
+
+def preview_pdf(file_path, max_chars=PDF_PREVIEW_CHARS):
+    """The first max_chars characters of the document, without reading the rest"""
+    return extract_text(file_path, max_chars) + "... (preview)"
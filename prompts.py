@@ -0,0 +1,135 @@
+# prompts.py
+"""Prompt templates per campaign type and the post-processing of LLM output.
+
+Templates are split around ``{product_info}`` once at import time, so building
+a prompt is a single string concatenation instead of an f-string or
+``str.format`` parse per request. ``clean_message`` turns a raw completion
+into a sendable WhatsApp message in one pass: it drops explanations around
+the message, enforces the 280-character limit and makes sure there is an emoji.
+Sentinel replies such as ``API_KEY_MISSING`` pass through unchanged, so error
+text never reaches users dressed up as marketing copy.
+"""
+import re
+
+WHATSAPP_MAX_CHARS = 280
+DEFAULT_CAMPAIGN_TYPE = "promotion"
+
+PRODUCT_FIELD = "{product_info}"
+
+# Returned instead of a completion when generation cannot run at all
+API_KEY_MISSING = "API key missing."
+SENTINEL_MESSAGES = frozenset({API_KEY_MISSING})
+
+
+class PromptTemplate:
+    """A prompt with a single {product_info} field, pre-split for fast rendering"""
+
+    __slots__ = ("text", "_head", "_tail")
+
+    def __init__(self, text):
+        self.text = text
+        head, _, tail = text.partition(PRODUCT_FIELD)
+        if PRODUCT_FIELD in tail:
+            raise ValueError("templates may only use {product_info} once")
+        self._head = head
+        self._tail = tail
+
+    def render(self, product_info):
+        return self._head + product_info + self._tail
+
+
+# Per campaign type: what the message is, what it should do, and the emoji
+# added to completions that came back without one
+CAMPAIGN_TYPES = {
+    "promotion": {
+        "kind": "marketing",
+        "title": "product promotion",
+        "goals": "- Have a clear call-to-action\n- Create urgency\n- Be friendly and exciting",
+        "emoji": "🔥",
+    },
+    "announcement": {
+        "kind": "product announcement",
+        "title": "new product announcement",
+        "goals": "- Lead with what is new\n- Have a clear call-to-action\n- Be friendly and exciting",
+        "emoji": "✨",
+    },
+    "reminder": {
+        "kind": "reminder",
+        "title": "customer reminder",
+        "goals": "- Gently remind the customer\n- Have a clear call-to-action\n- Be friendly, not pushy",
+        "emoji": "⏰",
+    },
+}
+
+MESSAGE_PROMPT = (
+    "Create a short, engaging WhatsApp {kind} message for the following {title}:\n"
+    "Product: {product_info}\n\n"
+    "The message should:\n"
+    "- Be brief (under 280 characters)\n"
+    "- Include emojis\n"
+    "{goals}"
+)
+
+# A/B prompt styles, cycled when more variations are requested than styles exist
+AB_TEST_PROMPTS = [
+    "Write a short, urgent WhatsApp {kind} message for this product: {product_info}. Use a strong call-to-action, create urgency, and include emojis. Make it sound exciting and exclusive.",
+    "Write a friendly WhatsApp {kind} message for this product: {product_info}. Start with a question to spark curiosity, highlight a unique benefit, and include emojis.",
+    "Write a WhatsApp {kind} message for this product: {product_info}. Mention how many customers love it (social proof), use a warm tone, and include emojis.",
+    "Write a WhatsApp {kind} message for this product: {product_info}. Emphasize a limited-time offer, use a bold statement, and include emojis.",
+    "Write a personalized WhatsApp {kind} message for this product: {product_info}. Address the customer directly, make it feel exclusive, and include emojis."
+]
+
+
+class CampaignTemplates:
+    __slots__ = ("campaign_type", "message", "variations", "emoji", "_message_head", "_message_tail")
+
+    def __init__(self, campaign_type, kind, title, goals, emoji):
+        fields = {"kind": kind, "title": title, "goals": goals, "product_info": PRODUCT_FIELD}
+        self.campaign_type = campaign_type
+        self.message = PromptTemplate(MESSAGE_PROMPT.format(**fields))
+        self.variations = tuple(PromptTemplate(style.format(**fields)) for style in AB_TEST_PROMPTS)
+        self.emoji = emoji
+        # The main prompt is built on every request, so skip the extra call
+        self._message_head = self.message._head
+        self._message_tail = self.message._tail
+
+    def message_prompt(self, product_info):
+        return self._message_head + product_info + self._message_tail
+
+    def variation_prompt(self, product_info, index):
+        return self.variations[index % len(self.variations)].render(product_info)
+
+
+TEMPLATES = {name: CampaignTemplates(name, **spec) for name, spec in CAMPAIGN_TYPES.items()}
+
+
+def get_templates(campaign_type):
+    """Templates for campaign_type; unknown types use the promotion templates"""
+    return TEMPLATES.get(campaign_type) or TEMPLATES[DEFAULT_CAMPAIGN_TYPE]
+
+
+QUOTED_RE = re.compile(r'["“](.+?)["”]', re.DOTALL)
+WHITESPACE_RE = re.compile(r"[ \t]{2,}|\t")
+# Emoji, pictographs, dingbats and regional-indicator flags
+EMOJI_RE = re.compile("[\U0001F000-\U0001FAFF\u2300-\u23FF\u2600-\u27BF\u2B00-\u2BFF\u3030\u303D\u3297\u3299]")
+
+
+def clean_message(text, campaign_type=DEFAULT_CAMPAIGN_TYPE, max_chars=WHATSAPP_MAX_CHARS):
+    """Reduce a completion to one WhatsApp-ready message (<= max_chars, with an emoji)"""
+    text = text.strip()
+    if not text or text in SENTINEL_MESSAGES:
+        return text
+    if "\n" in text:
+        # The model added explanation: keep the first quoted string, else the first line
+        match = QUOTED_RE.search(text)
+        text = match.group(1).strip() if match else text.split("\n", 1)[0].strip()
+    if "  " in text or "\t" in text:
+        text = WHITESPACE_RE.sub(" ", text)
+    # ASCII-only text cannot contain an emoji, which spares the regex scan
+    if text.isascii() or not EMOJI_RE.search(text):
+        text = f"{get_templates(campaign_type).emoji} {text}"
+    if len(text) > max_chars:
+        # Cut at the last word boundary that leaves room for the ellipsis
+        cut = text.rfind(" ", 0, max_chars)
+        text = (text[:cut] if cut > 0 else text[:max_chars - 1]).rstrip(" ,;:-") + "…"
+    return text
@@ -0,0 +1,393 @@
+# rate_limit.py
+"""Shared client-side rate limiting for the LLM providers.
+
+Every (provider, model) pair gets a ProviderLimiter with
+- token buckets for requests/minute and tokens/minute,
+- an AIMD concurrency limit that grows while calls are fast and healthy and
+  halves on 429s/5xx/timeouts,
+- retries with full-jitter exponential backoff that honours Retry-After.
+
+The same limiter is used from worker threads (``call``) and from the shared
+event loop (``acall``). Each call runs in an ``llm.<provider>`` trace span
+that records queue wait, network time, attempts and tokens.
+"""
+import asyncio
+import json
+import os
+import random
+import threading
+import time
+
+from dotenv import load_dotenv
+
+import scheduler
+import tracing
+
+load_dotenv()
+
+LLM_MAX_RETRIES = int(os.getenv("LLM_MAX_RETRIES", "2"))
+LLM_BACKOFF_BASE = float(os.getenv("LLM_BACKOFF_BASE", "0.5"))
+LLM_BACKOFF_MAX = float(os.getenv("LLM_BACKOFF_MAX", "20"))
+# Provider defaults; 0 disables the bucket (e.g. GROQ_RPM=30 GROQ_TPM=30000 for the free tier)
+PROVIDER_DEFAULTS = {
+    "groq": {
+        "rpm": float(os.getenv("GROQ_RPM", "0")),
+        "tpm": float(os.getenv("GROQ_TPM", "0")),
+        "max_concurrency": int(os.getenv("GROQ_MAX_CONCURRENCY", "8")),
+    },
+    "hf": {
+        "rpm": float(os.getenv("HF_RPM", "0")),
+        "tpm": float(os.getenv("HF_TPM", "0")),
+        "max_concurrency": int(os.getenv("HF_MAX_CONCURRENCY", "8")),
+    },
+    # Text-to-speech (voice.py); its "tokens" are characters of text
+    "elevenlabs": {
+        "rpm": float(os.getenv("ELEVENLABS_RPM", "0")),
+        "tpm": float(os.getenv("ELEVENLABS_CHARS_PER_MINUTE", "0")),
+        "max_concurrency": int(os.getenv("ELEVENLABS_MAX_CONCURRENCY", "4")),
+    },
+    # Outbound WhatsApp messages (whatsapp.py); the Cloud API's default is 80 per second
+    "whatsapp": {
+        "rpm": float(os.getenv("WHATSAPP_RPM", "4800")),
+        "tpm": 0,
+        "max_concurrency": int(os.getenv("WHATSAPP_MAX_CONCURRENCY", "32")),
+    },
+}
+# Per-model overrides, e.g. {"groq:llama3-8b-8192": {"rpm": 30, "tpm": 6000}}
+LLM_LIMITS = json.loads(os.getenv("LLM_LIMITS", "{}"))
+# Calls slower than this count as unhealthy for the AIMD controller
+LLM_LATENCY_TARGET = float(os.getenv("LLM_LATENCY_TARGET", "5"))
+
+RETRYABLE_STATUS = {408, 409, 425, 429, 500, 502, 503, 504}
+
+
+class RateLimitExceeded(Exception):
+    """Raised when a call still fails with a retryable error after all retries"""
+
+
+def estimate_tokens(text):
+    # Roughly four characters per token for English text
+    return max(1, len(text) // 4)
+
+
+def error_status(exc):
+    status = getattr(exc, "status_code", None)
+    if status is None:
+        status = getattr(getattr(exc, "response", None), "status_code", None)
+    return status
+
+
+def retry_after(exc):
+    """Seconds the provider asked us to wait, from Retry-After(-ms) headers"""
+    headers = getattr(getattr(exc, "response", None), "headers", None) or {}
+    try:
+        if headers.get("retry-after-ms"):
+            return float(headers["retry-after-ms"]) / 1000.0
+        if headers.get("retry-after"):
+            return float(headers["retry-after"])
+    except (TypeError, ValueError):
+        pass
+    return None
+
+
+def is_retryable(exc):
+    status = error_status(exc)
+    if status is not None:
+        return status in RETRYABLE_STATUS
+    name = type(exc).__name__
+    return isinstance(exc, (TimeoutError, ConnectionError)) or "Timeout" in name or "Connection" in name
+
+
+class TokenBucket:
+    """Thread-safe token bucket; reserve() returns how long the caller must wait"""
+
+    def __init__(self, per_minute, burst=None):
+        self.rate = per_minute / 60.0
+        # Default burst is one second worth of budget. Charges larger than the
+        # burst are not clipped: they drive the bucket into debt, which later
+        # callers wait out, so the per-minute rate holds for any request size
+        self.capacity = burst if burst is not None else max(1.0, self.rate)
+        self._tokens = self.capacity
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def reserve(self, amount=1.0):
+        if self.rate <= 0:
+            return 0.0
+        with self._lock:
+            now = time.monotonic()
+            self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+            self._updated = now
+            # Going negative books the tokens now, so later callers queue behind us
+            self._tokens -= amount
+            return 0.0 if self._tokens >= 0 else -self._tokens / self.rate
+
+
+class AIMDLimiter:
+    """Concurrency limit adjusted by additive-increase / multiplicative-decrease.
+
+    Works for threads (acquire/release) and coroutines (aacquire/release).
+    When no slot is free, callers wait in a scheduler.FairQueue: by priority
+    class, then fair share per tenant. A caller whose deadline passes while
+    waiting gets scheduler.DeadlineExceeded instead of a slot.
+    """
+
+    def __init__(self, max_limit, min_limit=1, initial=None, latency_target=LLM_LATENCY_TARGET,
+                 decrease_factor=0.5, cooldown=1.0):
+        self.min_limit = min_limit
+        self.max_limit = max(min_limit, max_limit)
+        self.limit = float(initial if initial is not None else self.max_limit)
+        self.latency_target = latency_target
+        self.decrease_factor = decrease_factor
+        self.cooldown = cooldown
+        self.in_flight = 0
+        self._last_decrease = 0.0
+        self._lock = threading.Lock()
+        self._waiters = scheduler.FairQueue()
+
+    def _try_acquire(self):
+        if self.in_flight < int(self.limit):
+            self.in_flight += 1
+            return True
+        return False
+
+    def acquire(self, request=None):
+        request = request or scheduler.current()
+        with self._lock:
+            if self._try_acquire():
+                return
+            ticket = self._waiters.push(threading.Event(), request)
+        ticket.waiter.wait(request.remaining())
+        with self._lock:
+            self._waiters.discard(ticket, expired=True)
+        if ticket.state != scheduler.GRANTED:
+            raise scheduler.DeadlineExceeded(f"{request.priority} call expired while queued")
+
+    async def aacquire(self, request=None):
+        request = request or scheduler.current()
+        loop = asyncio.get_running_loop()
+        with self._lock:
+            if self._try_acquire():
+                return
+            future = loop.create_future()
+            ticket = self._waiters.push((loop, future), request)
+        try:
+            await asyncio.wait_for(asyncio.shield(future), request.remaining())
+        except asyncio.TimeoutError:
+            with self._lock:
+                self._waiters.discard(ticket, expired=True)
+        except asyncio.CancelledError:
+            with self._lock:
+                self._waiters.discard(ticket)
+            if ticket.state == scheduler.GRANTED:
+                # The slot was handed over just as we were cancelled; give it back
+                self.release(feedback=False)
+            raise
+        if ticket.state != scheduler.GRANTED:
+            raise scheduler.DeadlineExceeded(f"{request.priority} call expired while queued")
+
+    def release(self, ok=True, latency=None, overloaded=False, feedback=True):
+        with self._lock:
+            self.in_flight -= 1
+            now = time.monotonic()
+            if not feedback:
+                pass
+            elif overloaded or (latency is not None and latency > self.latency_target):
+                if now - self._last_decrease >= self.cooldown:
+                    self.limit = max(self.min_limit, self.limit * self.decrease_factor)
+                    self._last_decrease = now
+            elif ok:
+                self.limit = min(self.max_limit, self.limit + 1.0 / max(self.limit, 1.0))
+            # Hand freed slots straight to the next waiters
+            while len(self._waiters) and self.in_flight < int(self.limit):
+                if self._waiters.pop() is None:
+                    break
+                self.in_flight += 1
+
+
+class ProviderLimiter:
+    def __init__(self, name, rpm=0, tpm=0, max_concurrency=8, max_retries=LLM_MAX_RETRIES,
+                 backoff_base=LLM_BACKOFF_BASE, backoff_max=LLM_BACKOFF_MAX):
+        self.name = name
+        self.provider, _, self.model = name.partition(":")
+        self.requests = TokenBucket(rpm)
+        self.tokens = TokenBucket(tpm)
+        self.concurrency = AIMDLimiter(max_concurrency)
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self._stats_lock = threading.Lock()
+        self.stats = {"calls": 0, "succeeded": 0, "retries": 0, "throttled": 0, "failed": 0, "expired": 0}
+
+    def _count(self, key):
+        with self._stats_lock:
+            self.stats[key] += 1
+
+    def _budget_wait(self, tokens):
+        return max(self.requests.reserve(1), self.tokens.reserve(tokens))
+
+    def _outlives(self, request, wait):
+        remaining = request.remaining()
+        return remaining is not None and wait >= remaining
+
+    def _expired(self, span, request):
+        self._count("expired")
+        span.set(outcome="expired")
+        return scheduler.DeadlineExceeded(f"{self.name}: {request.priority} call dropped, its deadline passed")
+
+    def _backoff(self, attempt, exc):
+        delay = random.uniform(0, min(self.backoff_max, self.backoff_base * 2 ** attempt))
+        hinted = retry_after(exc)
+        return max(delay, hinted) if hinted is not None else delay
+
+    def _after_error(self, exc, attempt, max_retries):
+        """Record a failed attempt; return the backoff delay or re-raise"""
+        status = error_status(exc)
+        if status == 429:
+            self._count("throttled")
+        if not is_retryable(exc):
+            self._count("failed")
+            raise exc
+        if attempt >= max_retries:
+            self._count("failed")
+            raise RateLimitExceeded(f"{self.name}: giving up after {attempt + 1} attempts: {exc}") from exc
+        self._count("retries")
+        return self._backoff(attempt, exc)
+
+    def _observe(self, span, outcome, queued, network, attempt):
+        tracing.LLM_QUEUE_SECONDS.observe(queued, self.provider, self.model)
+        tracing.LLM_SECONDS.observe(network, self.provider, self.model, outcome)
+        span.set(queue_wait_ms=round(queued * 1000, 3), network_ms=round(network * 1000, 3),
+                 attempts=attempt + 1, outcome=outcome)
+
+    def _record_tokens(self, span, prompt_tokens, result):
+        usage = getattr(result, "usage", None)
+        tokens_in = getattr(usage, "prompt_tokens", None) or prompt_tokens
+        tokens_out = getattr(usage, "completion_tokens", None)
+        if tokens_out is None and isinstance(result, str):
+            tokens_out = estimate_tokens(result)
+        tracing.LLM_TOKENS.inc(self.provider, self.model, "in", amount=tokens_in)
+        if tokens_out is not None:
+            tracing.LLM_TOKENS.inc(self.provider, self.model, "out", amount=tokens_out)
+        span.set(tokens_in=tokens_in, tokens_out=tokens_out)
+
+    def call(self, fn, prompt_tokens=1, max_tokens=0, max_retries=None):
+        """Run fn() within the budgets, retrying retryable errors.
+
+        prompt_tokens + max_tokens is charged against the tokens/minute budget.
+        The concurrency slot is taken before the budget so that the scheduler,
+        not arrival order, decides which waiting call spends it next; a call
+        whose deadline would pass before it can be sent raises
+        scheduler.DeadlineExceeded instead.
+        """
+        max_retries = self.max_retries if max_retries is None else max_retries
+        request = scheduler.current()
+        self._count("calls")
+        attempt = 0
+        with tracing.span(f"llm.{self.provider}", model=self.model, priority=request.priority) as span:
+            while True:
+                if request.expired():
+                    # The client stopped waiting, e.g. during a retry backoff
+                    raise self._expired(span, request)
+                queued_at = time.perf_counter()
+                try:
+                    self.concurrency.acquire(request)
+                except scheduler.DeadlineExceeded:
+                    raise self._expired(span, request)
+                wait = self._budget_wait(prompt_tokens + max_tokens)
+                if wait:
+                    if self._outlives(request, wait):
+                        self.concurrency.release(feedback=False)
+                        raise self._expired(span, request)
+                    time.sleep(wait)
+                start = time.perf_counter()
+                try:
+                    result = fn()
+                except Exception as exc:
+                    self._observe(span, "error", start - queued_at, time.perf_counter() - start, attempt)
+                    self.concurrency.release(ok=False, overloaded=is_retryable(exc))
+                    delay = self._after_error(exc, attempt, max_retries)
+                    time.sleep(delay)
+                    attempt += 1
+                    continue
+                latency = time.perf_counter() - start
+                self._observe(span, "ok", start - queued_at, latency, attempt)
+                self.concurrency.release(ok=True, latency=latency)
+                self._count("succeeded")
+                self._record_tokens(span, prompt_tokens, result)
+                return result
+
+    async def acall(self, fn, prompt_tokens=1, max_tokens=0, max_retries=None):
+        """Async version of call: fn() must return an awaitable"""
+        max_retries = self.max_retries if max_retries is None else max_retries
+        request = scheduler.current()
+        self._count("calls")
+        attempt = 0
+        with tracing.span(f"llm.{self.provider}", model=self.model, priority=request.priority) as span:
+            while True:
+                if request.expired():
+                    # The client stopped waiting, e.g. during a retry backoff
+                    raise self._expired(span, request)
+                queued_at = time.perf_counter()
+                try:
+                    await self.concurrency.aacquire(request)
+                except scheduler.DeadlineExceeded:
+                    raise self._expired(span, request)
+                wait = self._budget_wait(prompt_tokens + max_tokens)
+                if wait:
+                    if self._outlives(request, wait):
+                        self.concurrency.release(feedback=False)
+                        raise self._expired(span, request)
+                    try:
+                        await asyncio.sleep(wait)
+                    except asyncio.CancelledError:
+                        self.concurrency.release(feedback=False)
+                        raise
+                start = time.perf_counter()
+                try:
+                    result = await fn()
+                except asyncio.CancelledError:
+                    self.concurrency.release(feedback=False)
+                    raise
+                except Exception as exc:
+                    self._observe(span, "error", start - queued_at, time.perf_counter() - start, attempt)
+                    self.concurrency.release(ok=False, overloaded=is_retryable(exc))
+                    delay = self._after_error(exc, attempt, max_retries)
+                    await asyncio.sleep(delay)
+                    attempt += 1
+                    continue
+                latency = time.perf_counter() - start
+                self._observe(span, "ok", start - queued_at, latency, attempt)
+                self.concurrency.release(ok=True, latency=latency)
+                self._count("succeeded")
+                self._record_tokens(span, prompt_tokens, result)
+                return result
+
+    def info(self):
+        with self._stats_lock:
+            info = dict(self.stats)
+        info.update({
+            "concurrency_limit": round(self.concurrency.limit, 2),
+            "in_flight": self.concurrency.in_flight,
+            "queued": len(self.concurrency._waiters),
+        })
+        return info
+
+
+limiters = {}
+_limiters_lock = threading.Lock()
+
+
+def get_limiter(provider, model):
+    """Return the shared limiter for (provider, model), creating it from config"""
+    key = f"{provider}:{model}"
+    limiter = limiters.get(key)
+    if limiter is None:
+        with _limiters_lock:
+            limiter = limiters.get(key)
+            if limiter is None:
+                config = dict(PROVIDER_DEFAULTS.get(provider, {}))
+                config.update(LLM_LIMITS.get(key, {}))
+                limiter = ProviderLimiter(key, **config)
+                limiters[key] = limiter
+    return limiter
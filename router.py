@@ -0,0 +1,201 @@
+# router.py
+"""Hedged, latency-aware routing across LLM backends.
+
+A route (e.g. "marketing", "chat") has an ordered list of backends written as
+``provider:model``. Each completion goes to the backend with the best score
+(an EWMA of its latency plus a penalty for its recent error rate). If that
+backend has not answered after ROUTER_HEDGE_DELAY seconds the request is
+hedged to the next backend, and the first good answer wins; the loser is
+cancelled. A backend that fails is replaced by the next one straight away.
+
+Providers register a ``complete(prompt, model, max_tokens)`` coroutine that
+raises on failure (see marketing_helper.acomplete_groq and w_crew.acomplete_hf);
+their modules are imported on first use.
+"""
+import asyncio
+import importlib
+import os
+import threading
+import time
+
+from dotenv import load_dotenv
+
+import tracing
+
+load_dotenv()
+
+# Seconds to wait on the preferred backend before hedging to the next one
+ROUTER_HEDGE_DELAY = float(os.getenv("ROUTER_HEDGE_DELAY", "1.0"))
+ROUTER_MAX_HEDGES = int(os.getenv("ROUTER_MAX_HEDGES", "1"))
+ROUTER_EWMA_ALPHA = float(os.getenv("ROUTER_EWMA_ALPHA", "0.2"))
+# Seconds added to a backend's score per unit of (decayed) error rate
+ROUTER_ERROR_PENALTY = float(os.getenv("ROUTER_ERROR_PENALTY", "5.0"))
+# Error history halves every this many seconds so failed backends get retried
+ROUTER_ERROR_HALFLIFE = float(os.getenv("ROUTER_ERROR_HALFLIFE", "30"))
+
+# provider -> module that registers it
+PROVIDER_MODULES = {"groq": "marketing_helper", "hf": "w_crew"}
+providers = {}
+
+
+class NoBackendAvailable(Exception):
+    """Raised when no backend of a route can take requests (e.g. missing API keys)"""
+
+
+def register_provider(name, complete, available=lambda: True):
+    providers[name] = (complete, available)
+
+
+def _provider(name):
+    if name not in providers and name in PROVIDER_MODULES:
+        importlib.import_module(PROVIDER_MODULES[name])
+    if name not in providers:
+        raise NoBackendAvailable(f"unknown provider {name!r}")
+    return providers[name]
+
+
+class Backend:
+    def __init__(self, spec, alpha=ROUTER_EWMA_ALPHA, prior=ROUTER_HEDGE_DELAY):
+        self.spec = spec
+        self.provider, _, self.model = spec.partition(":")
+        self.alpha = alpha
+        # Until measured, assume a backend is as slow as the hedge threshold
+        self.latency = prior
+        self.error_rate = 0.0
+        self.samples = 0
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _decayed_errors(self, now):
+        return self.error_rate * 0.5 ** ((now - self._updated) / ROUTER_ERROR_HALFLIFE)
+
+    def record(self, latency, ok):
+        with self._lock:
+            now = time.monotonic()
+            errors = self._decayed_errors(now)
+            self.error_rate = errors + self.alpha * ((0.0 if ok else 1.0) - errors)
+            if ok and not self.samples:
+                self.latency = latency
+            elif ok or latency > self.latency:
+                # Failures only ever raise the latency estimate
+                self.latency += self.alpha * (latency - self.latency)
+            self.samples += 1
+            self._updated = now
+
+    def record_lower_bound(self, latency):
+        """A cancelled attempt took at least `latency`; only ever raises the estimate"""
+        with self._lock:
+            if latency > self.latency:
+                self.latency += self.alpha * (latency - self.latency)
+
+    def score(self):
+        return self.latency + ROUTER_ERROR_PENALTY * self._decayed_errors(time.monotonic())
+
+    def available(self):
+        return _provider(self.provider)[1]()
+
+    async def complete(self, prompt, max_tokens):
+        return await _provider(self.provider)[0](prompt, self.model, max_tokens)
+
+    def info(self):
+        return {
+            "latency_ewma_ms": round(self.latency * 1000, 1),
+            "error_rate": round(self._decayed_errors(time.monotonic()), 3),
+            "samples": self.samples,
+        }
+
+
+class Router:
+    def __init__(self, name, backends, hedge_delay=ROUTER_HEDGE_DELAY, max_hedges=ROUTER_MAX_HEDGES):
+        self.name = name
+        self.backends = [Backend(spec) for spec in backends]
+        self.hedge_delay = hedge_delay
+        self.max_hedges = max_hedges
+        self.stats = {"requests": 0, "hedged": 0, "failovers": 0, "hedge_wins": 0, "failed": 0}
+
+    def ranked(self):
+        """Available backends, best score first (configuration order breaks ties)"""
+        return sorted((b for b in self.backends if b.available()), key=Backend.score)
+
+    async def _attempt(self, backend, prompt, max_tokens):
+        start = time.perf_counter()
+        try:
+            result = await backend.complete(prompt, max_tokens)
+        except asyncio.CancelledError:
+            # Lost the race: we only know it was at least this slow
+            backend.record_lower_bound(time.perf_counter() - start)
+            raise
+        except Exception:
+            backend.record(time.perf_counter() - start, ok=False)
+            raise
+        backend.record(time.perf_counter() - start, ok=True)
+        return result
+
+    async def complete(self, prompt, max_tokens=120):
+        """First good completion from the route's backends, hedging slow ones"""
+        self.stats["requests"] += 1
+        candidates = self.ranked()
+        if not candidates:
+            raise NoBackendAvailable(f"no available backend for route {self.name!r}")
+        with tracing.span(f"router.{self.name}") as span:
+            running = {}
+            hedges = 0
+            error = None
+
+            def launch(kind):
+                backend = candidates.pop(0)
+                task = asyncio.ensure_future(self._attempt(backend, prompt, max_tokens))
+                running[task] = (backend, kind)
+                span.event(kind, backend=backend.spec)
+
+            launch("primary")
+            try:
+                while running:
+                    can_hedge = candidates and hedges < self.max_hedges
+                    done, _ = await asyncio.wait(
+                        list(running), timeout=self.hedge_delay if can_hedge else None,
+                        return_when=asyncio.FIRST_COMPLETED,
+                    )
+                    if not done:
+                        hedges += 1
+                        self.stats["hedged"] += 1
+                        launch("hedge")
+                        continue
+                    for task in done:
+                        backend, kind = running.pop(task)
+                        if task.exception() is None:
+                            if kind == "hedge":
+                                self.stats["hedge_wins"] += 1
+                            span.set(backend=backend.spec, hedged=hedges > 0)
+                            return task.result()
+                        error = task.exception()
+                        if candidates:
+                            self.stats["failovers"] += 1
+                            launch("failover")
+                self.stats["failed"] += 1
+                raise error
+            finally:
+                for task in running:
+                    task.cancel()
+
+    def info(self):
+        info = dict(self.stats)
+        info["backends"] = {b.spec: b.info() for b in self.backends}
+        return info
+
+
+routers = {}
+_routers_lock = threading.Lock()
+
+
+def get_router(name, default_backends):
+    """Return the shared router for a route; ROUTER_<NAME>_BACKENDS overrides its backends"""
+    router = routers.get(name)
+    if router is None:
+        with _routers_lock:
+            router = routers.get(name)
+            if router is None:
+                specs = os.getenv(f"ROUTER_{name.upper()}_BACKENDS", default_backends)
+                router = Router(name, [s.strip() for s in specs.split(",") if s.strip()])
+                routers[name] = router
+    return router
@@ -0,0 +1,122 @@
+# runtime.py
+"""One long-lived asyncio event loop shared by the whole app.
+
+Flask views are synchronous, so instead of creating and closing an event
+loop per message they hand coroutines to this loop, which runs forever on a
+background thread. Async clients (Groq, HF) and their connection pools
+therefore live as long as the process, and concurrency is bounded by the
+provider limiters (rate_limit.py) rather than by a fixed number of worker
+threads.
+"""
+import asyncio
+import contextvars
+import os
+import threading
+
+
+class AsyncRuntime:
+    def __init__(self):
+        self._loop = None
+        self._thread = None
+        self._pid = None
+        self._lock = threading.Lock()
+        self._daemons = set()  # long-running worker tasks, cancelled rather than awaited at shutdown
+
+    @property
+    def loop(self):
+        self.start()
+        return self._loop
+
+    def start(self):
+        """Start the loop thread (again after a fork, since threads do not survive it)"""
+        if self._thread is not None and self._pid == os.getpid():
+            return self
+        with self._lock:
+            if self._thread is None or self._pid != os.getpid():
+                self._loop = asyncio.new_event_loop()
+                self._pid = os.getpid()
+                self._thread = threading.Thread(
+                    target=self._run, args=(self._loop,), name="async-runtime", daemon=True
+                )
+                self._thread.start()
+        return self
+
+    @staticmethod
+    def _run(loop):
+        asyncio.set_event_loop(loop)
+        loop.run_forever()
+
+    def submit(self, coro, daemon=False):
+        """Schedule coro on the shared loop and return a concurrent.futures.Future.
+
+        The caller's contextvars (e.g. the current trace span) are carried over
+        to the task, as they would be for a task created on the same thread.
+        Daemon tasks (workers that never finish) are cancelled by shutdown()
+        instead of being drained.
+        """
+        daemons = self._daemons if daemon else None
+        return asyncio.run_coroutine_threadsafe(
+            _with_context(coro, contextvars.copy_context(), daemons), self.loop
+        )
+
+    def run(self, coro, timeout=None):
+        """Run coro on the shared loop and block the calling thread for its result"""
+        future = self.submit(coro)
+        try:
+            return future.result(timeout=timeout)
+        except BaseException:
+            future.cancel()
+            raise
+
+    def iterate(self, agen):
+        """Drive an async generator from synchronous code (e.g. a streaming response)"""
+        try:
+            while True:
+                try:
+                    yield self.run(agen.__anext__())
+                except StopAsyncIteration:
+                    return
+        finally:
+            self.run(agen.aclose())
+
+    def shutdown(self, timeout=5.0):
+        """Let pending tasks finish (up to timeout seconds), then stop the loop"""
+        if self._thread is None or self._pid != os.getpid():
+            return
+
+        async def drain():
+            for task in self._daemons:
+                task.cancel()
+            tasks = [t for t in asyncio.all_tasks()
+                     if t is not asyncio.current_task() and t not in self._daemons]
+            if tasks:
+                done, pending = await asyncio.wait(tasks, timeout=timeout)
+                if pending:
+                    print(f"Runtime shutdown: {len(pending)} task(s) still running after {timeout}s")
+
+        try:
+            self.run(drain(), timeout=timeout + 1)
+        finally:
+            self._loop.call_soon_threadsafe(self._loop.stop)
+            self._thread.join(timeout=1)
+            self._thread = None
+
+
+async def _with_context(coro, context, daemons=None):
+    for var, value in context.items():
+        var.set(value)
+    if daemons is None:
+        return await coro
+    task = asyncio.current_task()
+    daemons.add(task)
+    try:
+        return await coro
+    finally:
+        daemons.discard(task)
+
+
+runtime = AsyncRuntime()
+
+
+def run(coro, timeout=None):
+    return runtime.run(coro, timeout=timeout)
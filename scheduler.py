@@ -0,0 +1,250 @@
+# scheduler.py
+"""Priority scheduling of LLM calls.
+
+Every provider call waits for a concurrency slot of its limiter
+(rate_limit.AIMDLimiter). When slots run out, waiters are served by
+priority class first -- interactive chat, then single marketing requests,
+then bulk work (campaign jobs, variation pool refills, conversation
+summaries) -- and within a class by weighted fair queuing across tenants, so
+one merchant's burst cannot starve the others.
+
+The class, tenant and deadline of the current request live in a context
+variable (set per route in app.py, per message in whatsapp.py) and follow
+the request onto the shared event loop like the trace does. New requests
+are shed with a fast 503 (admit) once their class already has
+SCHEDULER_MAX_QUEUE_<CLASS> calls waiting; admitted ones are never shed
+halfway. A queued call whose deadline (the time its client stops waiting)
+has passed is dropped instead of being sent. SCHEDULER=0 serves
+waiters in arrival order (shedding and deadlines still apply).
+"""
+import contextvars
+import heapq
+import itertools
+import json
+import os
+import threading
+import time
+
+from dotenv import load_dotenv
+
+import tracing
+
+load_dotenv()
+
+SCHEDULER = os.getenv("SCHEDULER", "1") != "0"
+PRIORITIES = ("interactive", "marketing", "bulk")
+# Calls of a class allowed to wait for a slot before new requests of that class are shed
+SCHEDULER_MAX_QUEUE = {
+    "interactive": int(os.getenv("SCHEDULER_MAX_QUEUE_INTERACTIVE", "256")),
+    "marketing": int(os.getenv("SCHEDULER_MAX_QUEUE_MARKETING", "64")),
+    "bulk": int(os.getenv("SCHEDULER_MAX_QUEUE_BULK", "1024")),
+}
+# Seconds a client of each class waits for its response unless it sends
+# X-Request-Timeout; 0 = no deadline
+SCHEDULER_TIMEOUT = {
+    "interactive": float(os.getenv("SCHEDULER_TIMEOUT_INTERACTIVE", "30")),
+    "marketing": float(os.getenv("SCHEDULER_TIMEOUT_MARKETING", "60")),
+    "bulk": float(os.getenv("SCHEDULER_TIMEOUT_BULK", "0")),
+}
+# Relative share of each tenant within a class, e.g. {"acme": 2}; others get 1
+SCHEDULER_TENANT_WEIGHTS = json.loads(os.getenv("SCHEDULER_TENANT_WEIGHTS", "{}"))
+SCHEDULER_RETRY_AFTER = int(os.getenv("SCHEDULER_RETRY_AFTER", "2"))
+
+DEFAULT_TENANT = "default"
+
+
+class Overloaded(Exception):
+    """Raised by admit() when too many calls of a class are already waiting; maps to 503"""
+
+    def __init__(self, priority):
+        super().__init__(f"{priority} queue full")
+        self.priority = priority
+        self.retry_after = SCHEDULER_RETRY_AFTER
+
+
+class DeadlineExceeded(Exception):
+    """Raised for a call whose client stopped waiting before it got a slot"""
+
+
+class RequestClass:
+    __slots__ = ("priority", "tenant", "deadline")
+
+    def __init__(self, priority="marketing", tenant=DEFAULT_TENANT, deadline=None):
+        if priority not in PRIORITIES:
+            raise ValueError(f"unknown priority {priority!r}; expected one of {PRIORITIES}")
+        self.priority = priority
+        self.tenant = tenant
+        self.deadline = deadline  # time.monotonic() value, or None
+
+    def remaining(self):
+        """Seconds until the deadline (never negative), or None without one"""
+        if self.deadline is None:
+            return None
+        return max(0.0, self.deadline - time.monotonic())
+
+    def expired(self):
+        return self.deadline is not None and time.monotonic() >= self.deadline
+
+
+# Calls made outside any request (scripts, benchmarks) keep the old behaviour
+_DEFAULT = RequestClass()
+_current = contextvars.ContextVar("scheduler_request", default=_DEFAULT)
+
+
+def current():
+    """The scheduling class of the current request"""
+    return _current.get()
+
+
+def classify(priority, tenant=None, timeout=None):
+    """Set the class of the rest of the current request or task; returns a token for reset().
+
+    tenant defaults to the current one; timeout defaults to the class's
+    SCHEDULER_TIMEOUT (0 = no deadline).
+    """
+    tenant = tenant or _current.get().tenant
+    if timeout is None:
+        timeout = SCHEDULER_TIMEOUT.get(priority, 0)
+    deadline = time.monotonic() + timeout if timeout else None
+    return _current.set(RequestClass(priority, tenant, deadline))
+
+
+def reset(token):
+    if token is not None:
+        _current.reset(token)
+
+
+_stats_lock = threading.Lock()
+_queued = dict.fromkeys(PRIORITIES, 0)
+stats = {name: dict.fromkeys(PRIORITIES, 0) for name in ("admitted", "shed", "expired", "granted")}
+
+
+def _count(name, priority):
+    with _stats_lock:
+        stats[name][priority] += 1
+
+
+def admit(priority):
+    """Fast admission check for a new request: raise Overloaded if its class's queue is full"""
+    with _stats_lock:
+        full = _queued[priority] >= SCHEDULER_MAX_QUEUE[priority]
+        stats["shed" if full else "admitted"][priority] += 1
+    if full:
+        tracing.current().event("shed", priority=priority)
+        raise Overloaded(priority)
+
+
+def tenant_weight(tenant):
+    return max(float(SCHEDULER_TENANT_WEIGHTS.get(tenant, 1.0)), 1e-3)
+
+
+QUEUED, GRANTED, DROPPED = "queued", "granted", "dropped"
+
+
+class Ticket:
+    """A call waiting for a slot: a threading.Event for threads, (loop, future) for tasks"""
+    __slots__ = ("request", "waiter", "state", "enqueued")
+
+    def __init__(self, request, waiter):
+        self.request = request
+        self.waiter = waiter
+        self.state = QUEUED
+        self.enqueued = time.perf_counter()
+
+    def wake(self, state):
+        self.state = state
+        if isinstance(self.waiter, threading.Event):
+            self.waiter.set()
+        else:
+            loop, future = self.waiter
+            loop.call_soon_threadsafe(_resolve, future)
+
+
+def _resolve(future):
+    if not future.done():
+        future.set_result(None)
+
+
+class FairQueue:
+    """Slot waiters of one limiter, by priority class and then weighted fair share per tenant.
+
+    Each ticket gets a virtual finish tag: the later of its class's virtual
+    time and its tenant's previous tag, plus 1 / weight. Serving the smallest
+    tag gives every tenant with waiting calls its weighted share of the slots.
+    Not thread-safe: the owning limiter holds its lock around every call.
+    """
+
+    def __init__(self):
+        self._heap = []
+        self._seq = itertools.count()
+        self._virtual = dict.fromkeys(PRIORITIES, 0.0)
+        self._finish = {}  # (priority, tenant) -> tag of the tenant's last queued call
+        self.size = 0
+
+    def __len__(self):
+        return self.size
+
+    def push(self, waiter, request):
+        """Queue a waiter; requests were already admitted, so this never sheds"""
+        priority = request.priority
+        with _stats_lock:
+            _queued[priority] += 1
+        if SCHEDULER:
+            rank, key = PRIORITIES.index(priority), (priority, request.tenant)
+            tag = max(self._virtual[priority], self._finish.get(key, 0.0)) + 1.0 / tenant_weight(request.tenant)
+            self._finish[key] = tag
+        else:
+            rank, tag = 0, 0.0  # the sequence number alone orders the heap
+        ticket = Ticket(request, waiter)
+        heapq.heappush(self._heap, (rank, tag, next(self._seq), ticket))
+        self.size += 1
+        return ticket
+
+    def pop(self):
+        """Grant the next live ticket, dropping expired ones on the way; None when empty"""
+        while self._heap:
+            _, tag, _, ticket = heapq.heappop(self._heap)
+            if ticket.state != QUEUED:
+                continue  # discarded by a waiter that gave up
+            priority = ticket.request.priority
+            self._virtual[priority] = tag
+            self._forget(ticket)
+            if ticket.request.expired():
+                _count("expired", priority)
+                ticket.wake(DROPPED)
+                continue
+            _count("granted", priority)
+            tracing.SCHEDULER_WAIT_SECONDS.observe(time.perf_counter() - ticket.enqueued, priority)
+            ticket.wake(GRANTED)
+            return ticket
+        return None
+
+    def discard(self, ticket, expired=False):
+        """Remove a ticket whose waiter gave up (cancelled, or its deadline passed)"""
+        if ticket.state == QUEUED:
+            ticket.state = DROPPED
+            self._forget(ticket)
+            if expired:
+                _count("expired", ticket.request.priority)
+
+    def _forget(self, ticket):
+        self.size -= 1
+        with _stats_lock:
+            _queued[ticket.request.priority] -= 1
+        if len(self._finish) > 4096:
+            # Tenants that are not ahead of their class's virtual time restart from it anyway
+            self._finish = {key: tag for key, tag in self._finish.items() if tag > self._virtual[key[0]]}
+
+
+def info():
+    with _stats_lock:
+        classes = {
+            priority: {
+                "queued": _queued[priority],
+                "max_queue": SCHEDULER_MAX_QUEUE[priority],
+                "timeout": SCHEDULER_TIMEOUT[priority],
+                **{name: counts[priority] for name, counts in stats.items()},
+            }
+            for priority in PRIORITIES
+        }
+    return {"enabled": SCHEDULER, "classes": classes}
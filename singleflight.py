@@ -0,0 +1,139 @@
+# singleflight.py
+"""Single-flight coalescing of identical in-flight LLM calls.
+
+When a prompt (same normalized text, model and parameters, see
+llm_cache.make_key) is requested while a call for it is still running, the
+newcomer waits for that call and gets its result, or its exception, instead
+of sending another upstream request. Sync callers wait on the leader's event;
+async callers await the leader's task through asyncio.shield, so a cancelled
+waiter (a hedge loser, a client that went away) does not cancel the call the
+others still wait for. The call is cancelled only once every waiter is gone.
+
+Nothing is kept after a call finishes: later repeats are the response
+cache's job (llm_cache.py). Set SINGLE_FLIGHT=0 to send every call upstream.
+"""
+import asyncio
+import os
+import threading
+
+import tracing
+
+SINGLE_FLIGHT = os.getenv("SINGLE_FLIGHT", "1") != "0"
+
+
+class _Flight:
+    __slots__ = ("done", "result", "error", "task", "waiters")
+
+    def __init__(self, task=None):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+        self.task = task
+        self.waiters = 0
+
+
+class FlightGroup:
+    """Coalesces concurrent calls by key; sync and async calls are tracked separately"""
+
+    def __init__(self, name):
+        self.name = name
+        self._lock = threading.Lock()
+        self._calls = {}  # key -> _Flight run by a thread
+        self._tasks = {}  # (loop, key) -> _Flight run by a task on that loop
+        self.leaders = 0
+        self.coalesced = 0
+        self.errors = 0
+        self.cancelled = 0
+
+    def do(self, key, fn):
+        """Return fn(), sharing one call among threads asking for the same key"""
+        if not SINGLE_FLIGHT:
+            return fn()
+        with self._lock:
+            flight = self._calls.get(key)
+            leader = flight is None
+            if leader:
+                flight = self._calls[key] = _Flight()
+                self.leaders += 1
+            else:
+                self.coalesced += 1
+        if not leader:
+            tracing.current().event("coalesced", group=self.name)
+            flight.done.wait()
+            if flight.error is not None:
+                raise flight.error
+            return flight.result
+        try:
+            flight.result = fn()
+            return flight.result
+        except BaseException as e:
+            flight.error = e
+            with self._lock:
+                self.errors += 1
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+            flight.done.set()
+
+    async def ado(self, key, factory):
+        """Return await factory(), sharing one call among tasks asking for the same key"""
+        if not SINGLE_FLIGHT:
+            return await factory()
+        loop = asyncio.get_running_loop()
+        slot = (loop, key)
+        with self._lock:
+            flight = self._tasks.get(slot)
+            if flight is None:
+                # The task copies the leader's context, so its spans join the leader's trace
+                flight = self._tasks[slot] = _Flight(loop.create_task(factory()))
+                flight.task.add_done_callback(lambda task: self._finished(slot, task))
+                self.leaders += 1
+            else:
+                self.coalesced += 1
+                tracing.current().event("coalesced", group=self.name)
+        flight.waiters += 1
+        try:
+            return await asyncio.shield(flight.task)
+        except asyncio.CancelledError:
+            if flight.waiters == 1 and not flight.task.done():
+                flight.task.cancel()
+            raise
+        finally:
+            flight.waiters -= 1
+
+    def _finished(self, slot, task):
+        with self._lock:
+            self._tasks.pop(slot, None)
+            if task.cancelled():
+                self.cancelled += 1
+            # Retrieving the exception also keeps asyncio from logging it
+            # when every waiter was cancelled before the call failed
+            elif task.exception() is not None:
+                self.errors += 1
+
+    def info(self):
+        with self._lock:
+            return {
+                "enabled": SINGLE_FLIGHT,
+                "in_flight": len(self._calls) + len(self._tasks),
+                "leaders": self.leaders,
+                "coalesced": self.coalesced,
+                "errors": self.errors,
+                "cancelled": self.cancelled,
+            }
+
+
+groups = {}
+_groups_lock = threading.Lock()
+
+
+def get_flight_group(name):
+    """Return the shared flight group for name (one per provider)"""
+    group = groups.get(name)
+    if group is None:
+        with _groups_lock:
+            group = groups.get(name)
+            if group is None:
+                group = groups[name] = FlightGroup(name)
+    return group
@@ -0,0 +1,16 @@
+import os
+import sys
+import tempfile
+
+# Modules read their settings at import; keep state out of the working tree
+# and every provider offline before any of them is imported
+_state = tempfile.mkdtemp(prefix="app-tests-")
+os.environ.update(
+    GROQ_API_KEY="",
+    LLM_CACHE="off",
+    CONVERSATION_DB_PATH=os.path.join(_state, "conversations.sqlite3"),
+    CAMPAIGN_DB_PATH=os.path.join(_state, "campaigns.sqlite3"),
+    WHATSAPP_DB_PATH=os.path.join(_state, "whatsapp.sqlite3"),
+    TTS_CACHE_DIR=os.path.join(_state, "tts"),
+)
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
@@ -0,0 +1,33 @@
+import llm_cache
+
+
+def test_semantic_index_evicts_the_least_recently_used_entry_across_scopes():
+    index = llm_cache.SemanticIndex(max_entries=3)
+    index.add("quiet", "q1", "the only quiet prompt")
+    index.add("busy", "b1", "first busy prompt")
+    index.add("busy", "b2", "second busy prompt")
+    index.add("quiet", "q1", "the only quiet prompt")
+    index.add("busy", "b3", "third busy prompt")
+
+    # b1 is the oldest overall; the quiet scope's entry was stored again since
+    assert index.nearest("busy", "first busy prompt", 0.99) is None
+    assert index.nearest("quiet", "the only quiet prompt", 0.99) == "q1"
+
+    # A near-duplicate hit counts as a use: b2 now outlives the newer b3
+    assert index.nearest("busy", "second busy prompt", 0.99) == "b2"
+    index.add("busy", "b4", "fourth busy prompt")
+    assert index.nearest("busy", "third busy prompt", 0.99) is None
+    assert index.nearest("busy", "second busy prompt", 0.99) == "b2"
+
+
+def test_sqlite_hits_keep_entries_from_eviction(tmp_path):
+    value = "x" * 100
+    backend = llm_cache.SqliteBackend(str(tmp_path / "cache.sqlite3"), max_bytes=250)
+    backend.set("a", value)
+    backend.set("b", value)
+    assert backend.get("a") == value
+    backend.set("c", value)
+
+    assert backend.get("a") == value
+    assert backend.get("b") is None
+    assert backend.stats.evictions == 1
@@ -0,0 +1,20 @@
+from prompts import API_KEY_MISSING, clean_message
+
+
+def test_completion_without_an_emoji_gets_the_campaign_emoji():
+    assert clean_message("Big sale today!", "reminder") == "⏰ Big sale today!"
+
+
+def test_explanation_around_the_message_is_dropped():
+    completion = 'Here is your message:\n"🔥 Grab yours now!"\nThis message creates urgency.'
+    assert clean_message(completion) == "🔥 Grab yours now!"
+
+
+def test_long_completion_is_cut_at_a_word_boundary():
+    message = clean_message("🔥 " + "word " * 100)
+    assert len(message) <= 280 and message.endswith("word…")
+
+
+def test_sentinel_and_empty_replies_are_not_decorated():
+    assert clean_message(API_KEY_MISSING) == API_KEY_MISSING
+    assert clean_message("  ") == ""
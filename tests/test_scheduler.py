@@ -0,0 +1,117 @@
+import asyncio
+import threading
+import time
+
+import pytest
+
+import scheduler
+from rate_limit import AIMDLimiter
+
+
+def request(priority="marketing", tenant="t", timeout=None):
+    deadline = time.monotonic() + timeout if timeout is not None else None
+    return scheduler.RequestClass(priority, tenant, deadline)
+
+
+def drain(queue):
+    """Pop every ticket; returns the requests in the order they were granted"""
+    granted = []
+    while True:
+        ticket = queue.pop()
+        if ticket is None:
+            return granted
+        granted.append(ticket.request)
+
+
+def test_higher_priority_classes_are_served_first():
+    queue = scheduler.FairQueue()
+    for priority in ("bulk", "marketing", "interactive", "bulk", "interactive"):
+        queue.push(threading.Event(), request(priority))
+    assert [r.priority for r in drain(queue)] == ["interactive", "interactive", "marketing", "bulk", "bulk"]
+
+
+def test_tenants_share_slots_by_weight(monkeypatch):
+    monkeypatch.setattr(scheduler, "SCHEDULER_TENANT_WEIGHTS", {"big": 2})
+    queue = scheduler.FairQueue()
+    # The small tenant queued its burst first; arrival order alone would serve it all first
+    for _ in range(6):
+        queue.push(threading.Event(), request(tenant="small"))
+    for _ in range(6):
+        queue.push(threading.Event(), request(tenant="big"))
+
+    first = [r.tenant for r in drain(queue)][:6]
+    assert first.count("big") == 4 and first.count("small") == 2
+
+
+def test_fifo_when_the_scheduler_is_off(monkeypatch):
+    monkeypatch.setattr(scheduler, "SCHEDULER", False)
+    queue = scheduler.FairQueue()
+    for priority in ("bulk", "interactive", "marketing"):
+        queue.push(threading.Event(), request(priority))
+    assert [r.priority for r in drain(queue)] == ["bulk", "interactive", "marketing"]
+
+
+def test_admit_sheds_new_requests_while_the_class_queue_is_full(monkeypatch):
+    monkeypatch.setitem(scheduler.SCHEDULER_MAX_QUEUE, "marketing", 2)
+    queue = scheduler.FairQueue()
+    scheduler.admit("marketing")
+    tickets = [queue.push(threading.Event(), request()) for _ in range(2)]
+    try:
+        with pytest.raises(scheduler.Overloaded) as shed:
+            scheduler.admit("marketing")
+        assert shed.value.retry_after == scheduler.SCHEDULER_RETRY_AFTER
+        # Other classes are unaffected
+        scheduler.admit("interactive")
+    finally:
+        for ticket in tickets:
+            queue.discard(ticket)
+    scheduler.admit("marketing")
+
+
+def test_pop_drops_tickets_whose_deadline_passed():
+    queue = scheduler.FairQueue()
+    expired = queue.push(threading.Event(), request(timeout=0))
+    live = queue.push(threading.Event(), request())
+    assert queue.pop() is live
+    assert expired.state == scheduler.DROPPED and expired.waiter.is_set()
+    assert len(queue) == 0
+
+
+def test_threaded_waiter_expires_while_queued():
+    limiter = AIMDLimiter(1, initial=1)
+    limiter.acquire(request())
+    started = time.monotonic()
+    with pytest.raises(scheduler.DeadlineExceeded):
+        limiter.acquire(request(timeout=0.05))
+    assert time.monotonic() - started < 1.0
+    assert len(limiter._waiters) == 0
+    # The expired waiter must not be handed the slot when it frees up
+    limiter.release(feedback=False)
+    assert limiter.in_flight == 0
+
+
+def test_async_waiter_expires_while_queued():
+    limiter = AIMDLimiter(1, initial=1)
+
+    async def main():
+        await limiter.aacquire(request())
+        with pytest.raises(scheduler.DeadlineExceeded):
+            await limiter.aacquire(request(timeout=0.05))
+        assert len(limiter._waiters) == 0
+        limiter.release(feedback=False)
+
+    asyncio.run(main())
+    assert limiter.in_flight == 0
+
+
+def test_async_waiter_gets_the_slot_before_its_deadline():
+    limiter = AIMDLimiter(1, initial=1)
+
+    async def main():
+        await limiter.aacquire(request())
+        asyncio.get_running_loop().call_later(0.02, lambda: limiter.release(feedback=False))
+        await limiter.aacquire(request(timeout=1.0))
+        limiter.release(feedback=False)
+
+    asyncio.run(main())
+    assert limiter.in_flight == 0
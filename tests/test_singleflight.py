@@ -0,0 +1,125 @@
+import asyncio
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+from singleflight import FlightGroup
+
+
+def test_concurrent_threads_share_one_call():
+    group = FlightGroup("test")
+    calls = []
+    release = threading.Event()
+
+    def fn():
+        calls.append(1)
+        release.wait(5)
+        return "result"
+
+    with ThreadPoolExecutor(4) as pool:
+        futures = [pool.submit(group.do, "key", fn) for _ in range(4)]
+        while group.leaders + group.coalesced < 4:
+            time.sleep(0.01)
+        release.set()
+        results = [future.result(5) for future in futures]
+
+    assert results == ["result"] * 4
+    assert len(calls) == 1
+    assert (group.leaders, group.coalesced) == (1, 3)
+
+
+def test_thread_error_reaches_every_waiter_and_the_key_is_released():
+    group = FlightGroup("test")
+    release = threading.Event()
+
+    def fail():
+        release.wait(5)
+        raise ValueError("upstream down")
+
+    with ThreadPoolExecutor(3) as pool:
+        futures = [pool.submit(group.do, "key", fail) for _ in range(3)]
+        while group.leaders + group.coalesced < 3:
+            time.sleep(0.01)
+        release.set()
+        for future in futures:
+            with pytest.raises(ValueError, match="upstream down"):
+                future.result(5)
+
+    assert group.info()["in_flight"] == 0
+    # The next call runs again instead of reusing the failure
+    assert group.do("key", lambda: "recovered") == "recovered"
+
+
+def test_concurrent_tasks_share_one_call():
+    group = FlightGroup("test")
+    calls = []
+
+    async def call():
+        calls.append(1)
+        await asyncio.sleep(0.05)
+        return "result"
+
+    async def main():
+        return await asyncio.gather(*(group.ado("key", call) for _ in range(5)))
+
+    assert asyncio.run(main()) == ["result"] * 5
+    assert len(calls) == 1
+    assert group.info()["in_flight"] == 0
+
+
+def test_task_error_reaches_every_waiter_and_the_key_is_released():
+    group = FlightGroup("test")
+    calls = []
+
+    async def fail():
+        calls.append(1)
+        await asyncio.sleep(0.05)
+        raise ValueError("upstream down")
+
+    async def main():
+        results = await asyncio.gather(*(group.ado("key", fail) for _ in range(3)), return_exceptions=True)
+        assert all(isinstance(result, ValueError) for result in results)
+        assert group.info()["in_flight"] == 0
+
+        async def ok():
+            return "recovered"
+        return await group.ado("key", ok)
+
+    assert asyncio.run(main()) == "recovered"
+    assert len(calls) == 1 and group.errors == 1
+
+
+def test_cancelled_waiter_does_not_cancel_the_shared_call():
+    group = FlightGroup("test")
+
+    async def call():
+        await asyncio.sleep(0.05)
+        return "result"
+
+    async def main():
+        first = asyncio.ensure_future(group.ado("key", call))
+        second = asyncio.ensure_future(group.ado("key", call))
+        await asyncio.sleep(0)
+        first.cancel()
+        return await second
+
+    assert asyncio.run(main()) == "result"
+    assert group.cancelled == 0
+
+
+def test_different_keys_run_separately():
+    group = FlightGroup("test")
+    calls = []
+
+    async def call(key):
+        calls.append(key)
+        await asyncio.sleep(0.01)
+        return key
+
+    async def main():
+        return await asyncio.gather(group.ado("a", lambda: call("a")), group.ado("b", lambda: call("b")))
+
+    assert asyncio.run(main()) == ["a", "b"]
+    assert sorted(calls) == ["a", "b"]
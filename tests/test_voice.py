@@ -0,0 +1,111 @@
+import asyncio
+import os
+
+import pytest
+
+import voice
+
+
+class FakeStream:
+    """Stands in for the ElevenLabs streaming response"""
+
+    def __init__(self, chunks, fail_after=None, delay=0.0):
+        self.chunks = chunks
+        self.fail_after = fail_after
+        self.delay = delay
+        self.closed = False
+
+    async def aiter_bytes(self):
+        for number, chunk in enumerate(self.chunks):
+            if number == self.fail_after:
+                raise ConnectionError("stream broke")
+            await asyncio.sleep(self.delay)
+            yield chunk
+
+    async def aclose(self):
+        self.closed = True
+
+
+@pytest.fixture
+def tts(tmp_path, monkeypatch):
+    """A fresh cache and a fake API; returns (cache, opened streams, next stream's settings)"""
+    cache = voice.AudioCache(str(tmp_path), max_bytes=10_000)
+    opened = []
+    settings = {"chunks": [b"a" * 1000, b"b" * 1000], "fail_after": None, "delay": 0.0}
+
+    async def open_stream(client, text, voice_id, model):
+        stream = FakeStream(**settings)
+        opened.append(stream)
+        return stream
+
+    monkeypatch.setattr(voice, "get_audio_cache", lambda: cache)
+    monkeypatch.setattr(voice, "_open_stream", open_stream)
+    monkeypatch.setattr(voice, "ELEVENLABS_API_KEY", "test-key")
+    return cache, opened, settings
+
+
+async def collect(text):
+    return b"".join([chunk async for chunk in voice.astream_voice(text)])
+
+
+def test_miss_streams_and_caches_then_hit_reads_the_file(tts):
+    cache, opened, _ = tts
+    assert asyncio.run(collect("hello")) == b"a" * 1000 + b"b" * 1000
+    assert len(opened) == 1 and opened[0].closed
+    assert os.path.getsize(cache.path(voice.audio_key("hello"))) == 2000
+
+    assert asyncio.run(collect("hello")) == b"a" * 1000 + b"b" * 1000
+    assert len(opened) == 1
+    assert cache.info()["hits"] == 1 and cache.info()["misses"] == 1
+
+
+def test_concurrent_misses_share_one_synthesis(tts):
+    _, opened, settings = tts
+    settings["delay"] = 0.05
+
+    async def both():
+        return await asyncio.gather(collect("shared"), collect("shared"), voice.asynthesize("shared"))
+
+    first, second, path = asyncio.run(both())
+    assert first == second == b"a" * 1000 + b"b" * 1000
+    assert os.path.exists(path)
+    assert len(opened) == 1
+
+
+def test_least_recently_used_audio_is_evicted(tts):
+    cache, _, settings = tts
+    settings["chunks"] = [b"x" * 4000]
+    for text in ("one", "two"):
+        asyncio.run(collect(text))
+    asyncio.run(collect("one"))  # now the most recently used
+    asyncio.run(collect("three"))
+
+    assert not os.path.exists(cache.path(voice.audio_key("two")))
+    assert os.path.exists(cache.path(voice.audio_key("one")))
+    assert cache.info()["evictions"] == 1 and cache.info()["bytes"] == 8000
+
+
+def test_file_evicted_after_lookup_is_synthesized_again(tts, monkeypatch):
+    cache, opened, _ = tts
+    asyncio.run(collect("hello"))
+    lookup = cache.lookup
+
+    def lookup_then_evict(key):
+        path = lookup(key)
+        os.remove(path)
+        return path
+
+    monkeypatch.setattr(cache, "lookup", lookup_then_evict)
+    assert asyncio.run(collect("hello")) == b"a" * 1000 + b"b" * 1000
+    assert len(opened) == 2
+
+
+def test_broken_stream_leaves_no_partial_audio(tts):
+    cache, opened, settings = tts
+    settings["fail_after"] = 1
+    with pytest.raises(ConnectionError):
+        asyncio.run(collect("broken"))
+
+    assert opened[0].closed
+    assert os.listdir(cache.directory) == []
+    assert cache.info()["files"] == 0
@@ -0,0 +1,157 @@
+import asyncio
+import hashlib
+import hmac
+import json
+import time
+
+import pytest
+
+import whatsapp
+from runtime import runtime
+
+
+def payload(*messages):
+    return {"entry": [{"changes": [{"value": {"messages": [
+        {"id": message_id, "from": sender, "type": "text", "text": {"body": text}}
+        for message_id, sender, text in messages
+    ]}}]}]}
+
+
+class RecordingInbox:
+    def __init__(self):
+        self.finished = []
+
+    def finish(self, results):
+        self.finished.extend(results)
+
+    def prune(self):
+        return 0
+
+    def counts(self):
+        return {}
+
+
+@pytest.fixture
+def posted(monkeypatch):
+    """Replace the Cloud API call; records (sender, reply) in delivery order"""
+    sent = []
+    delays = {}
+
+    async def post(client, message, reply):
+        await asyncio.sleep(delays.get(reply, 0.0))
+        sent.append((message.sender, reply))
+
+    monkeypatch.setattr(whatsapp, "_post_message", post)
+    return sent, delays
+
+
+def wait_for(condition, timeout=5.0):
+    end = time.monotonic() + timeout
+    while not condition():
+        assert time.monotonic() < end, "timed out"
+        time.sleep(0.01)
+
+
+def test_duplicate_message_id_is_recorded_once(tmp_path):
+    inbox = whatsapp.Inbox(str(tmp_path / "inbox.sqlite3"))
+    message = whatsapp.Message("wamid.1", "15550001", "hi")
+    assert inbox.add([message]) == [message]
+    assert inbox.add([message]) == []
+    assert inbox.counts() == {"pending": 1}
+
+
+def test_redelivered_payload_is_acknowledged_but_not_queued(tmp_path, monkeypatch):
+    gateway = whatsapp.WhatsAppGateway(whatsapp.Inbox(str(tmp_path / "inbox.sqlite3")))
+    queued = []
+    monkeypatch.setattr(gateway, "_enqueue", queued.extend)
+    body = payload(("wamid.1", "15550001", "hi"), ("wamid.2", "15550001", "still there?"))
+
+    assert gateway.receive(body) == {"accepted": 2, "duplicates": 0, "ignored": 0}
+    assert gateway.receive(body) == {"accepted": 0, "duplicates": 2, "ignored": 0}
+    assert [message.id for message in queued] == ["wamid.1", "wamid.2"]
+
+
+@pytest.fixture
+def client():
+    from app import app
+    return app.test_client()
+
+
+def test_unsigned_post_is_rejected_without_a_secret(client, monkeypatch):
+    monkeypatch.setattr(whatsapp, "WHATSAPP_APP_SECRET", None)
+    monkeypatch.setattr(whatsapp, "WHATSAPP_INSECURE_WEBHOOK", False)
+    response = client.post("/webhook/whatsapp", json=payload(("wamid.1", "15550001", "hi")))
+    assert response.status_code == 403
+
+
+def test_signature_is_checked_against_the_app_secret(client, monkeypatch):
+    monkeypatch.setattr(whatsapp, "WHATSAPP_APP_SECRET", "app-secret")
+    received = []
+
+    class Gateway:
+        def receive(self, body):
+            received.append(body)
+            return {"accepted": 1, "duplicates": 0, "ignored": 0}
+
+    monkeypatch.setattr(whatsapp, "get_whatsapp_gateway", Gateway)
+    body = json.dumps(payload(("wamid.1", "15550001", "hi"))).encode("utf-8")
+    signature = "sha256=" + hmac.new(b"app-secret", body, hashlib.sha256).hexdigest()
+    headers = {"Content-Type": "application/json"}
+
+    forged = client.post("/webhook/whatsapp", data=body, headers={**headers, "X-Hub-Signature-256": "sha256=0"})
+    assert forged.status_code == 403
+    signed = client.post("/webhook/whatsapp", data=body, headers={**headers, "X-Hub-Signature-256": signature})
+    assert signed.status_code == 200
+    assert len(received) == 1
+
+
+def queue_replies(gateway, replies):
+    def put():
+        for number, (sender, reply) in enumerate(replies):
+            gateway._outbox.put_nowait((whatsapp.Message(f"wamid.{number}", sender, "hi"), reply))
+    runtime.loop.call_soon_threadsafe(put)
+
+
+def test_replies_are_flushed_in_batches(posted):
+    sent, _ = posted
+    inbox = RecordingInbox()
+    gateway = whatsapp.WhatsAppGateway(inbox, workers=0, batch_size=4, batch_wait=0.05)
+    gateway.start()
+    queue_replies(gateway, [(f"1555000{i}", f"reply {i}") for i in range(10)])
+
+    # Ten replies collected within one wait go out as ceil(10 / 4) batches
+    wait_for(lambda: gateway.info()["batches"] == 3)
+    assert len(inbox.finished) == 10
+    assert sorted(reply for _, reply in sent) == sorted(f"reply {i}" for i in range(10))
+    assert {status for _, status, _ in inbox.finished} == {"sent"}
+
+
+def test_one_senders_replies_are_delivered_in_order(posted):
+    sent, delays = posted
+    # The first reply is the slowest to send; it must still arrive first
+    delays.update({"first": 0.2, "second": 0.1})
+    gateway = whatsapp.WhatsAppGateway(RecordingInbox(), workers=0, batch_size=10, batch_wait=0.02)
+    gateway.start()
+    queue_replies(gateway, [("15550001", "first"), ("15550002", "other"), ("15550001", "second")])
+
+    wait_for(lambda: len(sent) == 3)
+    assert [reply for sender, reply in sent if sender == "15550001"] == ["first", "second"]
+
+
+def test_drain_waits_for_batches_being_sent(posted):
+    sent, delays = posted
+    delays["slow"] = 0.3
+    inbox = RecordingInbox()
+    gateway = whatsapp.WhatsAppGateway(inbox, workers=0, batch_size=10, batch_wait=0)
+    gateway.start()
+    queue_replies(gateway, [("15550001", "slow")])
+    wait_for(lambda: gateway._sending)
+
+    gateway.drain(timeout=5)
+    assert sent == [("15550001", "slow")]
+    assert inbox.finished == [("wamid.0", "sent", "slow")]
+
+
+def test_drain_is_a_no_op_before_start():
+    # No loop work is scheduled for a gateway that never received anything
+    whatsapp.WhatsAppGateway(RecordingInbox()).drain(timeout=1)
@@ -0,0 +1,313 @@
+# tracing.py
+"""Lightweight request tracing and Prometheus metrics.
+
+Every Flask request starts a trace; LangGraph nodes, provider calls (via the
+limiters in rate_limit.py), cache hits and fallbacks add spans, attributes and
+events to whatever trace is current. The current span lives in a contextvar,
+so it follows the request onto the shared event loop (see runtime.submit) and
+into the tasks it spawns. Recent traces are kept in memory for
+``/debug/traces/<trace_id>``; histograms and counters are rendered in the
+Prometheus text format for ``/metrics``.
+
+Set TRACING=0 to turn spans and metrics off entirely.
+"""
+import contextvars
+import functools
+import inspect
+import itertools
+import os
+import threading
+import time
+from bisect import bisect_left
+from collections import OrderedDict
+
+TRACING = os.getenv("TRACING", "1") != "0"
+TRACE_BUFFER_SIZE = int(os.getenv("TRACE_BUFFER_SIZE", "256"))
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+
+def _format_labels(names, values, extra=None):
+    pairs = list(zip(names, values))
+    if extra:
+        pairs.append(extra)
+    if not pairs:
+        return ""
+    escaped = (str(v).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n") for _, v in pairs)
+    return "{" + ",".join(f'{k}="{v}"' for (k, _), v in zip(pairs, escaped)) + "}"
+
+
+class Counter:
+    def __init__(self, name, help, labelnames=()):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, *labels, amount=1):
+        if not TRACING:
+            return
+        with self._lock:
+            self._values[labels] = self._values.get(labels, 0) + amount
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} counter"]
+        with self._lock:
+            items = sorted(self._values.items())
+        for labels, value in items:
+            lines.append(f"{self.name}{_format_labels(self.labelnames, labels)} {value}")
+        return lines
+
+
+class Histogram:
+    def __init__(self, name, help, labelnames=(), buckets=DEFAULT_BUCKETS):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(buckets)
+        self._values = {}  # labels -> [per-bucket counts (+Inf last), sum]
+        self._lock = threading.Lock()
+
+    def observe(self, value, *labels):
+        if not TRACING:
+            return
+        index = bisect_left(self.buckets, value)
+        with self._lock:
+            entry = self._values.get(labels)
+            if entry is None:
+                entry = self._values[labels] = [[0] * (len(self.buckets) + 1), 0.0]
+            entry[0][index] += 1
+            entry[1] += value
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            items = sorted((labels, list(counts), total) for labels, (counts, total) in self._values.items())
+        for labels, counts, total in items:
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float("inf"),), counts):
+                cumulative += count
+                le = "+Inf" if bound == float("inf") else repr(bound)
+                lines.append(f"{self.name}_bucket{_format_labels(self.labelnames, labels, ('le', le))} {cumulative}")
+            lines.append(f"{self.name}_sum{_format_labels(self.labelnames, labels)} {total}")
+            lines.append(f"{self.name}_count{_format_labels(self.labelnames, labels)} {cumulative}")
+        return lines
+
+
+HTTP_SECONDS = Histogram("http_request_duration_seconds", "Time to produce the response",
+                         ("route", "method", "status"))
+NODE_SECONDS = Histogram("graph_node_duration_seconds", "LangGraph node duration", ("node",))
+LLM_SECONDS = Histogram("llm_request_duration_seconds", "Provider call duration (network, per attempt)",
+                        ("provider", "model", "outcome"))
+LLM_QUEUE_SECONDS = Histogram("llm_queue_wait_seconds", "Time waiting for rate-limit budget and a slot",
+                              ("provider", "model"))
+LLM_TOKENS = Counter("llm_tokens_total", "Tokens sent to and received from providers",
+                     ("provider", "model", "direction"))
+SCHEDULER_WAIT_SECONDS = Histogram("scheduler_wait_seconds", "Time a queued LLM call waited for a concurrency slot",
+                                   ("priority",))
+FALLBACKS = Counter("llm_fallbacks_total", "Responses replaced by a fallback", ("reason",))
+
+METRICS = [HTTP_SECONDS, NODE_SECONDS, LLM_SECONDS, LLM_QUEUE_SECONDS, SCHEDULER_WAIT_SECONDS, LLM_TOKENS, FALLBACKS]
+# Callables returning extra exposition lines (e.g. cache and limiter counters)
+COLLECTORS = []
+
+
+def render_metrics():
+    lines = []
+    for metric in METRICS:
+        lines.extend(metric.render())
+    for collect in COLLECTORS:
+        lines.extend(collect())
+    return "\n".join(lines) + "\n"
+
+
+# Span ids only need to be unique within a trace
+_span_ids = itertools.count(1)
+
+
+class Span:
+    __slots__ = ("trace", "name", "span_id", "parent_id", "start", "end", "attrs", "events")
+
+    def __init__(self, trace, name, parent_id, attrs):
+        self.trace = trace
+        self.name = name
+        self.span_id = next(_span_ids)
+        self.parent_id = parent_id
+        self.start = time.perf_counter()
+        self.end = None
+        self.attrs = attrs
+        self.events = []
+
+    def set(self, **attrs):
+        self.attrs.update(attrs)
+
+    def event(self, name, **attrs):
+        self.events.append((name, time.perf_counter(), attrs))
+
+    def finish(self):
+        if self.end is None:
+            self.end = time.perf_counter()
+
+    @property
+    def duration(self):
+        return (self.end or time.perf_counter()) - self.start
+
+    def to_dict(self):
+        t0 = self.trace.started
+        return {
+            "name": self.name,
+            "span_id": self.span_id,
+            "parent_id": self.parent_id,
+            "start_ms": round((self.start - t0) * 1000, 3),
+            "duration_ms": round(self.duration * 1000, 3),
+            "attrs": self.attrs,
+            "events": [dict(name=name, at_ms=round((at - t0) * 1000, 3), **attrs)
+                       for name, at, attrs in self.events],
+        }
+
+
+class _NullSpan:
+    """Stands in for a span when no trace is active, so callers never need to check"""
+
+    __slots__ = ()
+
+    def set(self, **attrs):
+        pass
+
+    def event(self, name, **attrs):
+        pass
+
+    def finish(self):
+        pass
+
+
+NULL_SPAN = _NullSpan()
+
+
+class Trace:
+    def __init__(self, name):
+        self.trace_id = os.urandom(16).hex()
+        self.name = name
+        self.started = time.perf_counter()
+        self.wall_time = time.time()
+        self.spans = []
+        self.root = self.new_span(name, None, {})
+
+    def new_span(self, name, parent_id, attrs):
+        span = Span(self, name, parent_id, attrs)
+        self.spans.append(span)  # list.append is atomic, spans may come from several threads
+        return span
+
+    def to_dict(self):
+        return {
+            "trace_id": self.trace_id,
+            "name": self.name,
+            "timestamp": self.wall_time,
+            "duration_ms": round(self.root.duration * 1000, 3),
+            "spans": [span.to_dict() for span in list(self.spans)],
+        }
+
+
+_current = contextvars.ContextVar("current_span", default=None)
+_traces = OrderedDict()
+_traces_lock = threading.Lock()
+
+
+def current():
+    """The active span, or a no-op span outside of a trace"""
+    return _current.get() or NULL_SPAN
+
+
+def start_trace(name):
+    """Start a trace and make its root span current; returns (trace, token) or (None, None)"""
+    if not TRACING:
+        return None, None
+    trace = Trace(name)
+    with _traces_lock:
+        _traces[trace.trace_id] = trace
+        while len(_traces) > TRACE_BUFFER_SIZE:
+            _traces.popitem(last=False)
+    return trace, _current.set(trace.root)
+
+
+def end_trace(token):
+    if token is not None:
+        _current.reset(token)
+
+
+def detach():
+    """Run the rest of the current task outside any trace (for background workers)"""
+    _current.set(None)
+
+
+def get_trace(trace_id):
+    with _traces_lock:
+        return _traces.get(trace_id)
+
+
+def recent_traces(limit=20):
+    with _traces_lock:
+        traces = list(_traces.values())[-limit:]
+    return [{"trace_id": t.trace_id, "name": t.name, "timestamp": t.wall_time,
+             "duration_ms": round(t.root.duration * 1000, 3)} for t in reversed(traces)]
+
+
+class span:
+    """Context manager for a child span of the current one (a no-op outside a trace)"""
+
+    __slots__ = ("name", "attrs", "_span", "_token")
+
+    def __init__(self, name, **attrs):
+        self.name = name
+        self.attrs = attrs
+        self._span = NULL_SPAN
+        self._token = None
+
+    def __enter__(self):
+        parent = _current.get()
+        if parent is not None:
+            self._span = parent.trace.new_span(self.name, parent.span_id, self.attrs)
+            self._token = _current.set(self._span)
+        return self._span
+
+    def __exit__(self, exc_type, exc, tb):
+        if self._token is not None:
+            if exc_type is not None:
+                self._span.attrs["error"] = exc_type.__name__
+            self._span.finish()
+            _current.reset(self._token)
+        return False
+
+
+def traced(name, histogram=None, *labels):
+    """Decorator running a sync or async function in a span, optionally timing it into histogram"""
+    def decorate(fn):
+        if inspect.iscoroutinefunction(fn):
+            @functools.wraps(fn)
+            async def wrapper(*args, **kwargs):
+                start = time.perf_counter()
+                try:
+                    with span(name):
+                        return await fn(*args, **kwargs)
+                finally:
+                    if histogram is not None:
+                        histogram.observe(time.perf_counter() - start, *labels)
+        else:
+            @functools.wraps(fn)
+            def wrapper(*args, **kwargs):
+                start = time.perf_counter()
+                try:
+                    with span(name):
+                        return fn(*args, **kwargs)
+                finally:
+                    if histogram is not None:
+                        histogram.observe(time.perf_counter() - start, *labels)
+        return wrapper
+    return decorate
+
+
+def fallback(reason):
+    """Count a fallback response and note it on the current span"""
+    FALLBACKS.inc(reason)
+    current().event("fallback", reason=reason)
@@ -0,0 +1,207 @@
+# variation_pool.py
+"""Pre-generated marketing bundles for instant /generate_marketing responses.
+
+With VARIATION_POOL=1, every (product, campaign_type) that is requested
+repeatedly gets a small pool of ready bundles (main message plus A/B
+variations). Requests take a bundle from the pool in O(1) and only call the
+LLM live on a miss. A background task on the shared event loop refills pools
+while the Groq limiter is mostly idle, generating fresh completions (the
+response cache is bypassed so pooled bundles differ from each other).
+
+Each key's demand is its request count, halved every
+VARIATION_POOL_DEMAND_HALF_LIFE seconds; only keys at VARIATION_POOL_MIN_DEMAND
+or above are refilled, so a one-off product costs no background calls.
+Bundles older than VARIATION_POOL_TTL are dropped, and keys nobody asked for
+within that time are forgotten.
+"""
+import asyncio
+import os
+import threading
+import time
+from collections import OrderedDict, deque
+
+from dotenv import load_dotenv
+
+import scheduler
+import tracing
+from prompts import clean_message
+from rate_limit import get_limiter
+from runtime import runtime
+
+load_dotenv()
+
+VARIATION_POOL = os.getenv("VARIATION_POOL", "0") == "1"
+# Ready bundles kept per (product, campaign_type)
+VARIATION_POOL_SIZE = int(os.getenv("VARIATION_POOL_SIZE", "4"))
+VARIATION_POOL_TTL = float(os.getenv("VARIATION_POOL_TTL", "3600"))
+VARIATION_POOL_MAX_KEYS = int(os.getenv("VARIATION_POOL_MAX_KEYS", "256"))
+VARIATION_POOL_MODEL = os.getenv("VARIATION_POOL_MODEL", "llama3-8b-8192")
+# Decayed request count a key needs before it is refilled; the default means
+# asked for at least twice within about one half-life
+VARIATION_POOL_MIN_DEMAND = float(os.getenv("VARIATION_POOL_MIN_DEMAND", "1.5"))
+VARIATION_POOL_DEMAND_HALF_LIFE = float(os.getenv("VARIATION_POOL_DEMAND_HALF_LIFE", "600"))
+# Refill only while fewer than this fraction of the model's concurrency slots are busy
+VARIATION_POOL_IDLE_FRACTION = float(os.getenv("VARIATION_POOL_IDLE_FRACTION", "0.5"))
+
+
+def pool_key(product_info, campaign_type):
+    return " ".join(product_info.lower().split()), campaign_type
+
+
+class _Entry:
+    __slots__ = ("product_info", "campaign_type", "bundles", "requested", "demand")
+
+    def __init__(self, product_info, campaign_type):
+        self.product_info = product_info
+        self.campaign_type = campaign_type
+        self.bundles = deque()  # (created, message, variations), oldest first
+        self.requested = time.monotonic()
+        self.demand = 0.0  # as of self.requested
+
+    def demand_at(self, now, half_life):
+        return self.demand * 0.5 ** ((now - self.requested) / half_life)
+
+
+class VariationPool:
+    def __init__(self, size=VARIATION_POOL_SIZE, ttl=VARIATION_POOL_TTL, max_keys=VARIATION_POOL_MAX_KEYS,
+                 num_variations=2, model=VARIATION_POOL_MODEL, idle_fraction=VARIATION_POOL_IDLE_FRACTION,
+                 min_demand=VARIATION_POOL_MIN_DEMAND, half_life=VARIATION_POOL_DEMAND_HALF_LIFE):
+        self.size = size
+        self.ttl = ttl
+        self.min_demand = min_demand
+        self.half_life = half_life
+        self.max_keys = max_keys
+        self.num_variations = num_variations
+        self.model = model
+        self.idle_fraction = idle_fraction
+        self._entries = OrderedDict()  # key -> _Entry, least recently requested first
+        self._lock = threading.Lock()
+        self._worker = None
+        self._wake = None
+        self.stats = {"hits": 0, "misses": 0, "stale": 0, "generated": 0, "refill_errors": 0}
+
+    def take(self, product_info, campaign_type):
+        """A ready (message, variations) bundle, or None on a miss (which schedules a refill)"""
+        key = pool_key(product_info, campaign_type)
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                entry = self._entries[key] = _Entry(product_info, campaign_type)
+                while len(self._entries) > self.max_keys:
+                    self._entries.popitem(last=False)
+            else:
+                self._entries.move_to_end(key)
+            entry.demand = entry.demand_at(now, self.half_life) + 1
+            entry.requested = now
+            while entry.bundles and now - entry.bundles[0][0] > self.ttl:
+                entry.bundles.popleft()
+                self.stats["stale"] += 1
+            bundle = entry.bundles.popleft() if entry.bundles else None
+            self.stats["hits" if bundle else "misses"] += 1
+            wanted = entry.demand >= self.min_demand
+        if wanted:
+            self._kick()
+        tracing.current().event("variation_pool", hit=bundle is not None)
+        if bundle is None:
+            return None
+        return bundle[1], list(bundle[2])
+
+    def _kick(self):
+        if self._worker is None:
+            with self._lock:
+                if self._worker is None:
+                    self._worker = runtime.submit(self._run(), daemon=True)
+        if self._wake is not None:
+            runtime.loop.call_soon_threadsafe(self._wake.set)
+
+    def _next_key(self):
+        """The key in demand with the fewest fresh bundles, dropping keys that went cold"""
+        now = time.monotonic()
+        best = None
+        with self._lock:
+            for key, entry in list(self._entries.items()):
+                if now - entry.requested > self.ttl:
+                    del self._entries[key]
+                    continue
+                while entry.bundles and now - entry.bundles[0][0] > self.ttl:
+                    entry.bundles.popleft()
+                    self.stats["stale"] += 1
+                if entry.demand_at(now, self.half_life) < self.min_demand:
+                    continue
+                if len(entry.bundles) < self.size and (best is None or len(entry.bundles) < len(best.bundles)):
+                    best = entry
+        return best
+
+    def _idle(self):
+        concurrency = get_limiter("groq", self.model).concurrency
+        return concurrency.in_flight < concurrency.limit * self.idle_fraction
+
+    async def _generate(self, product_info, campaign_type):
+        from marketing_helper import ab_test_prompt, acomplete_groq, marketing_message_prompt
+        prompts = [marketing_message_prompt(product_info, campaign_type)]
+        prompts.extend(ab_test_prompt(product_info, i, campaign_type) for i in range(self.num_variations))
+        texts = await asyncio.gather(*(
+            acomplete_groq(prompt, model=self.model, use_cache=False) for prompt in prompts
+        ))
+        texts = [clean_message(text, campaign_type) for text in texts]
+        return texts[0], texts[1:]
+
+    async def _run(self):
+        from marketing_helper import GROQ_API_KEY
+        # Started from whichever request missed first; refills belong to no request's trace
+        tracing.detach()
+        scheduler.classify("bulk", scheduler.DEFAULT_TENANT, timeout=0)
+        self._wake = asyncio.Event()
+        while True:
+            entry = self._next_key() if GROQ_API_KEY else None
+            if entry is None:
+                self._wake.clear()
+                try:
+                    await asyncio.wait_for(self._wake.wait(), timeout=self.ttl)
+                except asyncio.TimeoutError:
+                    pass
+                continue
+            if not self._idle():
+                # Live traffic first; look again shortly
+                await asyncio.sleep(0.2)
+                continue
+            try:
+                message, variations = await self._generate(entry.product_info, entry.campaign_type)
+            except Exception as e:
+                print(f"Variation pool refill error: {e}")
+                self.stats["refill_errors"] += 1
+                await asyncio.sleep(1.0)
+                continue
+            with self._lock:
+                entry.bundles.append((time.monotonic(), message, variations))
+                self.stats["generated"] += 1
+
+    def info(self):
+        now = time.monotonic()
+        with self._lock:
+            lookups = self.stats["hits"] + self.stats["misses"]
+            return dict(
+                self.stats,
+                keys=len(self._entries),
+                refilled_keys=sum(1 for entry in self._entries.values()
+                                  if entry.demand_at(now, self.half_life) >= self.min_demand),
+                ready=sum(len(entry.bundles) for entry in self._entries.values()),
+                hit_rate=round(self.stats["hits"] / lookups, 3) if lookups else 0.0,
+            )
+
+
+_variation_pool = None
+_variation_pool_lock = threading.Lock()
+
+
+def get_variation_pool():
+    """Return the process-wide pool, or None unless VARIATION_POOL=1"""
+    global _variation_pool
+    if not VARIATION_POOL:
+        return None
+    if _variation_pool is None:
+        with _variation_pool_lock:
+            if _variation_pool is None:
+                _variation_pool = VariationPool()
+    return _variation_pool
@@ -1,6 +1,334 @@
-import elevenlabs
+# voice.py
+"""Text-to-speech through the ElevenLabs streaming API, with a disk cache.
 
-def generate_voice(text):
-    audio = elevenlabs.generate(text=text, voice="Bella")
-    elevenlabs.save(audio, "voice_message.mp3")
-    return "voice_message.mp3"
+Audio is cached by content: the file name is a hash of (voice, model, text),
+so identical requests are served from disk and concurrent requests never
+write to the same file (each download goes to its own temporary file that is
+renamed into place when complete). The cache is evicted least recently used
+first once it exceeds TTS_CACHE_MAX_BYTES.
+
+Synthesis runs on the shared event loop through the "elevenlabs" provider
+limiter (bounded concurrency, retries with backoff), and audio chunks are
+yielded as they arrive so callers can stream them straight to the client.
+Concurrent misses for the same audio share one synthesis (singleflight.py,
+keyed by audio_key): every request streams the chunks of that one download.
+A synthesis that has started runs to completion and is cached even if its
+client goes away; a failed one leaves nothing behind. File I/O runs in
+threads, off the event loop.
+Point ELEVENLABS_BASE_URL at the local stub (benchmarks/stub_llm.py) to run without the API.
+"""
+import asyncio
+import hashlib
+import os
+import threading
+import time
+import uuid
+import weakref
+from collections import OrderedDict
+
+from dotenv import load_dotenv
+
+import tracing
+from rate_limit import get_limiter
+from runtime import runtime
+from singleflight import get_flight_group
+
+load_dotenv()
+
+ELEVENLABS_API_KEY = os.getenv("ELEVENLABS_API_KEY")
+ELEVENLABS_BASE_URL = os.getenv("ELEVENLABS_BASE_URL", "https://api.elevenlabs.io")
+TTS_MODEL = os.getenv("TTS_MODEL", "eleven_multilingual_v2")
+TTS_VOICE = os.getenv("TTS_VOICE", "Bella")
+TTS_TIMEOUT = float(os.getenv("TTS_TIMEOUT", "60"))
+TTS_CACHE_DIR = os.getenv("TTS_CACHE_DIR", ".tts_cache")
+TTS_CACHE_MAX_BYTES = int(os.getenv("TTS_CACHE_MAX_BYTES", str(256 * 1024 * 1024)))
+TTS_CHUNK_BYTES = 16 * 1024
+
+# Premade voice names -> ids; anything else is passed through as a voice id
+VOICE_IDS = {
+    "Bella": "EXAVITQu4vr4xnSDxMaL",
+    "Rachel": "21m00Tcm4TlvDq8ikWAM",
+    "Adam": "pNInz6obpgDQGcFmaJgB",
+}
+
+# Async clients are bound to the event loop that created them
+_async_clients = weakref.WeakKeyDictionary()
+
+
+def get_async_tts_client():
+    """Return the pooled async HTTP client for the running loop"""
+    loop = asyncio.get_running_loop()
+    client = _async_clients.get(loop)
+    if client is None:
+        import httpx
+        client = httpx.AsyncClient(
+            base_url=ELEVENLABS_BASE_URL,
+            headers={"xi-api-key": ELEVENLABS_API_KEY or ""},
+            limits=httpx.Limits(max_connections=20, max_keepalive_connections=20, keepalive_expiry=60),
+            timeout=TTS_TIMEOUT,
+        )
+        _async_clients[loop] = client
+    return client
+
+
+def audio_key(text, voice=TTS_VOICE, model=TTS_MODEL):
+    return hashlib.sha256(f"{voice}|{model}|{text}".encode("utf-8")).hexdigest()
+
+
+class AudioCache:
+    """Content-addressed mp3 files with LRU eviction by total size"""
+
+    def __init__(self, directory=TTS_CACHE_DIR, max_bytes=TTS_CACHE_MAX_BYTES):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        self._sizes = OrderedDict()  # key -> bytes, least recently used first
+        self._total = 0
+        self.stats = {"hits": 0, "misses": 0, "stores": 0, "evictions": 0}
+        os.makedirs(directory, exist_ok=True)
+        # Recency survives restarts through the files' mtimes (bumped on every hit)
+        entries = []
+        for name in os.listdir(directory):
+            if name.endswith(".mp3"):
+                stat = os.stat(os.path.join(directory, name))
+                entries.append((stat.st_mtime, name[:-4], stat.st_size))
+            elif name.endswith(".part"):
+                # Left over from an interrupted download (recent ones may be another worker's)
+                path = os.path.join(directory, name)
+                if time.time() - os.stat(path).st_mtime > 3600:
+                    os.remove(path)
+        for _, key, size in sorted(entries):
+            self._sizes[key] = size
+            self._total += size
+
+    def path(self, key):
+        return os.path.join(self.directory, f"{key}.mp3")
+
+    def lookup(self, key):
+        """Path of the cached audio, or None"""
+        with self._lock:
+            if key not in self._sizes:
+                self.stats["misses"] += 1
+                return None
+            self._sizes.move_to_end(key)
+            self.stats["hits"] += 1
+        path = self.path(key)
+        try:
+            os.utime(path)
+        except FileNotFoundError:
+            self.forget(key)
+            return None
+        return path
+
+    def forget(self, key):
+        """Drop an entry whose file is gone (evicted or deleted since it was looked up); counts as a miss"""
+        with self._lock:
+            if key in self._sizes:
+                self._total -= self._sizes.pop(key)
+                self.stats["hits"] -= 1
+                self.stats["misses"] += 1
+
+    def temp_path(self, key):
+        return os.path.join(self.directory, f"{key}.{uuid.uuid4().hex}.part")
+
+    def commit(self, key, temp_path):
+        """Move a finished download into place and evict down to the size budget"""
+        size = os.path.getsize(temp_path)
+        os.replace(temp_path, self.path(key))
+        evicted = []
+        with self._lock:
+            self._total += size - self._sizes.pop(key, 0)
+            self._sizes[key] = size
+            self.stats["stores"] += 1
+            while self._total > self.max_bytes and len(self._sizes) > 1:
+                old_key, old_size = self._sizes.popitem(last=False)
+                self._total -= old_size
+                self.stats["evictions"] += 1
+                evicted.append(old_key)
+        for old_key in evicted:
+            try:
+                os.remove(self.path(old_key))
+            except FileNotFoundError:
+                pass
+        return self.path(key)
+
+    def info(self):
+        with self._lock:
+            return dict(self.stats, files=len(self._sizes), bytes=self._total)
+
+
+_audio_cache = None
+_audio_cache_lock = threading.Lock()
+
+
+def get_audio_cache():
+    global _audio_cache
+    if _audio_cache is None:
+        with _audio_cache_lock:
+            if _audio_cache is None:
+                _audio_cache = AudioCache()
+    return _audio_cache
+
+
+async def _open_cached(cache, key):
+    """The cached mp3 for key opened for reading, or None on a miss; file I/O runs off the loop"""
+    path = await asyncio.to_thread(cache.lookup, key)
+    if path is None:
+        return None
+    try:
+        # Once open the file stays readable even if it is evicted meanwhile
+        return await asyncio.to_thread(open, path, "rb")
+    except FileNotFoundError:
+        cache.forget(key)
+        return None
+
+
+async def _read_file(f):
+    try:
+        while True:
+            chunk = await asyncio.to_thread(f.read, TTS_CHUNK_BYTES)
+            if not chunk:
+                return
+            yield chunk
+    finally:
+        f.close()
+
+
+async def _open_stream(client, text, voice, model):
+    response = await client.send(
+        client.build_request(
+            "POST", f"/v1/text-to-speech/{VOICE_IDS.get(voice, voice)}/stream",
+            params={"output_format": "mp3_44100_128"},
+            json={"text": text, "model_id": model},
+        ),
+        stream=True,
+    )
+    if response.status_code >= 400:
+        await response.aread()
+        await response.aclose()
+        response.raise_for_status()
+    return response
+
+
+class _Download:
+    """A synthesis in progress; every request for the same audio follows its chunks"""
+
+    def __init__(self):
+        self.chunks = []
+        self.done = False
+        self.error = None
+        self.task = None  # the shared flight, resolving to the cached file's path
+        self._changed = asyncio.Condition()
+
+    async def _notify(self):
+        async with self._changed:
+            self._changed.notify_all()
+
+    async def add(self, chunk):
+        self.chunks.append(chunk)
+        await self._notify()
+
+    async def finish(self, error=None):
+        self.error = error
+        self.done = True
+        await self._notify()
+
+    async def follow(self):
+        """Yield every chunk from the first one on, as they arrive"""
+        sent = 0
+        while True:
+            async with self._changed:
+                await self._changed.wait_for(lambda: sent < len(self.chunks) or self.done)
+            while sent < len(self.chunks):
+                yield self.chunks[sent]
+                sent += 1
+            if self.done:
+                if self.error is not None:
+                    raise self.error
+                return
+
+
+# (loop, audio key) -> _Download; touched only from that loop
+_downloads = {}
+
+
+async def _fetch(cache, key, text, voice, model, download):
+    """Synthesize into the cache, publishing chunks to download; returns the file's path"""
+    temp_path = cache.temp_path(key)
+    try:
+        # The limiter bounds concurrent syntheses and retries opening the stream
+        client = get_async_tts_client()
+        response = await get_limiter("elevenlabs", model).acall(
+            lambda: _open_stream(client, text, voice, model), prompt_tokens=len(text)
+        )
+        f = await asyncio.to_thread(open, temp_path, "wb")
+        try:
+            async for chunk in response.aiter_bytes():
+                await download.add(chunk)
+                await asyncio.to_thread(f.write, chunk)
+        finally:
+            await asyncio.to_thread(f.close)
+            await response.aclose()
+        path = await asyncio.to_thread(cache.commit, key, temp_path)
+    except BaseException as e:
+        # The stream broke (or the process is shutting down); never cache partial audio
+        try:
+            await asyncio.to_thread(os.remove, temp_path)
+        except FileNotFoundError:
+            pass
+        await download.finish(e)
+        raise
+    await download.finish()
+    return path
+
+
+def _download(cache, key, text, voice, model):
+    """The synthesis of key in progress on this loop, starting one if there is none"""
+    slot = (asyncio.get_running_loop(), key)
+    download = _downloads.get(slot)
+    if download is None:
+        download = _downloads[slot] = _Download()
+        download.task = asyncio.ensure_future(get_flight_group("elevenlabs").ado(
+            key, lambda: _fetch(cache, key, text, voice, model, download)))
+        download.task.add_done_callback(lambda task: _finished(slot, task))
+    return download
+
+
+def _finished(slot, task):
+    _downloads.pop(slot, None)
+    if not task.cancelled():
+        # Followers get the error; retrieving it keeps asyncio from logging it again
+        task.exception()
+
+
+async def astream_voice(text, voice=TTS_VOICE, model=TTS_MODEL):
+    """Yield mp3 chunks for text, from the cache or from ElevenLabs as they arrive"""
+    cache = get_audio_cache()
+    key = audio_key(text, voice, model)
+    cached = await _open_cached(cache, key)
+    tracing.current().event("tts_cache_hit" if cached else "tts_cache_miss")
+    if cached is not None:
+        async for chunk in _read_file(cached):
+            yield chunk
+        return
+    if not ELEVENLABS_API_KEY:
+        raise RuntimeError("ELEVENLABS_API_KEY is not set")
+    async for chunk in _download(cache, key, text, voice, model).follow():
+        yield chunk
+
+
+async def asynthesize(text, voice=TTS_VOICE, model=TTS_MODEL):
+    """Path of the cached mp3 for text, synthesizing it first if needed"""
+    cache = get_audio_cache()
+    key = audio_key(text, voice, model)
+    path = await asyncio.to_thread(cache.lookup, key)
+    if path is None:
+        if not ELEVENLABS_API_KEY:
+            raise RuntimeError("ELEVENLABS_API_KEY is not set")
+        path = await asyncio.shield(_download(cache, key, text, voice, model).task)
+    return path
+
+
+def generate_voice(text, voice=TTS_VOICE):
+    """Synthesize text and return the path of its (cached) mp3 file"""
+    return runtime.run(asynthesize(text, voice))
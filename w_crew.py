@@ -1,37 +1,129 @@
 print("Starting w_crew.py imports")
 from typing import Dict, TypedDict
-from langgraph.graph import Graph, END
-from huggingface_hub import InferenceClient
 from dotenv import load_dotenv
+import asyncio
 import os
+import re
+import threading
+import time
+import weakref
+from llm_cache import get_response_cache, make_key
+from rate_limit import estimate_tokens, get_limiter
+from router import get_router, register_provider
+from singleflight import get_flight_group
+import tracing
 
 # Load environment variables
 load_dotenv()
 
 # Set up HuggingFace client
 hf_token = os.getenv('HUGGINGFACE_API_KEY')
-client = InferenceClient(
-    model="mistralai/Mistral-7B-Instruct-v0.1",  # Changed model
-    token=hf_token
-)
-
-# Define preferred models in order of preference
-MODELS = [
-    "google/flan-t5-large",  # Your original model
-    "google/flan-t5-base",   # Fallback option
-    "facebook/bart-large-cnn" # Second fallback
-]
+HF_MODEL = "mistralai/Mistral-7B-Instruct-v0.1"  # Changed model
+HF_MAX_NEW_TOKENS = 150
+HF_TEMPERATURE = 0.7
+# Optional dedicated inference endpoint (or local stub) instead of the hosted model
+HF_INFERENCE_URL = os.getenv('HF_INFERENCE_URL')
+
+# The inference client and the compiled graph are built on first use so
+# importing this module does not pay for huggingface_hub/langgraph start-up.
+_client = None
+_whatsapp_crew = None
+_lazy_lock = threading.Lock()
+# Async clients are bound to the event loop that created them
+_async_clients = weakref.WeakKeyDictionary()
+
+def get_client():
+    global _client
+    if _client is None:
+        with _lazy_lock:
+            if _client is None:
+                from huggingface_hub import InferenceClient
+                _client = InferenceClient(
+                    model=HF_INFERENCE_URL or HF_MODEL,
+                    token=hf_token
+                )
+    return _client
+
+def get_async_client():
+    """Return the async HF client for the running loop"""
+    loop = asyncio.get_running_loop()
+    client = _async_clients.get(loop)
+    if client is None:
+        from huggingface_hub import AsyncInferenceClient
+        client = AsyncInferenceClient(model=HF_INFERENCE_URL or HF_MODEL, token=hf_token)
+        _async_clients[loop] = client
+    return client
+
+def _cache_lookup(prompt, model=HF_MODEL, max_tokens=HF_MAX_NEW_TOKENS):
+    cache = get_response_cache()
+    if cache is None:
+        return None
+    return cache.lookup(prompt, model, max_tokens, HF_TEMPERATURE)
+
+def _cache_store(prompt, text, model=HF_MODEL, max_tokens=HF_MAX_NEW_TOKENS):
+    cache = get_response_cache()
+    if cache is not None:
+        cache.store(prompt, model, max_tokens, HF_TEMPERATURE, text)
 
 def generate_text(prompt, max_retries=2):
-    try:
-        response = client.text_generation(
-            prompt,
-            max_new_tokens=150,
-            temperature=0.7
+    cached = _cache_lookup(prompt)
+    if cached is not None:
+        return cached
+    def call():
+        response = get_limiter("hf", HF_MODEL).call(
+            lambda: get_client().text_generation(
+                prompt,
+                max_new_tokens=HF_MAX_NEW_TOKENS,
+                temperature=HF_TEMPERATURE
+            ),
+            prompt_tokens=estimate_tokens(prompt), max_tokens=HF_MAX_NEW_TOKENS, max_retries=max_retries
         )
         return str(response)
+    try:
+        # Identical prompts already in flight share that call
+        text = get_flight_group("hf").do(make_key(prompt, HF_MODEL, HF_MAX_NEW_TOKENS, HF_TEMPERATURE), call)
     except Exception as e:
         print(f"Error generating text: {e}")
+        tracing.fallback(f"hf_{type(e).__name__}")
+        return "I couldn't process that request at the moment."
+    _cache_store(prompt, text)
+    return text
+
+async def acomplete_hf(prompt, model=HF_MODEL, max_tokens=HF_MAX_NEW_TOKENS, max_retries=2):
+    """Cached, coalesced, rate-limited async HF completion; raises instead of falling back"""
+    cached = _cache_lookup(prompt, model, max_tokens)
+    if cached is not None:
+        return cached
+    client = get_async_client()
+    async def call():
+        response = await get_limiter("hf", model).acall(
+            lambda: client.text_generation(
+                prompt,
+                max_new_tokens=max_tokens,
+                temperature=HF_TEMPERATURE,
+                # The client is bound to HF_MODEL (or HF_INFERENCE_URL); other models are per call
+                model=None if model == HF_MODEL else model,
+            ),
+            prompt_tokens=estimate_tokens(prompt), max_tokens=max_tokens, max_retries=max_retries
+        )
+        text = str(response)
+        _cache_store(prompt, text, model, max_tokens)
+        return text
+    return await get_flight_group("hf").ado(make_key(prompt, model, max_tokens, HF_TEMPERATURE), call)
+
+register_provider("hf", acomplete_hf)
+
+async def agenerate_text(prompt):
+    """Async variant of generate_text, routed (and hedged) across the "chat" route's backends.
+
+    Defaults to HF Mistral only; set ROUTER_CHAT_BACKENDS, e.g.
+    "hf:mistralai/Mistral-7B-Instruct-v0.1,groq:llama3-8b-8192", to hedge to another provider.
+    """
+    try:
+        return await get_router("chat", f"hf:{HF_MODEL}").complete(prompt, HF_MAX_NEW_TOKENS)
+    except Exception as e:
+        print(f"Error generating text: {e}")
+        tracing.fallback(f"hf_{type(e).__name__}")
         return "I couldn't process that request at the moment."
 
 print("HuggingFace model configured")
@@ -39,12 +131,56 @@ print("HuggingFace model configured")
 # Define state type
 class AgentState(TypedDict):
     message: str
+    context: str  # summary and recent turns of the conversation, may be empty
     processed_message: str
     wiki_info: str
     final_response: str
+    timings: Dict[str, float]  # seconds spent per node
+    llm_calls: int
+
+NO_WIKI_INFO = "no bio needed"
+
+# Cheap local gate for the wiki step: only messages that mention something
+# that looks like a proper noun ("tell me about Marie Curie") need a bio.
+_SENTENCE_RE = re.compile(r"[^.!?\n]+")
+_WORD_RE = re.compile(r"[A-Za-z][\w'-]*")
+_DAYS = ["Monday", "Tuesday", "Wednesday", "Thursday", "Friday", "Saturday", "Sunday"]
+_MONTHS = ["January", "February", "March", "April", "May", "June", "July", "August",
+           "September", "October", "November", "December"]
+_NOT_ENTITIES = {"I", "I'm", "I've", "I'll", "I'd", "Hi", "Hello", "Hey", "Thanks", "Thank",
+                 "Please", "OK", "Ok", "WhatsApp"} | set(_DAYS) | {d + "s" for d in _DAYS} | set(_MONTHS)
+
+def needs_wiki(message):
+    """True if the message seems to contain a named entity worth looking up"""
+    for sentence in _SENTENCE_RE.findall(message):
+        words = _WORD_RE.findall(sentence)
+        for i, word in enumerate(words):
+            if not word[0].isupper() or word in _NOT_ENTITIES:
+                continue
+            # The first word of a sentence is capitalised anyway, so it only
+            # counts when followed by another capitalised word ("Elon Musk ...")
+            if i > 0 or (len(words) > 1 and words[1][0].isupper() and words[1] not in _NOT_ENTITIES):
+                return True
+    return False
+
+def _record(state, node, start, llm_calls=0):
+    state.setdefault('timings', {})[node] = round(time.perf_counter() - start, 4)
+    state['llm_calls'] = state.get('llm_calls', 0) + llm_calls
+
+def _wiki_prompt(state):
+    # Built from the raw message so it does not have to wait for process_message
+    return f"If this contains a famous name, provide a brief bio, otherwise say 'no bio needed': {state['message']}"
+
+def _format_prompt(state):
+    context = f"Message: {state['processed_message']}\nWiki info: {state['wiki_info']}"
+    if state.get('context'):
+        context = f"Conversation: {state['context']}\n{context}"
+    return f"Generate a friendly response using this context: {context}"
 
 # Define processing nodes
+@tracing.traced("node.process_message", tracing.NODE_SECONDS, "process_message")
 def process_message(state: AgentState) -> AgentState:
+    start = time.perf_counter()
     try:
         prompt = f"Extract key meaning from: {state['message']}"
         response = generate_text(prompt)
@@ -52,46 +188,120 @@ def process_message(state: AgentState) -> AgentState:
     except Exception as e:
         print(f"Error in process_message: {e}")
         state['processed_message'] = "Extracted content from user message."
+    _record(state, 'process_message', start, llm_calls=1)
     return state
 
+@tracing.traced("node.get_wiki_info", tracing.NODE_SECONDS, "get_wiki_info")
 def get_wiki_info(state: AgentState) -> AgentState:
+    start = time.perf_counter()
     try:
-        prompt = f"If this contains a famous name, provide a brief bio, otherwise say 'no bio needed': {state['processed_message']}"
-        response = generate_text(prompt)
+        response = generate_text(_wiki_prompt(state))
         state['wiki_info'] = response
     except Exception as e:
         print(f"Error in get_wiki_info: {e}")
         state['wiki_info'] = "No additional information needed."
+    _record(state, 'get_wiki_info', start, llm_calls=1)
     return state
 
+@tracing.traced("node.format_response", tracing.NODE_SECONDS, "format_response")
 def format_response(state: AgentState) -> AgentState:
+    start = time.perf_counter()
     try:
-        context = f"Message: {state['processed_message']}\nWiki info: {state['wiki_info']}"
-        prompt = f"Generate a friendly response using this context: {context}"
-        response = generate_text(prompt)
+        response = generate_text(_format_prompt(state))
         state['final_response'] = response
     except Exception as e:
         print(f"Error in format_response: {e}")
         state['final_response'] = "Thanks for your message! I've processed your request."
+    _record(state, 'format_response', start, llm_calls=1)
     return state
 
-# Create workflow graph
-workflow = Graph()
+@tracing.traced("node.gather_context", tracing.NODE_SECONDS, "gather_context")
+def gather_context(state: AgentState) -> AgentState:
+    """Run process_message and, only when needed, get_wiki_info"""
+    start = time.perf_counter()
+    process_message(state)
+    if needs_wiki(state['message']):
+        get_wiki_info(state)
+    else:
+        state['wiki_info'] = NO_WIKI_INFO
+    _record(state, 'gather_context', start)
+    return state
+
+# Async node implementations used by ainvoke
+@tracing.traced("node.process_message", tracing.NODE_SECONDS, "process_message")
+async def aprocess_message(state: AgentState) -> AgentState:
+    start = time.perf_counter()
+    try:
+        prompt = f"Extract key meaning from: {state['message']}"
+        state['processed_message'] = await agenerate_text(prompt)
+    except Exception as e:
+        print(f"Error in process_message: {e}")
+        state['processed_message'] = "Extracted content from user message."
+    _record(state, 'process_message', start, llm_calls=1)
+    return state
+
+@tracing.traced("node.get_wiki_info", tracing.NODE_SECONDS, "get_wiki_info")
+async def aget_wiki_info(state: AgentState) -> AgentState:
+    start = time.perf_counter()
+    try:
+        state['wiki_info'] = await agenerate_text(_wiki_prompt(state))
+    except Exception as e:
+        print(f"Error in get_wiki_info: {e}")
+        state['wiki_info'] = "No additional information needed."
+    _record(state, 'get_wiki_info', start, llm_calls=1)
+    return state
+
+@tracing.traced("node.format_response", tracing.NODE_SECONDS, "format_response")
+async def aformat_response(state: AgentState) -> AgentState:
+    start = time.perf_counter()
+    try:
+        state['final_response'] = await agenerate_text(_format_prompt(state))
+    except Exception as e:
+        print(f"Error in format_response: {e}")
+        state['final_response'] = "Thanks for your message! I've processed your request."
+    _record(state, 'format_response', start, llm_calls=1)
+    return state
+
+@tracing.traced("node.gather_context", tracing.NODE_SECONDS, "gather_context")
+async def agather_context(state: AgentState) -> AgentState:
+    """process_message and get_wiki_info are independent, so run them concurrently"""
+    start = time.perf_counter()
+    if needs_wiki(state['message']):
+        await asyncio.gather(aprocess_message(state), aget_wiki_info(state))
+    else:
+        state['wiki_info'] = NO_WIKI_INFO
+        await aprocess_message(state)
+    _record(state, 'gather_context', start)
+    return state
+
+def build_workflow():
+    from langchain_core.runnables import RunnableLambda
+    from langgraph.graph import Graph, END
+
+    # Create workflow graph
+    workflow = Graph()
+
+    # Add nodes (sync versions for invoke, async versions for ainvoke)
+    workflow.add_node("gather_context", RunnableLambda(gather_context, afunc=agather_context))
+    workflow.add_node("format_response", RunnableLambda(format_response, afunc=aformat_response))
 
-# Add nodes
-workflow.add_node("process_message", process_message)
-workflow.add_node("get_wiki_info", get_wiki_info)
-workflow.add_node("format_response", format_response)
+    # Define edges
+    workflow.add_edge("gather_context", "format_response")
+    workflow.add_edge("format_response", END)
 
-# Define edges
-workflow.add_edge("process_message", "get_wiki_info")
-workflow.add_edge("get_wiki_info", "format_response")
-workflow.add_edge("format_response", END)
+    # Set entry point
+    workflow.set_entry_point("gather_context")
 
-# Set entry point
-workflow.set_entry_point("process_message")
+    # Compile graph
+    return workflow.compile()
 
-# Compile graph
-whatsapp_crew = workflow.compile()
+def get_whatsapp_crew():
+    """Return the compiled LangGraph workflow, compiling it once"""
+    global _whatsapp_crew
+    if _whatsapp_crew is None:
+        with _lazy_lock:
+            if _whatsapp_crew is None:
+                _whatsapp_crew = build_workflow()
+    return _whatsapp_crew
 
 print("w_crew.py fully loaded")
\ No newline at end of file
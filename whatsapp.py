@@ -0,0 +1,459 @@
+# whatsapp.py
+"""WhatsApp Cloud API webhook ingestion and batched outbound replies.
+
+Inbound: ``POST /webhook/whatsapp`` parses the Cloud API payload and records
+each text message in a sqlite inbox keyed by the provider's message id, then
+acknowledges straight away. The insert (INSERT OR IGNORE) is also the
+idempotency check: a retried delivery of a message already in the inbox is
+acknowledged and dropped. New messages go onto an in-memory queue that
+WHATSAPP_WORKERS tasks on the shared event loop work off by running the chat
+graph with the sender's conversation as context. Messages from one sender are
+handled one at a time and in order, so replies and conversation turns never
+interleave. When WHATSAPP_QUEUE_SIZE messages are already waiting the webhook
+answers 503 and the provider redelivers later.
+
+Outbound: replies are queued for the sender task, which flushes them in
+batches (up to WHATSAPP_SEND_BATCH, collected for WHATSAPP_SEND_WAIT_MS) over
+one pooled HTTP client through the "whatsapp" provider limiter (messages per
+minute, adaptive concurrency, retries honouring Retry-After). The Cloud API
+takes one request per message, so a batch is sent concurrently across
+senders and its inbox rows are updated in a single write. One sender's
+replies go out one after another, also across batches, so they arrive in
+the order the messages were handled. A reply that still fails once the
+limiter's retries are used up (or on a non-retryable error) is dropped: its
+inbox row is marked "failed" with the reply kept, and it is not resent.
+
+Messages still pending when their process stopped are claimed and re-queued
+by the next process to start using the inbox. Point WHATSAPP_API_URL at the
+local stub (benchmarks/stub_llm.py) to run without the API.
+"""
+import asyncio
+import hashlib
+import hmac
+import os
+import sqlite3
+import threading
+import time
+import weakref
+from collections import deque, namedtuple
+
+from dotenv import load_dotenv
+
+import scheduler
+import tracing
+from conversations import context_text, get_conversation_store
+from rate_limit import get_limiter
+from runtime import runtime
+from workflow import process_message_node
+
+load_dotenv()
+
+WHATSAPP_TOKEN = os.getenv("WHATSAPP_TOKEN")
+WHATSAPP_PHONE_NUMBER_ID = os.getenv("WHATSAPP_PHONE_NUMBER_ID", "")
+WHATSAPP_API_URL = os.getenv("WHATSAPP_API_URL", "https://graph.facebook.com/v19.0")
+# Echoed back by the GET verification handshake when it matches
+WHATSAPP_VERIFY_TOKEN = os.getenv("WHATSAPP_VERIFY_TOKEN")
+# POSTs must carry a valid X-Hub-Signature-256 for this app secret
+WHATSAPP_APP_SECRET = os.getenv("WHATSAPP_APP_SECRET")
+# Accept unsigned POSTs when no secret is set; for local development and benchmarks only
+WHATSAPP_INSECURE_WEBHOOK = os.getenv("WHATSAPP_INSECURE_WEBHOOK", "0") == "1"
+WHATSAPP_DB_PATH = os.getenv("WHATSAPP_DB_PATH", "whatsapp.sqlite3")
+WHATSAPP_WORKERS = int(os.getenv("WHATSAPP_WORKERS", "32"))
+WHATSAPP_QUEUE_SIZE = int(os.getenv("WHATSAPP_QUEUE_SIZE", "10000"))
+WHATSAPP_SEND_BATCH = int(os.getenv("WHATSAPP_SEND_BATCH", "50"))
+WHATSAPP_SEND_WAIT_MS = float(os.getenv("WHATSAPP_SEND_WAIT_MS", "10"))
+WHATSAPP_TIMEOUT = float(os.getenv("WHATSAPP_TIMEOUT", "15"))
+# Handled messages are remembered this long; the Cloud API retries for up to 7 days
+WHATSAPP_INBOX_TTL = float(os.getenv("WHATSAPP_INBOX_TTL", str(7 * 24 * 3600)))
+
+FALLBACK_REPLY = "Thanks for your message! We'll get back to you shortly."
+# Longest text body the Cloud API accepts
+MAX_BODY_CHARS = 4096
+
+Message = namedtuple("Message", "id sender text")
+
+
+def verify_signature(body, header):
+    """Check X-Hub-Signature-256 against WHATSAPP_APP_SECRET.
+
+    Without a secret every POST is rejected, unless WHATSAPP_INSECURE_WEBHOOK=1.
+    """
+    if not WHATSAPP_APP_SECRET:
+        return WHATSAPP_INSECURE_WEBHOOK
+    if not header or not header.startswith("sha256="):
+        return False
+    expected = hmac.new(WHATSAPP_APP_SECRET.encode("utf-8"), body, hashlib.sha256).hexdigest()
+    return hmac.compare_digest(expected, header[len("sha256="):])
+
+
+def parse_messages(payload):
+    """Split a webhook payload into (text messages, count of other events such as statuses)"""
+    messages, ignored = [], 0
+    for entry in payload.get("entry") or []:
+        for change in entry.get("changes") or []:
+            value = change.get("value") or {}
+            ignored += len(value.get("statuses") or [])
+            for message in value.get("messages") or []:
+                body = (message.get("text") or {}).get("body")
+                if message.get("type") == "text" and message.get("id") and message.get("from") and body:
+                    messages.append(Message(message["id"], message["from"], body))
+                else:
+                    ignored += 1
+    return messages, ignored
+
+
+class Inbox:
+    """sqlite record of received messages: idempotency keys and the durable work queue"""
+
+    def __init__(self, path=WHATSAPP_DB_PATH):
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        # Survives the process crashing, which is what redelivery protects against
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.executescript(
+            "CREATE TABLE IF NOT EXISTS inbox ("
+            " id TEXT PRIMARY KEY, sender TEXT NOT NULL, text TEXT NOT NULL, received REAL NOT NULL,"
+            " status TEXT NOT NULL DEFAULT 'pending', reply TEXT, finished REAL, owner INTEGER);"
+            "CREATE INDEX IF NOT EXISTS inbox_status ON inbox (status, received);"
+        )
+        self._conn.commit()
+
+    def add(self, messages):
+        """Record messages; returns the ones not seen before"""
+        now = time.time()
+        new = []
+        with self._lock:
+            for message in messages:
+                cursor = self._conn.execute(
+                    "INSERT OR IGNORE INTO inbox (id, sender, text, received, owner) VALUES (?, ?, ?, ?, ?)",
+                    (message.id, message.sender, message.text, now, os.getpid()),
+                )
+                if cursor.rowcount:
+                    new.append(message)
+            self._conn.commit()
+        return new
+
+    def claim_pending(self):
+        """Take over pending messages of processes that are gone and return this process's"""
+        pid = os.getpid()
+        with self._lock:
+            owners = [row[0] for row in self._conn.execute(
+                "SELECT DISTINCT owner FROM inbox WHERE status = 'pending'"
+            )]
+            # Other server workers sharing the file keep theirs
+            orphaned = [owner for owner in owners if owner != pid and not _alive(owner)]
+            self._conn.executemany(
+                "UPDATE inbox SET owner = ? WHERE status = 'pending' AND owner IS ?",
+                [(pid, owner) for owner in orphaned],
+            )
+            self._conn.commit()
+            rows = self._conn.execute(
+                "SELECT id, sender, text FROM inbox WHERE status = 'pending' AND owner = ? ORDER BY received",
+                (pid,),
+            ).fetchall()
+        return [Message(*row) for row in rows]
+
+    def finish(self, results):
+        """Record (message id, status, reply) for a batch of handled messages"""
+        now = time.time()
+        with self._lock:
+            self._conn.executemany(
+                "UPDATE inbox SET status = ?, reply = ?, finished = ? WHERE id = ?",
+                [(status, reply, now, message_id) for message_id, status, reply in results],
+            )
+            self._conn.commit()
+
+    def prune(self, ttl=WHATSAPP_INBOX_TTL):
+        with self._lock:
+            deleted = self._conn.execute(
+                "DELETE FROM inbox WHERE status != 'pending' AND received < ?", (time.time() - ttl,)
+            ).rowcount
+            self._conn.commit()
+        return deleted
+
+    def counts(self):
+        with self._lock:
+            return dict(self._conn.execute("SELECT status, COUNT(*) FROM inbox GROUP BY status").fetchall())
+
+
+def _alive(pid):
+    if pid is None:
+        return False
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
+
+
+# Async clients are bound to the event loop that created them
+_async_clients = weakref.WeakKeyDictionary()
+
+
+def get_async_whatsapp_client():
+    """Return the pooled async HTTP client for the running loop"""
+    loop = asyncio.get_running_loop()
+    client = _async_clients.get(loop)
+    if client is None:
+        import httpx
+        client = httpx.AsyncClient(
+            base_url=WHATSAPP_API_URL,
+            headers={"Authorization": f"Bearer {WHATSAPP_TOKEN or ''}"},
+            limits=httpx.Limits(max_connections=64, max_keepalive_connections=64, keepalive_expiry=60),
+            timeout=WHATSAPP_TIMEOUT,
+        )
+        _async_clients[loop] = client
+    return client
+
+
+async def _post_message(client, message, reply):
+    response = await client.post(f"/{WHATSAPP_PHONE_NUMBER_ID}/messages", json={
+        "messaging_product": "whatsapp",
+        "recipient_type": "individual",
+        "to": message.sender,
+        "context": {"message_id": message.id},
+        "type": "text",
+        "text": {"body": reply[:MAX_BODY_CHARS]},
+    })
+    response.raise_for_status()
+    return response
+
+
+class WhatsAppGateway:
+    """Queue from the webhook to the chat graph and on to the batched sender"""
+
+    def __init__(self, inbox, workers=WHATSAPP_WORKERS, queue_size=WHATSAPP_QUEUE_SIZE,
+                 batch_size=WHATSAPP_SEND_BATCH, batch_wait=WHATSAPP_SEND_WAIT_MS / 1000.0):
+        self.inbox = inbox
+        self.workers = workers
+        self.queue_size = queue_size
+        self.batch_size = batch_size
+        self.batch_wait = batch_wait
+        # Created on the runtime loop by start(): before Python 3.10 asyncio
+        # queues bind to the current loop when constructed
+        self._queue = None
+        self._outbox = None
+        # sender -> messages waiting behind the one being handled (event loop thread only)
+        self._senders = {}
+        # Batches being delivered, kept until done so shutdown can wait for them (event loop thread only)
+        self._sending = set()
+        # sender -> future resolved once that sender's latest replies are delivered (event loop thread only)
+        self._delivering = {}
+        self._lock = threading.Lock()
+        self._started = False
+        self._last_prune = time.monotonic()
+        self.in_flight = 0  # accepted but not yet sent
+        self.stats = {"received": 0, "duplicates": 0, "ignored": 0, "rejected": 0,
+                      "handled": 0, "crew_errors": 0, "sent": 0, "send_failed": 0, "batches": 0}
+
+    def _count(self, key, amount=1):
+        with self._lock:
+            self.stats[key] += amount
+
+    def start(self):
+        with self._lock:
+            if self._started:
+                return
+            # Under the lock, so no _dispatch is scheduled before the queues exist
+            runtime.run(self._open())
+            self._started = True
+        for _ in range(self.workers):
+            runtime.submit(self._worker(), daemon=True)
+        runtime.submit(self._sender(), daemon=True)
+
+    async def _open(self):
+        self._queue = asyncio.Queue()
+        self._outbox = asyncio.Queue()
+
+    def resume(self):
+        """Re-queue messages accepted before a restart but never answered"""
+        pending = self.inbox.claim_pending()
+        if pending:
+            with self._lock:
+                self.in_flight += len(pending)
+            self._enqueue(pending)
+        return len(pending)
+
+    def receive(self, payload):
+        """Record a webhook payload's new messages and queue them; None when the queue is full"""
+        messages, ignored = parse_messages(payload)
+        with self._lock:
+            if self.in_flight + len(messages) > self.queue_size:
+                self.stats["rejected"] += len(messages)
+                return None
+            new = self.inbox.add(messages) if messages else []
+            self.in_flight += len(new)
+            self.stats["received"] += len(new)
+            self.stats["duplicates"] += len(messages) - len(new)
+            self.stats["ignored"] += ignored
+        if new:
+            self._enqueue(new)
+        return {"accepted": len(new), "duplicates": len(messages) - len(new), "ignored": ignored}
+
+    def _enqueue(self, messages):
+        self.start()
+        runtime.loop.call_soon_threadsafe(self._dispatch, messages)
+
+    def _dispatch(self, messages):
+        for message in messages:
+            backlog = self._senders.get(message.sender)
+            if backlog is not None:
+                backlog.append(message)
+            else:
+                self._senders[message.sender] = deque()
+                self._queue.put_nowait(message)
+
+    async def _worker(self):
+        # Started from whichever request came first; each message gets its own trace instead
+        tracing.detach()
+        while True:
+            message = await self._queue.get()
+            # Keep this sender's later messages on this worker so they stay in order
+            while message is not None:
+                try:
+                    reply = await self._handle(message)
+                except Exception as e:
+                    # e.g. the conversation store failing; the sender still gets an answer
+                    print(f"WhatsApp message {message.id} failed: {e}")
+                    reply = FALLBACK_REPLY
+                await self._outbox.put((message, reply))
+                backlog = self._senders[message.sender]
+                if backlog:
+                    message = backlog.popleft()
+                else:
+                    del self._senders[message.sender]
+                    message = None
+
+    async def _handle(self, message):
+        trace, token = tracing.start_trace("whatsapp.message")
+        if trace is not None:
+            trace.root.set(message_id=message.id)
+        # A chat reply, but the message is already acknowledged and durable, so it
+        # has no client deadline; the business number is the tenant
+        schedule_token = scheduler.classify("interactive", WHATSAPP_PHONE_NUMBER_ID or None, timeout=0)
+        try:
+            store = get_conversation_store()
+            # sqlite loads and spills stay off the shared loop
+            conversation = await asyncio.to_thread(store.get, f"wa:{message.sender}")
+            try:
+                reply = await process_message_node(message.text, context_text(conversation))
+            except Exception as e:
+                print(f"WhatsApp message {message.id} failed: {e}")
+                self._count("crew_errors")
+                tracing.fallback("whatsapp_crew")
+                reply = FALLBACK_REPLY
+            await asyncio.to_thread(store.add_turn, conversation, message.text, reply)
+            self._count("handled")
+            return reply
+        finally:
+            scheduler.reset(schedule_token)
+            if trace is not None:
+                trace.root.finish()
+            tracing.end_trace(token)
+
+    async def _sender(self):
+        tracing.detach()
+        while True:
+            batch = [await self._outbox.get()]
+            if self.batch_wait:
+                await asyncio.sleep(self.batch_wait)
+            while len(batch) < self.batch_size and not self._outbox.empty():
+                batch.append(self._outbox.get_nowait())
+            # Collecting the next batch does not wait for this one to be delivered
+            task = asyncio.ensure_future(self._send_batch(batch))
+            self._sending.add(task)
+            task.add_done_callback(self._sent)
+
+    def _sent(self, task):
+        self._sending.discard(task)
+        if not task.cancelled() and task.exception() is not None:
+            print(f"WhatsApp send batch failed: {task.exception()}")
+
+    def drain(self, timeout):
+        """Wait up to timeout seconds for the batches being sent; called before the runtime shuts down"""
+        if self._started:
+            runtime.run(self._drain(timeout), timeout=timeout + 1)
+
+    async def _drain(self, timeout):
+        if self._sending:
+            done, pending = await asyncio.wait(set(self._sending), timeout=timeout)
+            if pending:
+                print(f"WhatsApp shutdown: {len(pending)} send batch(es) still running after {timeout}s")
+
+    async def _send_batch(self, batch):
+        by_sender = {}
+        for message, reply in batch:
+            by_sender.setdefault(message.sender, []).append((message, reply))
+        groups = await asyncio.gather(*(self._send_in_order(sender, replies)
+                                        for sender, replies in by_sender.items()))
+        results = [result for group in groups for result in group]
+        sent = sum(1 for _, status, _ in results if status == "sent")
+        await asyncio.to_thread(self.inbox.finish, results)
+        with self._lock:
+            self.in_flight -= len(batch)
+            self.stats["batches"] += 1
+            self.stats["sent"] += sent
+            self.stats["send_failed"] += len(batch) - sent
+        if time.monotonic() - self._last_prune > 3600:
+            self._last_prune = time.monotonic()
+            await asyncio.to_thread(self.inbox.prune)
+
+    async def _send_in_order(self, sender, replies):
+        """Send one sender's replies in turn, after that sender's replies from earlier batches"""
+        previous = self._delivering.get(sender)
+        delivered = asyncio.get_running_loop().create_future()
+        self._delivering[sender] = delivered
+        try:
+            if previous is not None:
+                # Shielded: cancelling this batch must not cancel the earlier one's future
+                await asyncio.shield(previous)
+            return [await self._send(message, reply) for message, reply in replies]
+        finally:
+            if not delivered.done():
+                delivered.set_result(None)
+            if self._delivering.get(sender) is delivered:
+                del self._delivering[sender]
+
+    async def _send(self, message, reply):
+        client = get_async_whatsapp_client()
+        try:
+            await get_limiter("whatsapp", WHATSAPP_PHONE_NUMBER_ID).acall(
+                lambda: _post_message(client, message, reply)
+            )
+            return message.id, "sent", reply
+        except Exception as e:
+            print(f"WhatsApp send to {message.sender} failed: {e}")
+            return message.id, "failed", reply
+
+    def info(self):
+        with self._lock:
+            info = dict(self.stats, in_flight=self.in_flight, workers=self.workers)
+        info["inbox"] = self.inbox.counts()
+        return info
+
+
+_gateway = None
+_gateway_lock = threading.Lock()
+
+
+def get_whatsapp_gateway():
+    """Return the process-wide gateway, re-queuing unanswered messages on first use"""
+    global _gateway
+    if _gateway is None:
+        with _gateway_lock:
+            if _gateway is None:
+                gateway = WhatsAppGateway(Inbox())
+                resumed = gateway.resume()
+                if resumed:
+                    print(f"Resumed {resumed} pending WhatsApp message(s)")
+                _gateway = gateway
+    return _gateway
+
+
+def drain_gateway(timeout):
+    """Let replies being sent by this process's gateway (if it has one) finish"""
+    if _gateway is not None:
+        _gateway.drain(timeout)
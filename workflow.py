@@ -1,16 +1,24 @@
-from w_crew import whatsapp_crew
+from w_crew import get_whatsapp_crew
 
-async def process_message_node(message: str):
-    # Initialize state with the message
-    initial_state = {
+def initial_state(message: str, context: str = ""):
+    # Initialize state with the message and any conversation context (see conversations.py)
+    return {
         "message": message,
+        "context": context,
         "processed_message": "",
         "wiki_info": "",
-        "final_response": ""
+        "final_response": "",
+        "timings": {},
+        "llm_calls": 0
     }
-    
+
+async def run_crew(message: str, context: str = ""):
+    """Run the workflow and return the whole final state (including timings)"""
+    return await get_whatsapp_crew().ainvoke(initial_state(message, context))
+
+async def process_message_node(message: str, context: str = ""):
     # Run the workflow and await the result
-    final_state = await whatsapp_crew.ainvoke(initial_state)
+    final_state = await run_crew(message, context)
     
     # Return just the string response
     return final_state["final_response"]
@@ -0,0 +1,42 @@
+# wsgi.py
+"""WSGI entry point for production servers, e.g. ``gunicorn -c gunicorn.conf.py``.
+
+With PRELOAD_MODELS=1 the local fallback model (and torch/transformers) and
+the compiled chat graph are loaded here, in the server's master process
+before it forks (gunicorn ``preload_app``), so every worker shares those
+pages copy-on-write instead of loading its own copy. Nothing that owns a
+thread, socket or sqlite connection is created here: the event loop,
+HTTP clients and stores all start lazily inside each worker.
+"""
+import gc
+import os
+import time
+
+from app import app
+
+PRELOAD_MODELS = os.getenv("PRELOAD_MODELS", "1") == "1"
+
+
+def preload():
+    import marketing_helper
+    import w_crew
+
+    start = time.perf_counter()
+    steps = [("whatsapp_crew", w_crew.get_whatsapp_crew),
+             ("local_generator", lambda: marketing_helper.get_local_batcher().load())]
+    for name, load in steps:
+        try:
+            load()
+        except Exception as e:
+            # Workers fall back to loading it themselves on first use
+            print(f"Preload of {name} failed: {e}")
+    print(f"Preloaded shared models in {time.perf_counter() - start:.1f}s")
+
+
+if PRELOAD_MODELS:
+    preload()
+    # Move everything allocated so far out of the collector's reach, so
+    # collections in the workers do not write to (and un-share) these pages
+    gc.freeze()
+
+application = app
@@ -1,5 +1,255 @@
-from pytube import YouTube
+# youtube.py
+"""YouTube video lookup for marketing messages.
+
+A query (usually a product category) is resolved to video metadata and a
+progressive mp4 stream URL by a resolver running on a small thread pool
+(pytube is blocking), with a timeout per lookup. Results are kept in a TTL
+cache; failures, timeouts and queries without a playable video are cached
+too, for a shorter time, so a broken query is not looked up on every
+request. Identical lookups in flight share one resolver call
+(singleflight.py).
+
+lookup() never blocks: on a miss it returns None and resolves the query in
+the background, so attaching a video to a response costs a dictionary
+lookup. The most requested queries, plus any listed in
+YOUTUBE_PREFETCH_QUERIES, are resolved again before their entries expire.
+
+YOUTUBE_RESOLVER=stub answers from a deterministic fake instead of YouTube,
+for offline runs and benchmarks.
+"""
+import asyncio
+import hashlib
+import os
+import threading
+import time
+from collections import Counter, OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+from dotenv import load_dotenv
+
+import tracing
+from runtime import runtime
+from singleflight import get_flight_group
+
+load_dotenv()
+
+YOUTUBE_RESOLVER = os.getenv("YOUTUBE_RESOLVER", "pytube")
+YOUTUBE_WORKERS = int(os.getenv("YOUTUBE_WORKERS", "4"))
+YOUTUBE_TIMEOUT = float(os.getenv("YOUTUBE_TIMEOUT", "10"))
+# Stream URLs handed out by YouTube stop working after about six hours
+YOUTUBE_CACHE_TTL = float(os.getenv("YOUTUBE_CACHE_TTL", "3600"))
+YOUTUBE_NEGATIVE_TTL = float(os.getenv("YOUTUBE_NEGATIVE_TTL", "300"))
+YOUTUBE_CACHE_SIZE = int(os.getenv("YOUTUBE_CACHE_SIZE", "1024"))
+# Every interval the top queries by recent lookups are refreshed when due to expire
+YOUTUBE_PREFETCH_TOP = int(os.getenv("YOUTUBE_PREFETCH_TOP", "20"))
+YOUTUBE_PREFETCH_INTERVAL = float(os.getenv("YOUTUBE_PREFETCH_INTERVAL", "60"))
+# Comma-separated queries kept warm from start-up, e.g. "water bottles,yoga mats"
+YOUTUBE_PREFETCH_QUERIES = [q for q in os.getenv("YOUTUBE_PREFETCH_QUERIES", "").split(",") if q.strip()]
+# Search results tried for a playable stream; each one costs a page fetch
+YOUTUBE_SEARCH_RESULTS = 3
+
+
+class MediaNotFound(LookupError):
+    """Raised by a resolver when a query has no playable video"""
+
+
+def normalize_query(query):
+    return " ".join((query or "").lower().split())
+
+
+def pytube_resolve(query):
+    """Metadata of the first search result for query that has a progressive mp4 stream"""
+    from pytube import Search
+
+    for video in (Search(query).results or [])[:YOUTUBE_SEARCH_RESULTS]:
+        stream = video.streams.filter(progressive=True, file_extension="mp4").get_highest_resolution()
+        if stream is None:
+            continue
+        return {
+            "video_id": video.video_id,
+            "title": video.title,
+            "watch_url": video.watch_url,
+            "thumbnail_url": video.thumbnail_url,
+            "length": video.length,
+            "stream_url": stream.url,
+        }
+    raise MediaNotFound(f"no playable video for {query!r}")
+
+
+def stub_resolve(query):
+    """Deterministic fake metadata, so the app runs without network access"""
+    video_id = hashlib.sha1(query.encode("utf-8")).hexdigest()[:11]
+    return {
+        "video_id": video_id,
+        "title": f"{query.title()} - product video",
+        "watch_url": f"https://www.youtube.com/watch?v={video_id}",
+        "thumbnail_url": f"https://i.ytimg.com/vi/{video_id}/hqdefault.jpg",
+        "length": 60,
+        "stream_url": f"https://media.invalid/{video_id}.mp4",
+    }
+
+
+RESOLVERS = {"pytube": pytube_resolve, "stub": stub_resolve}
+
+
+class MediaResolver:
+    """TTL cache in front of a blocking resolver(query) -> metadata dict"""
+
+    def __init__(self, resolve, workers=YOUTUBE_WORKERS, timeout=YOUTUBE_TIMEOUT, ttl=YOUTUBE_CACHE_TTL,
+                 negative_ttl=YOUTUBE_NEGATIVE_TTL, max_entries=YOUTUBE_CACHE_SIZE,
+                 prefetch_top=YOUTUBE_PREFETCH_TOP, prefetch_interval=YOUTUBE_PREFETCH_INTERVAL,
+                 prefetch_queries=YOUTUBE_PREFETCH_QUERIES):
+        self.resolve = resolve
+        self.timeout = timeout
+        self.ttl = ttl
+        self.negative_ttl = negative_ttl
+        self.max_entries = max_entries
+        self.prefetch_top = prefetch_top
+        self.prefetch_interval = prefetch_interval
+        self.prefetch_queries = [normalize_query(q) for q in prefetch_queries]
+        # A timed-out lookup keeps its thread until pytube gives up, so the
+        # pool bounds how many can pile up
+        self._executor = ThreadPoolExecutor(workers, thread_name_prefix="youtube")
+        self._entries = OrderedDict()  # query -> (expires, media or None)
+        self._demand = Counter()  # lookups per query, halved every prefetch round
+        self._lock = threading.Lock()
+        self._flights = get_flight_group("youtube")
+        self._prefetcher = None
+        self.stats = {"hits": 0, "negative_hits": 0, "misses": 0, "resolved": 0, "not_found": 0,
+                      "errors": 0, "timeouts": 0, "prefetched": 0, "evictions": 0}
+
+    def _count(self, key, amount=1):
+        with self._lock:
+            self.stats[key] += amount
+
+    def _cached(self, query):
+        """(found, media) for a fresh entry; media is None for a cached failure"""
+        with self._lock:
+            entry = self._entries.get(query)
+            if entry is None or entry[0] <= time.monotonic():
+                return False, None
+            self._entries.move_to_end(query)
+            return True, entry[1]
+
+    def _store(self, query, media):
+        ttl = self.ttl if media is not None else self.negative_ttl
+        with self._lock:
+            self._entries[query] = (time.monotonic() + ttl, media)
+            self._entries.move_to_end(query)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.stats["evictions"] += 1
+
+    def lookup(self, query):
+        """Cached metadata for query, or None; never blocks.
+
+        On a miss the query is resolved in the background, so a later lookup
+        finds it. Also returns None for queries that recently failed.
+        """
+        query = normalize_query(query)
+        if not query:
+            return None
+        self._start_prefetcher()
+        with self._lock:
+            self._demand[query] += 1
+        found, media = self._cached(query)
+        if found:
+            self._count("hits" if media is not None else "negative_hits")
+        else:
+            self._count("misses")
+            runtime.submit(self.aresolve(query), daemon=True)
+        tracing.current().event("youtube_lookup", hit=found and media is not None)
+        return media
+
+    async def aresolve(self, query, refresh=False):
+        """Metadata for query from the cache or the resolver; None when there is no video"""
+        query = normalize_query(query)
+        if not refresh:
+            found, media = self._cached(query)
+            if found:
+                return media
+        return await self._flights.ado(query, lambda: self._fetch(query))
+
+    async def _fetch(self, query):
+        loop = asyncio.get_running_loop()
+        with tracing.span("youtube.resolve", query=query) as span:
+            try:
+                media = await asyncio.wait_for(loop.run_in_executor(self._executor, self.resolve, query),
+                                               self.timeout)
+                self._count("resolved")
+            except asyncio.TimeoutError:
+                self._count("timeouts")
+                span.set(outcome="timeout")
+                media = None
+            except MediaNotFound:
+                self._count("not_found")
+                span.set(outcome="not_found")
+                media = None
+            except Exception as e:
+                print(f"YouTube lookup for {query!r} failed: {e}")
+                self._count("errors")
+                span.set(outcome="error")
+                media = None
+        self._store(query, media)
+        return media
+
+    def _start_prefetcher(self):
+        if self._prefetcher is None and (self.prefetch_top or self.prefetch_queries):
+            with self._lock:
+                if self._prefetcher is None:
+                    self._prefetcher = runtime.submit(self._prefetch(), daemon=True)
+
+    def _due(self, query, horizon):
+        with self._lock:
+            entry = self._entries.get(query)
+        return entry is None or entry[0] <= horizon
+
+    async def _prefetch(self):
+        # Started from whichever request looked up first; refreshes belong to no request's trace
+        tracing.detach()
+        while True:
+            with self._lock:
+                popular = [query for query, _ in self._demand.most_common(self.prefetch_top)]
+                # Halving keeps the ranking about recent demand; a single lookup is
+                # remembered for a few rounds
+                self._demand = Counter({q: n / 2 for q, n in self._demand.items() if n >= 0.1})
+            # Refresh what would expire before the next round, so hits never lapse
+            horizon = time.monotonic() + self.prefetch_interval
+            due = [q for q in dict.fromkeys(self.prefetch_queries + popular) if self._due(q, horizon)]
+            if due:
+                await asyncio.gather(*(self.aresolve(q, refresh=True) for q in due))
+                self._count("prefetched", len(due))
+            await asyncio.sleep(self.prefetch_interval)
+
+    def info(self):
+        with self._lock:
+            lookups = self.stats["hits"] + self.stats["negative_hits"] + self.stats["misses"]
+            return {
+                **self.stats,
+                "hit_rate": round(self.stats["hits"] / lookups, 4) if lookups else None,
+                "entries": len(self._entries),
+                "tracked_queries": len(self._demand),
+            }
+
+
+_youtube_resolver = None
+_youtube_resolver_lock = threading.Lock()
+
+
+def get_youtube_resolver():
+    """Return the process-wide resolver selected by YOUTUBE_RESOLVER"""
+    global _youtube_resolver
+    if _youtube_resolver is None:
+        with _youtube_resolver_lock:
+            if _youtube_resolver is None:
+                if YOUTUBE_RESOLVER not in RESOLVERS:
+                    raise ValueError(f"YOUTUBE_RESOLVER must be one of {sorted(RESOLVERS)}, "
+                                     f"not {YOUTUBE_RESOLVER!r}")
+                _youtube_resolver = MediaResolver(RESOLVERS[YOUTUBE_RESOLVER])
+    return _youtube_resolver
+
 
 def get_video_url(query):
-    yt = YouTube(f"https://www.youtube.com/results?search_query={query}")
-    return yt.streams.filter(progressive=True, file_extension="mp4").first().url
\ No newline at end of file
+    """Blocking: progressive mp4 stream URL for query, or None (cached like lookup)"""
+    media = runtime.run(get_youtube_resolver().aresolve(query))
+    return media["stream_url"] if media else None